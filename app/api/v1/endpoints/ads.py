@@ -1,8 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List
-from app.db.session import get_db
+from app.config import settings
+from app.db.session import get_async_db, get_db, get_read_db
 from app.services.ads_service import AdsService
+from app.services.activity_batch import load_activity_stream
+from app.services.activity_ingest import ActivityIngestor, get_activity_ingestor
 from app.core.schemas.ads import AdCreate, AdResponse, RecommendationResponse
 from app.core.schemas.users import UserActivity
 
@@ -16,18 +20,59 @@ def create_ad(ad: AdCreate, db: Session = Depends(get_db)):
 @router.get("/recommendations/{user_id}", response_model=List[RecommendationResponse])
 def get_recommendations(
     user_id: int,
-    limit: int = 10,
+    limit: int = Query(10, ge=1, le=settings.MAX_RECOMMENDATIONS),
     db: Session = Depends(get_db)
 ):
+    # Sync on purpose: retrieval, re-ranking and catalog reloads are CPU work
+    # that would stall the event loop, so FastAPI runs this on its threadpool.
+    # Kept on the primary: preferences cached from a lagging replica would
+    # stick until the next change
     recommendations = ads_service.get_recommendations(db, user_id, limit)
     if not recommendations:
         raise HTTPException(status_code=404, detail="No recommendations found")
     return recommendations
 
-@router.post("/track-activity")
-def track_user_activity(activity: UserActivity, db: Session = Depends(get_db)):
-    return ads_service.track_activity(db, activity)
+@router.post("/track-activity", status_code=202)
+async def track_user_activity(
+    activity: UserActivity,
+    ingestor: ActivityIngestor = Depends(get_activity_ingestor)
+):
+    # Queued for the next group commit; embeddings catch up on the next training job
+    if not await ingestor.submit_async(activity.model_dump()):
+        raise HTTPException(
+            status_code=503,
+            detail="Activity queue is full, retry shortly",
+            headers={"Retry-After": "1"}
+        )
+    return {"status": "accepted"}
+
+@router.post("/track-activity/batch")
+async def track_user_activity_batch(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    ingestor: ActivityIngestor = Depends(get_activity_ingestor)
+):
+    """Record many events from an NDJSON or JSON-array body.
+
+    The body is parsed as it streams in and written in multi-row chunks;
+    invalid records are skipped and listed by line in the response.
+    """
+    return await load_activity_stream(request.stream(), db, ingestor)
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
 
-@router.get("/categories")
-def get_categories(db: Session = Depends(get_db)):
-    return ads_service.get_categories(db)
\ No newline at end of file
+@router.get("/categories", response_model=List[str])
+def get_categories(request: Request, response: Response, db: Session = Depends(get_read_db)):
+    # Served from memory; the database is only read when the catalog is
+    # reloaded, and the reload builds NumPy columns, hence sync like the above
+    catalog = ads_service.get_catalog(db)
+    headers = {"ETag": catalog.categories_etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, catalog.categories_etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return catalog.categories
\ No newline at end of file
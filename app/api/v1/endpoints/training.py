@@ -1,33 +1,51 @@
-from fastapi import APIRouter, Depends, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from app.core.schemas.training import TrainingResponse
+from app.core.schemas.training import TrainingResponse, TrainingJobResponse
 from app.db.session import get_db
-from app.core.recommendation.training import ModelTrainer, TrainingStatus
+from app.core.recommendation.jobs import training_jobs, training_runner
+from app.core.recommendation.snapshot import model_registry
+from app.core.recommendation.training import TrainingStatus
 from datetime import datetime
 
 router = APIRouter()
-model_trainer = ModelTrainer()
 
 @router.post("/trigger", response_model=TrainingResponse)
-async def trigger_training(
-    background_tasks: BackgroundTasks,
+def trigger_training(
     force: bool = False,
     db: Session = Depends(get_db)
 ):
-    # Add training task to background tasks
-    background_tasks.add_task(model_trainer.train_model, db)
+    # Queue the run; a worker outside the request path picks it up
+    job, created = training_jobs.submit(db, force=force)
+    training_runner.ensure_started()
     
     return TrainingResponse(
-        status=TrainingStatus.SCHEDULED,
-        timestamp=datetime.utcnow(),
-        message="Model training has been scheduled"
+        status=job.status,
+        timestamp=job.created_at,
+        message="Model training has been scheduled" if created else "A training job is already pending",
+        job_id=job.id
     )
 
 @router.get("/status", response_model=TrainingResponse)
-async def get_training_status(db: Session = Depends(get_db)):
-    status_info = model_trainer.get_status()
+def get_training_status(db: Session = Depends(get_db)):
+    job = training_jobs.latest(db)
+    if job is None:
+        return TrainingResponse(
+            status=TrainingStatus.IDLE.value,
+            timestamp=datetime.utcnow(),
+            model_version=model_registry.version
+        )
     return TrainingResponse(
-        status=status_info["status"],
-        timestamp=status_info["last_training"] or datetime.utcnow(),
-        message=status_info["error_message"]
-    )
\ No newline at end of file
+        status=job.status,
+        timestamp=job.finished_at or job.started_at or job.created_at,
+        message=job.error_message,
+        model_version=model_registry.version,
+        progress=job.progress,
+        job_id=job.id
+    )
+
+@router.get("/jobs/{job_id}", response_model=TrainingJobResponse)
+def get_training_job(job_id: int, db: Session = Depends(get_db)):
+    job = training_jobs.get(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Training job not found")
+    return job
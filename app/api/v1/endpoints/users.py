@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from app.db.session import get_db
+from typing import List, Optional
+from app.db.session import get_async_read_db, get_db, get_read_db, get_read_session_factory
 from app.services.user_service import UserService
-from app.core.schemas.users import UserCreate, UserResponse, UserPreferences
+from app.core.schemas.ads import UserActivityResponse
+from app.core.schemas.users import UserCreate, UserResponse, UserPreferences, UserActivityStatsResponse
 
 router = APIRouter()
 user_service = UserService()
@@ -16,8 +21,8 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
     return user_service.create_user(db=db, user=user)
 
 @router.get("/{user_id}", response_model=UserResponse)
-def get_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = user_service.get_user(db, user_id=user_id)
+async def get_user(user_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    db_user = await user_service.get_user_async(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
@@ -30,6 +35,46 @@ def update_preferences(
 ):
     return user_service.update_preferences(db, user_id, preferences)
 
-@router.get("/{user_id}/activity-history")
-def get_user_activity(user_id: int, db: Session = Depends(get_db)):
-    return user_service.get_activity_history(db, user_id)
\ No newline at end of file
+@router.get("/{user_id}/activity-history", response_model=List[UserActivityResponse])
+def get_user_activity(
+    user_id: int,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Newest first, one page at a time; pass back X-Next-Cursor to continue."""
+    try:
+        activities, next_cursor = user_service.get_activity_history(
+            db, user_id, limit=limit, cursor=cursor, since=since, until=until
+        )
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return activities
+
+@router.get("/{user_id}/activity-history/export")
+def export_user_activity(
+    user_id: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    session_factory=Depends(get_read_session_factory)
+):
+    """The full history as NDJSON, streamed so memory stays flat however long it is."""
+    def lines():
+        # Opened here: older FastAPI closes yield dependencies before the body is streamed
+        with session_factory() as db:
+            for activity in user_service.iter_activity_history(db, user_id, since=since, until=until):
+                yield json.dumps({**activity, "timestamp": activity["timestamp"].isoformat()}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@router.get("/{user_id}/activity-stats", response_model=UserActivityStatsResponse)
+def get_user_activity_stats(user_id: int, db: Session = Depends(get_read_db)):
+    stats = user_service.get_activity_stats(db, user_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No activity recorded for this user")
+    return stats
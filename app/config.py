@@ -7,7 +7,13 @@ class Settings(BaseSettings):
     
     # Database
     DATABASE_URL: str
-    DB_MAX_CONNECTIONS: int = 20
+    DB_MAX_CONNECTIONS: int = 20  # per engine and worker process: pool plus overflow
+    DB_POOL_SIZE: int = 0  # connections kept open; 0 picks the backend default (10 PostgreSQL, 5 SQLite)
+    DB_POOL_TIMEOUT: float = 10.0  # seconds to wait for a free connection before failing
+    DB_POOL_RECYCLE: int = 1800  # seconds before a network connection is replaced
+    DB_POOL_PRE_PING: Optional[bool] = None  # None pings network databases only
+    DB_READ_REPLICA_URL: Optional[str] = None  # read-only endpoints use it when set
+    ASYNC_DATABASE_URL: Optional[str] = None  # derived from DATABASE_URL (asyncpg / aiosqlite) when unset
     
     # Security
     SECRET_KEY: str
@@ -19,10 +25,62 @@ class Settings(BaseSettings):
     MINIMUM_TRAINING_SAMPLES: int = 100
     EMBEDDING_SIZE: int = 64
     LEARNING_RATE: float = 0.001
+    EMBEDDING_STORAGE_DTYPE: str = "float32"  # float32, float16 or int8
+    TRAINING_CHUNK_SIZE: int = 10000  # activity rows fetched per round trip
+    TRAINING_EPOCHS: int = 20
+    TRAINING_BATCH_SIZE: int = 1024
+    VALIDATION_SPLIT: float = 0.1
+    EARLY_STOPPING_PATIENCE: int = 3
+    TRAINING_NUM_THREADS: int = 0  # 0 uses half the cores
+    INCREMENTAL_TRAINING: bool = True  # fine-tune on new activities between full rebuilds
+    FULL_RETRAIN_EVERY: int = 24  # incremental runs before a full rebuild
+    TRAINING_WORKER_MODE: str = "external"  # external (python -m app.worker), process (one per API worker) or thread
+    TRAINING_POLL_INTERVAL: float = 2.0  # seconds between checks for queued jobs
+    TRAINING_HEARTBEAT_INTERVAL: float = 30.0  # seconds between lease renewals of a running job
+    TRAINING_JOB_LEASE: float = 300.0  # a running job not renewed for this long is failed, so triggers stop waiting on it
+    SNAPSHOT_REFRESH_INTERVAL: float = 10.0  # seconds between checks for newly trained models
+    EMBEDDING_WRITEBACK_CHUNK_SIZE: int = 5000
+    EMBEDDING_WRITEBACK_STRATEGY: str = "auto"  # auto, executemany or copy
+    EMBEDDING_STORE_DIR: str = ""  # shared directory of memory-mapped embedding files; empty loads them from the database per worker
+    EMBEDDING_STORE_KEEP: int = 3  # embedding file versions kept on disk
+    TRAINING_WINDOW_DAYS: int = 180  # activity older than this is not read (its decayed weight is < 0.3%); 0 reads all
     
     # Recommendation
     MAX_RECOMMENDATIONS: int = 10
     SIMILARITY_THRESHOLD: float = 0.5
+    RECOMMENDATION_CACHE_TTL: float = 30.0  # seconds; 0 disables the per-user result cache
+    RECOMMENDATION_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    PREFERENCE_CACHE_SIZE: int = 100000  # users whose parsed preferences are kept in memory
+    PREFERENCE_CACHE_TTL: float = 10.0  # seconds another worker may keep filtering with a user's old preferences
+    CATALOG_TTL: float = 60.0  # seconds before the in-memory ad catalog is reloaded; 0 never expires
+    PIPELINE_CANDIDATES: int = 100  # ads retrieved by embedding similarity before re-ranking
+    PIPELINE_RERANK: bool = True  # feature-based logistic re-ranking of the retrieved ads
+    PIPELINE_MAX_PER_CATEGORY: int = 0  # business rule: ads per category in one list; 0 is unlimited
+    PIPELINE_RETRIEVAL_BUDGET_MS: float = 20.0  # per-stage latency budgets; re-ranking is skipped
+    PIPELINE_RERANK_BUDGET_MS: float = 10.0  # once the budget up to it is already spent
+    PIPELINE_RULES_BUDGET_MS: float = 2.0
+    RECOMMENDATION_BATCH_WINDOW_MS: float = 0.0  # coalesce concurrent retrievals into one batched search; 0 is off
+    RECOMMENDATION_BATCH_MAX_USERS: int = 64  # a batch is scored as soon as this many requests are waiting
+    MATERIALIZE_RECOMMENDATIONS: bool = True  # store every user's top-K after training and serve unfiltered requests from it
+    MATERIALIZE_BLOCK_SIZE: int = 1024  # users scored per matrix product (fewer for very large catalogs)
+    MATERIALIZE_THREADS: int = 0  # 0 uses every core
+    
+    # Activity ingestion
+    INGEST_QUEUE_SIZE: int = 10000  # events buffered before track-activity answers 503
+    INGEST_BATCH_SIZE: int = 500  # rows per group commit
+    INGEST_FLUSH_INTERVAL: float = 0.05  # seconds the flusher waits for the first event
+    INGEST_ENQUEUE_TIMEOUT: float = 0.1  # seconds a request waits for room in a full queue
+    
+    # Activity storage
+    ACTIVITY_RETENTION_DAYS: int = 365  # older raw events are rolled up and dropped; 0 keeps everything
+    ACTIVITY_PARTITIONS_AHEAD: int = 2  # monthly partitions created ahead of time (PostgreSQL)
+    ACTIVITY_PARTITION_CHECK_INTERVAL: float = 3600.0  # seconds between the API's partition checks
+    
+    # Candidate retrieval
+    ANN_INDEX: str = "ivf"  # ivf or brute
+    ANN_MIN_ITEMS: int = 10000  # below this an exact scan is faster
+    ANN_N_LISTS: int = 0  # 0 picks sqrt(number of ads)
+    ANN_N_PROBE: int = 16  # lists scanned per query; higher means better recall, slower
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,227 @@
+import threading
+from abc import ABC, abstractmethod
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+from app.config import settings
+from app.core.recommendation.scoring import ScoringEngine, normalize_rows, select_top_k
+
+
+class CandidateIndex(ABC):
+    """Retrieval stage returning the items closest (by cosine) to a query vector."""
+
+    @abstractmethod
+    def build(self, item_ids: Sequence[int], vectors: np.ndarray, normalized: bool = False) -> "CandidateIndex":
+        ...
+
+    @abstractmethod
+    def add(self, item_ids: Sequence[int], vectors: np.ndarray):
+        ...
+
+    @abstractmethod
+    def search(self, query_vectors: np.ndarray, n: int) -> List[List[Tuple[int, float]]]:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+
+class BruteForceIndex(CandidateIndex):
+    """Exact search over every item; the reference the approximate indexes are measured against."""
+
+    def __init__(self):
+        # Replaced as a whole so readers never see a torn update
+        self._engine: Optional[ScoringEngine] = None
+        self._lock = threading.Lock()
+
+    def build(self, item_ids: Sequence[int], vectors: np.ndarray, normalized: bool = False) -> "BruteForceIndex":
+        self._engine = ScoringEngine(item_ids, vectors, normalized=normalized)
+        return self
+
+    def add(self, item_ids: Sequence[int], vectors: np.ndarray):
+        with self._lock:
+            self._engine = self._engine.with_items(item_ids, vectors)
+
+    def search(self, query_vectors: np.ndarray, n: int) -> List[List[Tuple[int, float]]]:
+        ids, scores = self._engine.top_k(query_vectors, n)
+        return [
+            list(zip(row_ids, row_scores))
+            for row_ids, row_scores in zip(ids.tolist(), scores.astype(float).tolist())
+        ]
+
+    def __len__(self) -> int:
+        return 0 if self._engine is None else len(self._engine)
+
+
+class IVFFlatIndex(CandidateIndex):
+    """Inverted-file index: items are bucketed by their nearest k-means centroid.
+
+    A query only scores the items in its `n_probe` closest buckets, so cost is
+    roughly n_probe / n_lists of a full scan. Raising `n_probe` trades latency
+    for recall; `n_lists` of about sqrt(n_items) is a good default. A batch
+    of queries is scored list by list, one matrix product per probed list
+    against every query that probes it, then one top-k over all of them.
+    """
+
+    def __init__(
+        self,
+        n_lists: int = 0,
+        n_probe: int = 16,
+        n_iter: int = 10,
+        sample_size: int = 50000,
+        seed: int = 0
+    ):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.sample_size = sample_size
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        # One (ids, vectors) tuple per bucket; each bucket is swapped as a unit on insert
+        self._lists: List[Tuple[np.ndarray, np.ndarray]] = []
+        # Cached by _flat_layout, for mapping search positions back to ids
+        self._flat = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def build(self, item_ids: Sequence[int], vectors: np.ndarray, normalized: bool = False) -> "IVFFlatIndex":
+        ids = np.asarray(item_ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32) if normalized else normalize_rows(vectors)
+        n_lists = self.n_lists or int(np.sqrt(len(ids)))
+        n_lists = max(1, min(n_lists, len(ids)))
+
+        self.centroids = self._train_centroids(vectors, n_lists)
+        assignment = self._assign(vectors)
+
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        return self.load_layout(self.centroids, bounds, ids[order], vectors[order])
+
+    def load_layout(self, centroids: np.ndarray, bounds: np.ndarray, ids: np.ndarray, vectors: np.ndarray) -> "IVFFlatIndex":
+        """Use items already grouped by list, list `i` being rows bounds[i]:bounds[i + 1].
+
+        The lists are views, so a memory-mapped `vectors` is never copied.
+        """
+        self.centroids = centroids
+        self._lists = [(ids[start:end], vectors[start:end]) for start, end in zip(bounds[:-1], bounds[1:])]
+        self._flat = None
+        self._size = len(ids)
+        return self
+
+    def layout(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(centroids, bounds, ids, vectors) with items grouped by list, for `load_layout`."""
+        lists = self._lists
+        bounds = np.concatenate([[0], np.cumsum([len(list_ids) for list_ids, _ in lists])]).astype(np.int64)
+        return (
+            self.centroids,
+            bounds,
+            np.concatenate([list_ids for list_ids, _ in lists]),
+            np.vstack([list_vectors for _, list_vectors in lists])
+        )
+
+    def _train_centroids(self, vectors: np.ndarray, n_lists: int) -> np.ndarray:
+        """Spherical k-means on a sample of the catalog."""
+        rng = np.random.default_rng(self.seed)
+        if len(vectors) > self.sample_size:
+            sample = vectors[rng.choice(len(vectors), self.sample_size, replace=False)]
+        else:
+            sample = vectors
+
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(self.n_iter):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=n_lists)
+
+            # Re-seed empty buckets so every list stays useful
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = normalize_rows(sums)
+        return centroids
+
+    def _assign(self, vectors: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk_size):
+            chunk = vectors[start:start + chunk_size]
+            assignment[start:start + chunk_size] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return assignment
+
+    def add(self, item_ids: Sequence[int], vectors: np.ndarray):
+        ids = np.asarray(item_ids, dtype=np.int64)
+        vectors = normalize_rows(vectors)
+        assignment = self._assign(vectors)
+        with self._lock:
+            for list_no in np.unique(assignment):
+                members = assignment == list_no
+                list_ids, list_vectors = self._lists[list_no]
+                self._lists[list_no] = (
+                    np.concatenate([list_ids, ids[members]]),
+                    np.vstack([list_vectors, vectors[members]])
+                )
+            self._flat = None
+            self._size += len(ids)
+
+    def search(
+        self,
+        query_vectors: np.ndarray,
+        n: int,
+        n_probe: Optional[int] = None
+    ) -> List[List[Tuple[int, float]]]:
+        queries = normalize_rows(np.atleast_2d(query_vectors))
+        probes = select_top_k(queries @ self.centroids.T, n_probe or self.n_probe)
+        n_queries, n_probes = probes.shape
+        lists, starts, flat_ids, width = self._flat_layout()
+
+        # Query row q scores probe j's list into columns j*width onwards; the padding stays -inf
+        scores = np.full((n_queries, n_probes, width), -np.inf, dtype=np.float32)
+        flat = probes.ravel()
+        order = np.argsort(flat, kind="stable")
+        for pairs in np.split(order, np.flatnonzero(np.diff(flat[order])) + 1):
+            vectors = lists[flat[pairs[0]]][1]
+            if len(vectors):
+                rows, slots = np.divmod(pairs, n_probes)
+                scores[rows, slots, :len(vectors)] = queries[rows] @ vectors.T
+        scores = scores.reshape(n_queries, n_probes * width)
+
+        best = select_top_k(scores, n)
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        slots, offsets = np.divmod(best, width)
+        positions = starts[np.take_along_axis(probes, slots, axis=1)] + offsets
+        ids = flat_ids[np.minimum(positions, len(flat_ids) - 1)]
+        valid = np.isfinite(best_scores)
+        return [
+            [(item_id, score) for item_id, score, keep in zip(row_ids, row_scores, row_valid) if keep]
+            for row_ids, row_scores, row_valid in zip(ids.tolist(), best_scores.astype(float).tolist(), valid.tolist())
+        ]
+
+    def _flat_layout(self) -> Tuple[List[Tuple[np.ndarray, np.ndarray]], np.ndarray, np.ndarray, int]:
+        """(lists, start of each list, every id list by list, longest list), rebuilt after an insert."""
+        with self._lock:
+            if self._flat is None:
+                lists = list(self._lists)
+                sizes = np.array([len(list_ids) for list_ids, _ in lists], dtype=np.int64)
+                self._flat = (
+                    lists,
+                    np.concatenate([[0], np.cumsum(sizes)[:-1]]),
+                    np.concatenate([list_ids for list_ids, _ in lists]),
+                    max(1, int(sizes.max()))
+                )
+            return self._flat
+
+    def __len__(self) -> int:
+        return self._size
+
+
+def uses_ivf(n_items: int) -> bool:
+    return settings.ANN_INDEX == "ivf" and n_items >= settings.ANN_MIN_ITEMS
+
+
+def build_candidate_index(item_ids: Sequence[int], vectors: np.ndarray, normalized: bool = False) -> CandidateIndex:
+    """Index configured by ANN_INDEX; small catalogs always use an exact scan."""
+    if uses_ivf(len(item_ids)):
+        index = IVFFlatIndex(n_lists=settings.ANN_N_LISTS, n_probe=settings.ANN_N_PROBE)
+    else:
+        index = BruteForceIndex()
+    return index.build(item_ids, vectors, normalized=normalized)
@@ -0,0 +1,130 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+class RecommendationBatcher:
+    """Coalesces concurrent top-k lookups into one batched user-by-item search.
+
+    `submit` queues a request and returns a Future. A worker thread takes
+    the first waiting request, keeps collecting for up to `window_ms` or
+    until `max_batch` requests are in, then runs one `recommend_batch` per
+    snapshot at the largest top_k asked for and hands each caller its own
+    slice. A lone request therefore waits at most `window_ms` longer;
+    under load the window fills and one matrix product serves many users.
+    """
+    def __init__(self, window_ms: Optional[float] = None, max_batch: Optional[int] = None):
+        self.window_ms = settings.RECOMMENDATION_BATCH_WINDOW_MS if window_ms is None else window_ms
+        self.max_batch = max_batch or settings.RECOMMENDATION_BATCH_MAX_USERS
+        self._queue: "queue.Queue[Tuple]" = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "batches": 0, "failed": 0, "max_batch_size": 0, "wait_ms_total": 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_ms > 0
+
+    def submit(self, snapshot, user_id: int, top_k: int) -> "Future[List[Tuple[int, float]]]":
+        self.ensure_started()
+        future: Future = Future()
+        self._queue.put((snapshot, user_id, top_k, future, time.perf_counter()))
+        return future
+
+    def recommend(self, snapshot, user_id: int, top_k: int) -> List[Tuple[int, float]]:
+        """`snapshot.recommend(user_id, top_k=top_k)`, scored together with concurrent callers."""
+        return self.submit(snapshot, user_id, top_k).result()
+
+    def _collect(self, first: Tuple) -> List[Tuple]:
+        batch = [first]
+        deadline = time.monotonic() + self.window_ms / 1000
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def score(self, batch: List[Tuple]):
+        """Resolve every request in `batch`, one `recommend_batch` call per snapshot."""
+        # Callers that gave up (a cancelled request) are dropped here, not answered later
+        batch = [request for request in batch if request[3].set_running_or_notify_cancel()]
+        by_snapshot: Dict[int, List[Tuple]] = {}
+        for request in batch:
+            by_snapshot.setdefault(id(request[0]), []).append(request)
+
+        for requests in by_snapshot.values():
+            snapshot = requests[0][0]
+            try:
+                results = snapshot.recommend_batch(
+                    [user_id for _, user_id, _, _, _ in requests],
+                    top_k=max(top_k for _, _, top_k, _, _ in requests)
+                )
+            except Exception as error:
+                logger.exception("Batched recommendation scoring failed for %d users", len(requests))
+                self._count(failed=len(requests))
+                for *_, future, _ in requests:
+                    future.set_exception(error)
+                continue
+            for (_, _, top_k, future, _), ranked in zip(requests, results):
+                future.set_result(ranked[:top_k])
+
+        finished = time.perf_counter()
+        with self._lock:
+            self._counters["requests"] += len(batch)
+            self._counters["batches"] += 1
+            self._counters["max_batch_size"] = max(self._counters["max_batch_size"], len(batch))
+            self._counters["wait_ms_total"] += sum((finished - queued) * 1000 for *_, queued in batch)
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self._counters[name] += value
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self.score(self._collect(first))
+
+    def ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="recommendation-batcher", daemon=True)
+                self._thread.start()
+
+    def shutdown(self, timeout: float = 5.0):
+        """Stop the worker once the requests already queued are answered."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+        batches, requests = counters["batches"], counters["requests"]
+        return {
+            **counters,
+            "enabled": self.enabled,
+            "window_ms": self.window_ms,
+            "avg_batch_size": requests / batches if batches else 0.0,
+            "avg_wait_ms": counters["wait_ms_total"] / requests if requests else 0.0,
+            "queue_depth": self._queue.qsize()
+        }
+
+recommendation_batcher = RecommendationBatcher()
@@ -0,0 +1,125 @@
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from app.config import settings
+from app.core.recommendation.snapshot import model_registry
+
+# (user_id, limit, model_version)
+CacheKey = Tuple[int, int, int]
+
+# Rough per-entry cost of the key, the OrderedDict slot and the array headers
+ENTRY_OVERHEAD_BYTES = 400
+
+
+class RecommendationCache:
+    """Thread-safe LRU cache of ranked (ad_id, score) lists with a TTL.
+
+    Entries are stored as two small arrays and the cache is bounded by
+    their approximate size in bytes, evicting least recently used entries
+    first. A per-user index lets new activity drop all of one user's
+    entries without scanning the cache.
+
+    That invalidation only covers activity ingested by this process, so
+    each entry also keeps the user's activity watermark from before it was
+    ranked, and `get` misses when the caller's current watermark differs.
+    This catches activity written by other workers, and a ranking put
+    back after an invalidation that it predates.
+    """
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_bytes = settings.RECOMMENDATION_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.ttl = settings.RECOMMENDATION_CACHE_TTL if ttl is None else ttl
+        self.clock = clock
+        # key -> (expires at, ids, scores, size, watermark)
+        self._entries: "OrderedDict[CacheKey, Tuple[float, np.ndarray, np.ndarray, int, Optional[int]]]" = OrderedDict()
+        self._keys_by_user: Dict[int, Set[CacheKey]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0, "stale": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.ttl > 0
+
+    def get(self, key: CacheKey, watermark: Optional[int] = None) -> Optional[List[Tuple[int, float]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            expires_at, ids, scores, _, entry_watermark = entry
+            expired = expires_at <= self.clock()
+            if expired or entry_watermark != watermark:
+                self._remove(key)
+                self._counters["expirations" if expired else "stale"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+        return list(zip(ids.tolist(), scores.tolist()))
+
+    def put(self, key: CacheKey, recommendations: List[Tuple[int, float]], watermark: Optional[int] = None):
+        """Store a ranking computed after reading the user's activity `watermark`."""
+        if not self.enabled:
+            return
+        ids = np.fromiter((ad_id for ad_id, _ in recommendations), dtype=np.int64, count=len(recommendations))
+        scores = np.fromiter((score for _, score in recommendations), dtype=np.float32, count=len(recommendations))
+        size = ids.nbytes + scores.nbytes + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self.clock() + self.ttl, ids, scores, size, watermark)
+            self._keys_by_user.setdefault(key[0], set()).add(key)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def _remove(self, key: CacheKey):
+        size = self._entries.pop(key)[3]
+        self._bytes -= size
+        user_keys = self._keys_by_user.get(key[0])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._keys_by_user[key[0]]
+
+    def invalidate_users(self, user_ids: Iterable[int]):
+        with self._lock:
+            for user_id in set(user_ids):
+                for key in list(self._keys_by_user.get(user_id, ())):
+                    self._remove(key)
+                    self._counters["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._counters["invalidations"] += len(self._entries)
+            self._entries.clear()
+            self._keys_by_user.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": self._counters["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes
+            }
+
+
+recommendation_cache = RecommendationCache()
+# Entries for older versions can never be hit again; free them right away
+model_registry.subscribe(lambda snapshot: recommendation_cache.clear())
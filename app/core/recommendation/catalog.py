@@ -0,0 +1,196 @@
+import hashlib
+import threading
+import time
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.db.models.ads import Ad
+from app.db.session import SessionLocal
+
+
+class CatalogData:
+    """One immutable version of the ad catalog, stored column by column.
+
+    Row `i` of every column describes ad `ids[i]`; `row_of` maps an ad id
+    to its row and `postings` maps a category to the rows in it.
+    Embeddings are not kept here; the model snapshot has them.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        ids: np.ndarray,
+        category_codes: np.ndarray,
+        category_names: List[str],
+        prices: np.ndarray,
+        row_of: Dict[int, int],
+        postings: Dict[str, np.ndarray]
+    ):
+        self.version = version
+        self.ids = ids
+        self.category_codes = category_codes
+        self.category_names = category_names
+        self.prices = prices
+        self.postings = postings
+        # Shared with later versions, which may add ids beyond this one's rows
+        self._row_of = row_of
+        self.categories = sorted(postings)
+        self.categories_etag = '"%s"' % hashlib.sha1(
+            "\n".join(self.categories).encode()
+        ).hexdigest()[:16]
+
+        for column in (ids, category_codes, prices):
+            column.flags.writeable = False
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row(self, ad_id: int) -> Optional[int]:
+        row = self._row_of.get(ad_id)
+        return row if row is not None and row < len(self.ids) else None
+
+    def category_rows(self, category: str) -> np.ndarray:
+        return self.postings.get(category, np.empty(0, dtype=np.int64))
+
+    def filter_rows(
+        self,
+        categories: Sequence[str] = (),
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None
+    ) -> np.ndarray:
+        """Ascending rows in any of `categories` (all rows if empty) within the price range."""
+        if categories:
+            rows = np.sort(np.concatenate(
+                [self.category_rows(category) for category in set(categories)] + [np.empty(0, dtype=np.int64)]
+            ))
+        else:
+            rows = np.arange(len(self.ids))
+        if min_price is not None or max_price is not None:
+            prices = self.prices[rows]
+            keep = np.ones(len(rows), dtype=bool)
+            if min_price is not None:
+                keep &= prices >= min_price
+            if max_price is not None:
+                keep &= prices <= max_price
+            rows = rows[keep]
+        return rows
+
+    def category_of(self, ad_id: int) -> Optional[str]:
+        row = self.row(ad_id)
+        return None if row is None else self.category_names[self.category_codes[row]]
+
+
+class AdCatalog:
+    """Process-wide columnar cache of the ads table.
+
+    Loaded on first use and then served from memory. `add_ad` patches it in
+    place of a reload: columns live in over-allocated buffers, so a new ad
+    is written past the rows existing versions can see and a new
+    CatalogData is swapped in. `ttl` bounds how stale it can get when
+    another process creates ads.
+    """
+
+    def __init__(self, session_factory=SessionLocal, ttl: Optional[float] = None):
+        self.session_factory = session_factory
+        self.ttl = settings.CATALOG_TTL if ttl is None else ttl
+        self._data: Optional[CatalogData] = None
+        self._loaded_at = 0.0
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def get(self, db: Optional[Session] = None) -> CatalogData:
+        data = self._data
+        if data is None or (self.ttl and time.monotonic() - self._loaded_at > self.ttl):
+            with self._lock:
+                # Only the first caller past the lock reloads; the rest reuse its result
+                if self._data is data:
+                    self._load(self._fetch(db))
+                data = self._data
+        return data
+
+    def invalidate(self):
+        self._data = None
+
+    def _fetch(self, db: Optional[Session]) -> List:
+        if db is None:
+            with self.session_factory() as session:
+                return self._fetch(session)
+        statement = select(Ad.id, Ad.category, Ad.price).order_by(Ad.id)
+        return db.execute(statement.execution_options(yield_per=10000)).all()
+
+    def _load(self, rows: List):
+        size = len(rows)
+        capacity = max(16, size * 2)
+
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._codes = np.zeros(capacity, dtype=np.int32)
+        self._prices = np.zeros(capacity, dtype=np.float64)
+        self._category_names: List[str] = []
+        self._category_code: Dict[str, int] = {}
+        self._row_of: Dict[int, int] = {}
+
+        for row_index, (ad_id, category, price) in enumerate(rows):
+            self._write_row(row_index, ad_id, category, price)
+
+        codes = self._codes[:size]
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(self._category_names) + 1))
+        self._postings = {
+            name: order[bounds[code]:bounds[code + 1]]
+            for code, name in enumerate(self._category_names)
+        }
+        self._size = size
+        self._loaded_at = time.monotonic()
+        self._publish()
+
+    def _write_row(self, row: int, ad_id: int, category: str, price: Optional[float]):
+        code = self._category_code.get(category)
+        if code is None:
+            code = self._category_code[category] = len(self._category_names)
+            self._category_names.append(category)
+        self._ids[row] = ad_id
+        self._codes[row] = code
+        self._prices[row] = np.nan if price is None else price
+        self._row_of[ad_id] = row
+
+    def _publish(self):
+        size = self._size
+        self._version += 1
+        self._data = CatalogData(
+            version=self._version,
+            ids=self._ids[:size],
+            category_codes=self._codes[:size],
+            category_names=list(self._category_names),
+            prices=self._prices[:size],
+            row_of=self._row_of,
+            postings=dict(self._postings)
+        )
+
+    def _grow(self):
+        capacity = len(self._ids) * 2
+        def grown(column):
+            bigger = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+            bigger[:self._size] = column[:self._size]
+            return bigger
+        self._ids, self._codes, self._prices = (
+            grown(column) for column in (self._ids, self._codes, self._prices)
+        )
+
+    def add_ad(self, ad_id: int, category: str, price: Optional[float]):
+        """Append one ad without reloading; a no-op until the catalog is loaded."""
+        with self._lock:
+            if self._data is None or ad_id in self._row_of:
+                return
+            if self._size == len(self._ids):
+                self._grow()
+            row = self._size
+            self._write_row(row, ad_id, category, price)
+            self._size += 1
+            rows = self._postings.get(category, np.empty(0, dtype=np.int64))
+            self._postings[category] = np.append(rows, row)
+            self._publish()
+
+
+ad_catalog = AdCatalog()
@@ -0,0 +1,195 @@
+"""Versioned embedding files that every worker memory-maps read-only.
+
+The trainer writes each model version to `EMBEDDING_STORE_DIR` as one file
+and then repoints the `current` symlink at it with an atomic rename.
+Workers load whatever `current` names with np.memmap, so the user and item
+matrices live once in the page cache rather than once per process, and a
+worker starts serving without reading embeddings from the database.
+
+File layout, little-endian:
+    8s  magic "ADSEMBED"
+    I   format version
+    I   length of the JSON header that follows
+    JSON header: model version, created_at, embedding size, and per section
+        its offset (64-byte aligned), dtype and shape
+    raw sections: user_ids, user_order, user_embeddings, item_ids,
+        item_order, item_embeddings (L2-normalized), and for an IVF index
+        ivf_centroids and ivf_bounds
+
+Items are stored grouped by IVF list, so the index is rebuilt from views
+of the mapped matrix without running k-means. The *_order sections are the
+argsort of the ids, which serves id lookups without a per-id dict.
+
+Files of old versions are deleted once `EMBEDDING_STORE_KEEP` newer ones
+exist; a worker still mapping one keeps its pages until it swaps.
+"""
+import json
+import os
+import re
+import struct
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+from app.config import settings
+from app.core.recommendation.ann import BruteForceIndex, IVFFlatIndex
+from app.core.recommendation.snapshot import ModelSnapshot
+
+MAGIC = b"ADSEMBED"
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct("<8sII")
+ALIGNMENT = 64
+CURRENT = "current"
+FILE_PATTERN = re.compile(r"^embeddings-v(\d+)\.bin$")
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+def write_embedding_file(path: str, version: int, sections: Dict[str, np.ndarray], created_at: Optional[datetime] = None):
+    """Write `sections` to `path` in the layout above, through a temporary file and a rename."""
+    arrays = {name: np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<")) for name, array in sections.items()}
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps({
+        "model_version": version,
+        "created_at": (created_at or datetime.utcnow()).isoformat(),
+        "embedding_size": int(arrays["item_embeddings"].shape[1]),
+        "sections": layout
+    }).encode("utf-8")
+    # Section offsets count from the first aligned byte after the header
+    data_start = _aligned(PREAMBLE.size + len(header))
+
+    temporary = f"{path}.tmp-{os.getpid()}"
+    with open(temporary, "wb") as file:
+        file.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        file.write(header)
+        for name, array in arrays.items():
+            file.seek(data_start + layout[name]["offset"])
+            file.write(array.tobytes())
+        file.truncate(data_start + offset)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+def read_embedding_file(path: str) -> Dict:
+    """The header of `path`, with every section mapped read-only under "arrays"."""
+    with open(path, "rb") as file:
+        magic, format_version, header_length = PREAMBLE.unpack(file.read(PREAMBLE.size))
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f"Unrecognized embedding file: {path}")
+        header = json.loads(file.read(header_length))
+    data_start = _aligned(PREAMBLE.size + header_length)
+
+    arrays = {}
+    for name, section in header["sections"].items():
+        shape = tuple(section["shape"])
+        if not np.prod(shape, dtype=np.int64):
+            # mmap cannot map zero bytes
+            array = np.empty(shape, dtype=section["dtype"])
+            array.flags.writeable = False
+        else:
+            array = np.memmap(path, dtype=section["dtype"], mode="r", offset=data_start + section["offset"], shape=shape)
+        arrays[name] = array
+    return {**header, "arrays": arrays}
+
+class EmbeddingStore:
+    """Publishes snapshots as embedding files and loads the current one."""
+    def __init__(self, directory: Optional[str] = None, keep: Optional[int] = None):
+        self.directory = settings.EMBEDDING_STORE_DIR if directory is None else directory
+        self.keep = keep or settings.EMBEDDING_STORE_KEEP
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def path_for(self, version: int) -> str:
+        return os.path.join(self.directory, f"embeddings-v{version:010d}.bin")
+
+    def save(self, snapshot: ModelSnapshot) -> str:
+        """Write `snapshot` (with the ads appended since training) and make it current."""
+        os.makedirs(self.directory, exist_ok=True)
+        sections = {
+            "user_ids": snapshot.user_ids,
+            "user_order": snapshot.user_map.order,
+            "user_embeddings": snapshot.user_embeddings
+        }
+        if isinstance(snapshot.index, IVFFlatIndex):
+            centroids, bounds, item_ids, item_vectors = snapshot.index.layout()
+            sections.update(ivf_centroids=centroids, ivf_bounds=bounds)
+        else:
+            item_ids, item_vectors = snapshot.engine.item_ids, snapshot.engine.item_matrix
+        sections.update(
+            item_ids=item_ids,
+            item_order=np.argsort(item_ids, kind="stable"),
+            item_embeddings=item_vectors
+        )
+        path = self.path_for(snapshot.version)
+        write_embedding_file(path, snapshot.version, sections, snapshot.created_at)
+        self._point_current_at(path)
+        self.prune()
+        return path
+
+    def _point_current_at(self, path: str):
+        # A fresh link renamed over the old one: readers see either version, never neither
+        link = os.path.join(self.directory, CURRENT)
+        temporary = f"{link}.tmp-{os.getpid()}"
+        if os.path.lexists(temporary):
+            os.remove(temporary)
+        os.symlink(os.path.basename(path), temporary)
+        os.replace(temporary, link)
+
+    def versions(self) -> List[int]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(match.group(1)) for match in map(FILE_PATTERN.match, os.listdir(self.directory)) if match)
+
+    def current_version(self) -> Optional[int]:
+        """Version `current` points at, from the link alone; None when nothing is published."""
+        try:
+            target = os.readlink(os.path.join(self.directory, CURRENT))
+        except OSError:
+            return None
+        match = FILE_PATTERN.match(os.path.basename(target))
+        return int(match.group(1)) if match else None
+
+    def load(self, version: Optional[int] = None) -> Optional[ModelSnapshot]:
+        """A snapshot over the mapped file of `version` (default: current); None if there is none."""
+        path = os.path.join(self.directory, CURRENT) if version is None else self.path_for(version)
+        try:
+            contents = read_embedding_file(os.path.realpath(path))
+        except FileNotFoundError:
+            return None
+        arrays = contents["arrays"]
+        item_ids, item_vectors = arrays["item_ids"], arrays["item_embeddings"]
+        if "ivf_centroids" in arrays:
+            index = IVFFlatIndex(n_probe=settings.ANN_N_PROBE).load_layout(
+                arrays["ivf_centroids"], arrays["ivf_bounds"], item_ids, item_vectors
+            )
+        else:
+            index = BruteForceIndex().build(item_ids, item_vectors, normalized=True)
+        return ModelSnapshot(
+            contents["model_version"],
+            arrays["user_ids"],
+            arrays["user_embeddings"],
+            item_ids,
+            item_vectors,
+            created_at=datetime.fromisoformat(contents["created_at"]),
+            normalized=True,
+            index=index,
+            user_order=arrays["user_order"],
+            item_order=arrays["item_order"]
+        )
+
+    def prune(self) -> List[int]:
+        """Delete all but the newest `keep` versions, never the current one; returns those deleted."""
+        current = self.current_version()
+        expired = [version for version in self.versions()[:-self.keep] if version != current]
+        for version in expired:
+            try:
+                os.remove(self.path_for(version))
+            except FileNotFoundError:
+                pass
+        return expired
+
+embedding_store = EmbeddingStore()
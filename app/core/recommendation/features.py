@@ -1,8 +1,36 @@
-from typing import List, Tuple
-from app.db.models.ads import UserActivity
+from typing import Iterator, List, Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.db.models.ads import Ad, UserActivity
 import numpy as np
 from datetime import datetime, timedelta
 
+DECAY_DAYS = 30
+ONE_DAY = np.timedelta64(1, "D")
+ONE_DAY_US = 24 * 3600 * 10**6
+
+ACTIVITY_TYPES = ("view", "click", "save", "purchase")
+UNKNOWN_ACTIVITY = len(ACTIVITY_TYPES)
+PURCHASE = ACTIVITY_TYPES.index("purchase")
+USER_FEATURES = ("view_count", "click_count", "save_count", "purchase_count", "total_spent", "activity_frequency")
+
+TrainingArrays = Tuple[np.ndarray, np.ndarray, np.ndarray]
+# Per-user partial aggregates: (user ids, per-type counts + spent, first and last timestamp in us)
+UserAggregates = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+def group_by_user(user_ids: np.ndarray, sums: np.ndarray, firsts: np.ndarray, lasts: np.ndarray) -> UserAggregates:
+    """Reduce rows sharing a user id: sum `sums`, min `firsts`, max `lasts`."""
+    users, inverse = np.unique(user_ids, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    starts = np.searchsorted(inverse[order], np.arange(len(users)))
+    return (
+        users,
+        np.add.reduceat(sums[order], starts, axis=0),
+        np.minimum.reduceat(firsts[order], starts),
+        np.maximum.reduceat(lasts[order], starts)
+    )
+
 class FeatureExtractor:
     def __init__(self):
         self.activity_weights = {
@@ -11,59 +39,204 @@ class FeatureExtractor:
             "save": 0.8,
             "purchase": 1.0
         }
-        
+        self.default_weight = 0.1
+
+    def compute_weights(
+        self,
+        activity_types: List[str],
+        timestamps: List[datetime],
+        current_time: Optional[datetime] = None
+    ) -> np.ndarray:
+        """Activity weight times exponential time decay, for a whole column at once."""
+        current_time = current_time or datetime.utcnow()
+        base_weights = self.type_weights()[self.encode_activity_types(activity_types)]
+
+        # Whole days since the event, as the per-row version computed with timedelta.days
+        stamps = np.array(timestamps, dtype="datetime64[us]")
+        days = (np.datetime64(current_time, "us") - stamps) // ONE_DAY
+        days = np.where(np.isnat(stamps), 0, days)
+        return base_weights * np.exp(-days / DECAY_DAYS).astype(np.float32)
+
+    def encode_activity_types(self, activity_types) -> np.ndarray:
+        """Index into ACTIVITY_TYPES per activity; unknown types get UNKNOWN_ACTIVITY."""
+        names, inverse = np.unique(np.asarray(activity_types, dtype=str), return_inverse=True)
+        lookup = np.array(
+            [ACTIVITY_TYPES.index(name) if name in ACTIVITY_TYPES else UNKNOWN_ACTIVITY for name in names],
+            dtype=np.int8
+        )
+        return lookup[inverse.reshape(-1)]
+
+    def type_weights(self) -> np.ndarray:
+        """Weight per activity code, the last entry being the default for unknown types."""
+        return np.array(
+            [self.activity_weights.get(name, self.default_weight) for name in ACTIVITY_TYPES] + [self.default_weight],
+            dtype=np.float32
+        )
+
     def prepare_training_data(self, activities: List[UserActivity]) -> List[Tuple[int, int, float]]:
         """Convert user activities to training data with time decay."""
-        training_data = []
-        current_time = datetime.utcnow()
-        
-        for activity in activities:
-            # Calculate time decay (exponential decay over 30 days)
-            days_diff = (current_time - activity.timestamp).days
-            time_decay = np.exp(-days_diff / 30)  # 30 days half-life
-            
-            # Calculate final weight
-            base_weight = self.activity_weights.get(activity.activity_type, 0.1)
-            final_weight = base_weight * time_decay
-            
-            training_data.append((
-                activity.user_id,
-                activity.ad_id,
-                final_weight
+        weights = self.compute_weights(
+            [activity.activity_type for activity in activities],
+            [activity.timestamp for activity in activities]
+        )
+        return [
+            (activity.user_id, activity.ad_id, float(weight))
+            for activity, weight in zip(activities, weights)
+        ]
+
+    def latest_activity_id(self, db: Session) -> Optional[int]:
+        return db.execute(select(func.max(UserActivity.id))).scalar()
+
+    def training_window_start(self, current_time: Optional[datetime] = None) -> Optional[datetime]:
+        """Oldest activity worth reading for training, or None for everything."""
+        if not settings.TRAINING_WINDOW_DAYS:
+            return None
+        return (current_time or datetime.utcnow()) - timedelta(days=settings.TRAINING_WINDOW_DAYS)
+
+    def _activity_range(
+        self,
+        statement,
+        after_id: Optional[int],
+        through_id: Optional[int],
+        since: Optional[datetime] = None
+    ):
+        if after_id is not None:
+            statement = statement.where(UserActivity.id > after_id)
+        if through_id is not None:
+            statement = statement.where(UserActivity.id <= through_id)
+        if since is not None:
+            # Lets PostgreSQL prune whole monthly partitions
+            statement = statement.where(UserActivity.timestamp >= since)
+        return statement
+
+    def stream_training_data(
+        self,
+        db: Session,
+        chunk_size: Optional[int] = None,
+        current_time: Optional[datetime] = None,
+        after_id: Optional[int] = None,
+        through_id: Optional[int] = None,
+        since: Optional[datetime] = None
+    ) -> Iterator[TrainingArrays]:
+        """Yield (user_ids, ad_ids, weights) arrays one chunk of activity rows at a time.
+
+        Rows are read as plain column tuples through a server-side cursor, so no
+        UserActivity objects are built and only one chunk is held in memory.
+        `after_id` / `through_id` restrict the scan to a range of activity ids
+        and `since` to recent activity.
+        """
+        chunk_size = chunk_size or settings.TRAINING_CHUNK_SIZE
+        current_time = current_time or datetime.utcnow()
+        statement = self._activity_range(select(
+            UserActivity.user_id,
+            UserActivity.ad_id,
+            UserActivity.activity_type,
+            UserActivity.timestamp
+        ), after_id, through_id, since).execution_options(yield_per=chunk_size)
+
+        for rows in db.execute(statement).partitions():
+            user_ids, ad_ids, activity_types, timestamps = zip(*rows)
+            yield (
+                np.fromiter(user_ids, dtype=np.int64, count=len(rows)),
+                np.fromiter(ad_ids, dtype=np.int64, count=len(rows)),
+                self.compute_weights(activity_types, timestamps, current_time)
+            )
+
+    def load_training_arrays(
+        self,
+        db: Session,
+        chunk_size: Optional[int] = None,
+        after_id: Optional[int] = None,
+        through_id: Optional[int] = None,
+        since: Optional[datetime] = None
+    ) -> TrainingArrays:
+        """Stream activities (all, an id range, or those since a time) into preallocated training arrays."""
+        capacity = db.execute(
+            self._activity_range(select(func.count(UserActivity.id)), after_id, through_id, since)
+        ).scalar() or 0
+        users = np.empty(capacity, dtype=np.int64)
+        ads = np.empty(capacity, dtype=np.int64)
+        weights = np.empty(capacity, dtype=np.float32)
+
+        size = 0
+        chunks = self.stream_training_data(db, chunk_size, after_id=after_id, through_id=through_id, since=since)
+        for chunk_users, chunk_ads, chunk_weights in chunks:
+            end = size + len(chunk_users)
+            if end > capacity:
+                # Rows were inserted after the count; grow geometrically
+                capacity = max(end, capacity * 2)
+                users, ads, weights = (np.resize(column, capacity) for column in (users, ads, weights))
+            users[size:end] = chunk_users
+            ads[size:end] = chunk_ads
+            weights[size:end] = chunk_weights
+            size = end
+
+        return users[:size], ads[:size], weights[:size]
+
+    def aggregate_user_activity(self, user_ids, type_codes, timestamps, prices) -> UserAggregates:
+        """Per-user partial aggregates of one batch of activity columns."""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        type_codes = np.asarray(type_codes, dtype=np.int64)
+        stamps = np.asarray(timestamps, dtype="datetime64[us]").astype(np.int64)
+        sums = np.zeros((len(user_ids), UNKNOWN_ACTIVITY + 2), dtype=np.float64)
+        sums[np.arange(len(user_ids)), type_codes] = 1.0
+        # Only purchases count towards spend; ads without a price count as 0
+        sums[:, -1] = np.where(type_codes == PURCHASE, np.nan_to_num(np.asarray(prices, dtype=np.float64)), 0.0)
+        return group_by_user(user_ids, sums, stamps, stamps)
+
+    def user_feature_matrix(self, aggregates: UserAggregates) -> Tuple[np.ndarray, np.ndarray]:
+        """(user ids, users x USER_FEATURES matrix) from aggregates."""
+        users, sums, firsts, lasts = aggregates
+        counts = sums[:, :UNKNOWN_ACTIVITY + 1]
+        # Whole days covered, as `.days + 1` of the per-row version
+        time_span = (lasts - firsts) // ONE_DAY_US + 1
+        frequency = counts.sum(axis=1) / time_span
+        return users, np.column_stack([counts[:, :UNKNOWN_ACTIVITY], sums[:, -1], frequency])
+
+    def extract_features_batch(self, user_ids, activity_types, timestamps, prices) -> Tuple[np.ndarray, np.ndarray]:
+        """Features of every user in the given activity columns at once."""
+        if len(user_ids) == 0:
+            return np.empty(0, dtype=np.int64), np.zeros((0, len(USER_FEATURES)))
+        return self.user_feature_matrix(self.aggregate_user_activity(
+            user_ids, self.encode_activity_types(activity_types), timestamps, prices
+        ))
+
+    def load_user_features(self, db: Session, chunk_size: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Features of every user with activity, read straight from the database.
+
+        Prices come from an outer join, so no Ad objects are loaded, and each
+        chunk is reduced to per-user partials before the next one is read.
+        """
+        chunk_size = chunk_size or settings.TRAINING_CHUNK_SIZE
+        statement = select(
+            UserActivity.user_id,
+            UserActivity.activity_type,
+            UserActivity.timestamp,
+            Ad.price
+        ).outerjoin(Ad, Ad.id == UserActivity.ad_id).execution_options(yield_per=chunk_size)
+
+        partials = []
+        for rows in db.execute(statement).partitions():
+            user_ids, activity_types, timestamps, prices = zip(*rows)
+            prices = np.array([np.nan if price is None else price for price in prices], dtype=np.float64)
+            partials.append(self.aggregate_user_activity(
+                user_ids, self.encode_activity_types(activity_types), timestamps, prices
             ))
-        
-        return training_data
-    
+        if not partials:
+            return np.empty(0, dtype=np.int64), np.zeros((0, len(USER_FEATURES)))
+        users, sums, firsts, lasts = (np.concatenate(parts) for parts in zip(*partials))
+        return self.user_feature_matrix(group_by_user(users, sums, firsts, lasts))
+
     def extract_user_features(self, activities: List[UserActivity]) -> np.ndarray:
         """Extract user features based on their activity patterns."""
-        features = {
-            "view_count": 0,
-            "click_count": 0,
-            "save_count": 0,
-            "purchase_count": 0,
-            "total_spent": 0.0,
-            "activity_frequency": 0.0
-        }
-        
         if not activities:
-            return np.zeros(len(features))
-        
-        # Calculate time span
-        timestamps = [a.timestamp for a in activities]
-        time_span = (max(timestamps) - min(timestamps)).days + 1
-        
-        for activity in activities:
-            if activity.activity_type == "view":
-                features["view_count"] += 1
-            elif activity.activity_type == "click":
-                features["click_count"] += 1
-            elif activity.activity_type == "save":
-                features["save_count"] += 1
-            elif activity.activity_type == "purchase":
-                features["purchase_count"] += 1
-                features["total_spent"] += activity.ad.price if activity.ad else 0
-        
-        # Calculate activity frequency (activities per day)
-        features["activity_frequency"] = len(activities) / time_span if time_span > 0 else 0
+            return np.zeros(len(USER_FEATURES))
         
-        return np.array(list(features.values()))
\ No newline at end of file
+        _, features = self.extract_features_batch(
+            np.zeros(len(activities), dtype=np.int64),
+            [a.activity_type for a in activities],
+            [a.timestamp for a in activities],
+            # Only purchases touch the ad relationship, as before
+            [a.ad.price if a.activity_type == "purchase" and a.ad else 0.0 for a in activities]
+        )
+        return features[0]
@@ -0,0 +1,345 @@
+import logging
+import multiprocessing
+import threading
+import time
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Callable, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.core.recommendation.embedding_store import EmbeddingStore, embedding_store
+from app.core.recommendation.snapshot import ModelSnapshot, add_cold_start_ads, model_registry
+from app.core.recommendation.training import ModelTrainer
+from app.db.models.training_jobs import TrainingJob
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+class TrainingJobQueue:
+    """Training runs persisted in the training_jobs table.
+
+    Triggers are deduplicated: while a job is queued, every further trigger
+    returns that job, and while one is running a trigger without `force`
+    returns the running job. `force` queues a full rebuild behind it.
+
+    A running job is leased: its worker renews `heartbeat_at`, and a job
+    not renewed within `lease` seconds (the worker was terminated or
+    crashed) is marked failed the next time a job is submitted or claimed.
+    """
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal, lease: Optional[float] = None):
+        self.session_factory = session_factory
+        self.lease = lease if lease is not None else settings.TRAINING_JOB_LEASE
+        self._lock = threading.Lock()
+
+    def _find(self, db: Session, status: JobStatus) -> Optional[TrainingJob]:
+        return db.query(TrainingJob).filter(
+            TrainingJob.status == status.value
+        ).order_by(TrainingJob.id).first()
+
+    def submit(self, db: Session, force: bool = False) -> Tuple[TrainingJob, bool]:
+        """Queue a run; returns the job and whether a new one was created."""
+        with self._lock:
+            self.expire_abandoned(db)
+            queued = self._find(db, JobStatus.QUEUED)
+            if queued is None and not force:
+                queued = self._find(db, JobStatus.RUNNING)
+            if queued is not None:
+                if force and queued.status == JobStatus.QUEUED.value and not queued.force:
+                    queued.force = True
+                    db.commit()
+                return queued, False
+
+            job = TrainingJob(status=JobStatus.QUEUED.value, force=force)
+            db.add(job)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another process queued a job first; the partial unique index caught it
+                db.rollback()
+                return self._find(db, JobStatus.QUEUED), False
+            db.refresh(job)
+            return job, True
+
+    def get(self, db: Session, job_id: int) -> Optional[TrainingJob]:
+        return db.get(TrainingJob, job_id)
+
+    def latest(self, db: Session, status: Optional[JobStatus] = None) -> Optional[TrainingJob]:
+        query = db.query(TrainingJob)
+        if status is not None:
+            query = query.filter(TrainingJob.status == status.value)
+        return query.order_by(TrainingJob.id.desc()).first()
+
+    def expire_abandoned(self, db: Session) -> int:
+        """Fail running jobs whose lease ran out; returns how many."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lease)
+        expired = db.query(TrainingJob).filter(
+            TrainingJob.status == JobStatus.RUNNING.value,
+            func.coalesce(TrainingJob.heartbeat_at, TrainingJob.started_at) < cutoff
+        ).update(
+            {
+                "status": JobStatus.FAILED.value,
+                "finished_at": datetime.utcnow(),
+                "error_message": "Training worker stopped without finishing the job"
+            },
+            synchronize_session=False
+        )
+        db.commit()
+        if expired:
+            logger.warning("Failed %d training job(s) whose worker stopped renewing the lease", expired)
+        return expired
+
+    def claim_next(self, db: Session) -> Optional[TrainingJob]:
+        """Atomically move the oldest queued job to running."""
+        self.expire_abandoned(db)
+        job = self._find(db, JobStatus.QUEUED)
+        if job is None:
+            return None
+        now = datetime.utcnow()
+        claimed = db.query(TrainingJob).filter(
+            TrainingJob.id == job.id,
+            TrainingJob.status == JobStatus.QUEUED.value
+        ).update(
+            {"status": JobStatus.RUNNING.value, "started_at": now, "heartbeat_at": now},
+            synchronize_session=False
+        )
+        db.commit()
+        if not claimed:
+            return None
+        db.refresh(job)
+        return job
+
+    def _update(self, job_id: int, **values):
+        # Separate session: the training session may be mid-transaction
+        with self.session_factory() as db:
+            db.query(TrainingJob).filter(TrainingJob.id == job_id).update(values, synchronize_session=False)
+            db.commit()
+
+    def update_progress(self, job_id: int, progress: dict):
+        self._update(job_id, progress=progress)
+
+    def heartbeat(self, job_id: int):
+        """Renew a running job's lease."""
+        with self.session_factory() as db:
+            db.query(TrainingJob).filter(
+                TrainingJob.id == job_id,
+                TrainingJob.status == JobStatus.RUNNING.value
+            ).update({"heartbeat_at": datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+
+    def finish(self, job_id: int, trainer: ModelTrainer):
+        self._update(
+            job_id,
+            status=JobStatus.DONE.value,
+            finished_at=datetime.utcnow(),
+            mode=trainer.mode,
+            sample_count=trainer.sample_count,
+            # The job id doubles as the model version, so every process agrees on it
+            model_version=job_id if trainer.sample_count else None,
+            progress=trainer.progress
+        )
+
+    def fail(self, job_id: int, error: str):
+        self._update(
+            job_id,
+            status=JobStatus.FAILED.value,
+            finished_at=datetime.utcnow(),
+            error_message=error
+        )
+
+class TrainingWorker:
+    """Claims queued jobs and runs them with a long-lived ModelTrainer."""
+    def __init__(
+        self,
+        queue: TrainingJobQueue,
+        trainer: ModelTrainer,
+        poll_interval: Optional[float] = None,
+        heartbeat_interval: Optional[float] = None
+    ):
+        self.queue = queue
+        self.trainer = trainer
+        self.poll_interval = poll_interval or settings.TRAINING_POLL_INTERVAL
+        self.heartbeat_interval = heartbeat_interval or settings.TRAINING_HEARTBEAT_INTERVAL
+        self.wakeup = threading.Event()
+
+    def run_next(self) -> Optional[int]:
+        """Run the oldest queued job, if any; returns its id."""
+        with self.queue.session_factory() as db:
+            job = self.queue.claim_next(db)
+            if job is None:
+                return None
+
+            self.trainer.progress_listener = self._throttled_progress(job.id)
+            done = threading.Event()
+            threading.Thread(
+                target=self._renew_lease, args=(job.id, done), name="training-heartbeat", daemon=True
+            ).start()
+            try:
+                self.trainer.train_model(
+                    db,
+                    incremental=False if job.force else None,
+                    version=job.id
+                )
+            except Exception as e:
+                db.rollback()
+                logger.exception("Training job %s failed", job.id)
+                self.queue.fail(job.id, str(e))
+            else:
+                self.queue.finish(job.id, self.trainer)
+            finally:
+                done.set()
+                self.trainer.progress_listener = None
+            return job.id
+
+    def _renew_lease(self, job_id: int, done: threading.Event):
+        # On its own thread, so the lease holds through long reads and epochs
+        while not done.wait(self.heartbeat_interval):
+            try:
+                self.queue.heartbeat(job_id)
+            except Exception:
+                logger.exception("Renewing the lease of training job %s failed", job_id)
+
+    def _throttled_progress(self, job_id: int, interval: float = 1.0):
+        last = [0.0]
+        def listener(progress: dict):
+            now = time.monotonic()
+            if now - last[0] >= interval:
+                last[0] = now
+                self.queue.update_progress(job_id, progress)
+        return listener
+
+    def run_forever(self, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                if self.run_next() is not None:
+                    continue
+            except Exception:
+                logger.exception("Training worker loop error")
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+def run_worker_process():
+    """Entry point of a training process: train and write back, never serve."""
+    worker = TrainingWorker(TrainingJobQueue(), ModelTrainer(registry=None))
+    worker.run_forever(threading.Event())
+
+class TrainingJobRunner:
+    """Starts the worker the way TRAINING_WORKER_MODE asks for.
+
+    external: nothing; run one `python -m app.worker` per deployment
+    process:  a spawned child process, so training never competes with the API for the GIL.
+              Every API worker spawns its own, each holding a model, so use it only
+              with a single API worker
+    thread:   a daemon thread in this process (development and tests)
+    """
+    def __init__(self, queue: TrainingJobQueue, mode: Optional[str] = None):
+        self.queue = queue
+        self.mode = mode or settings.TRAINING_WORKER_MODE
+        self._stop = threading.Event()
+        self._worker: Optional[TrainingWorker] = None
+        self._handle = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        with self._lock:
+            if self._handle is not None and self._handle.is_alive():
+                if self._worker is not None:
+                    self._worker.wakeup.set()
+                return
+            if self.mode == "process":
+                self._handle = multiprocessing.get_context("spawn").Process(
+                    target=run_worker_process, name="training-worker", daemon=True
+                )
+            elif self.mode == "thread":
+                self._worker = TrainingWorker(self.queue, ModelTrainer())
+                self._handle = threading.Thread(
+                    target=self._worker.run_forever, args=(self._stop,), name="training-worker", daemon=True
+                )
+            else:
+                return
+            self._handle.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.wakeup.set()
+        if isinstance(self._handle, multiprocessing.process.BaseProcess) and self._handle.is_alive():
+            self._handle.terminate()
+        if self._handle is not None:
+            self._handle.join(timeout)
+
+class SnapshotRefresher:
+    """Loads models trained in other processes into this process's registry.
+
+    Checks at most every `interval` seconds, on a background thread, so
+    requests never wait for the check or the load. With an embedding store
+    the check is a readlink and the load maps the file; without one it
+    queries the job table and reads every embedding from the database.
+    """
+    def __init__(
+        self,
+        queue: TrainingJobQueue,
+        registry=model_registry,
+        interval: Optional[float] = None,
+        store: Optional[EmbeddingStore] = embedding_store
+    ):
+        self.queue = queue
+        self.registry = registry
+        self.interval = interval if interval is not None else settings.SNAPSHOT_REFRESH_INTERVAL
+        self.store = store if store is not None and store.enabled else None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def maybe_refresh(self):
+        now = time.monotonic()
+        if now - self._last_check < self.interval or not self._lock.acquire(blocking=False):
+            return
+        self._last_check = now
+        threading.Thread(target=self._refresh_locked, daemon=True).start()
+
+    def _refresh_locked(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Snapshot refresh failed")
+        finally:
+            self._lock.release()
+
+    def refresh(self) -> bool:
+        if self.store is not None:
+            return self._refresh_from_store()
+        with self.queue.session_factory() as db:
+            job = db.query(TrainingJob).filter(
+                TrainingJob.status == JobStatus.DONE.value,
+                TrainingJob.model_version.isnot(None)
+            ).order_by(TrainingJob.model_version.desc()).first()
+            if job is None or (self.registry.version or 0) >= job.model_version:
+                return False
+            snapshot = ModelSnapshot.from_database(db, job.model_version)
+            if snapshot is None:
+                return False
+            add_cold_start_ads(db, snapshot)
+            return self.registry.publish(snapshot)
+
+    def _refresh_from_store(self) -> bool:
+        version = self.store.current_version()
+        if version is None or (self.registry.version or 0) >= version:
+            return False
+        snapshot = self.store.load(version)
+        if snapshot is None:
+            return False
+        # Ads created since the file was written; ids and categories only
+        with self.queue.session_factory() as db:
+            add_cold_start_ads(db, snapshot)
+        return self.registry.publish(snapshot)
+
+training_jobs = TrainingJobQueue()
+training_runner = TrainingJobRunner(training_jobs)
+snapshot_refresher = SnapshotRefresher(training_jobs)
@@ -0,0 +1,217 @@
+"""Every trained user's top-K ads, computed offline after training and served by primary key.
+
+Usage (backfill for the latest trained model):
+    python -m app.core.recommendation.materialize [--block-size 1024] [--threads 0]
+
+The trainer runs this stage after each successful run. Rows carry the
+model version they were computed with, so serving ignores them until that
+version is live and falls back to online retrieval for users without a
+row (new users), for filtered queries, and while a run is being written.
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, Optional, Tuple
+import numpy as np
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.core.recommendation.pipeline import Candidates
+from app.core.recommendation.snapshot import ModelSnapshot
+from app.db.models.user_recommendations import UserRecommendation
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[str, int, int], None]
+
+# Cap on one block's (users x items) score matrix, so a thread never holds more than 64 MB of it
+MAX_BLOCK_SCORES = 16 * 1024 * 1024
+
+def materialized_k() -> int:
+    """Enough candidates for the pipeline's retrieval stage at any allowed limit."""
+    return max(settings.PIPELINE_CANDIDATES, settings.MAX_RECOMMENDATIONS)
+
+def encode_top_k(ad_ids: np.ndarray, scores: np.ndarray) -> Tuple[bytes, bytes]:
+    return np.asarray(ad_ids, dtype="<i4").tobytes(), np.asarray(scores, dtype="<f4").tobytes()
+
+def decode_top_k(ad_ids: bytes, scores: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    return np.frombuffer(ad_ids, dtype="<i4").astype(np.int64), np.frombuffer(scores, dtype="<f4")
+
+class TopKMaterializer:
+    """Scores all users of a snapshot in blocks on a thread pool and rewrites user_recommendations.
+
+    Each block is one GEMM against the snapshot's normalized item matrix
+    and one argpartition, both of which release the GIL, so blocks run in
+    parallel while the calling thread writes finished ones in order.
+    Scoring is exact, whichever candidate index serves online requests.
+    """
+    def __init__(self, top_k: Optional[int] = None, block_size: Optional[int] = None, threads: Optional[int] = None):
+        self.top_k = top_k or materialized_k()
+        self.block_size = block_size or settings.MATERIALIZE_BLOCK_SIZE
+        self.threads = threads or settings.MATERIALIZE_THREADS or os.cpu_count() or 1
+
+    def compute(self, snapshot: ModelSnapshot) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """(user ids, ad ids, scores) per block, in user order; the last two are (users, k)."""
+        engine = snapshot.engine
+        user_ids = snapshot.user_ids
+        block_size = max(1, min(self.block_size, MAX_BLOCK_SCORES // max(1, len(engine))))
+
+        def score_block(start: int):
+            ids, scores = engine.top_k(snapshot.user_embeddings[start:start + block_size], self.top_k)
+            return user_ids[start:start + block_size], ids, scores
+
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="materialize") as pool:
+            pending = deque()
+            for start in range(0, len(user_ids), block_size):
+                pending.append(pool.submit(score_block, start))
+                # Finished blocks are small, but do not let the writer fall arbitrarily far behind
+                if len(pending) >= 2 * self.threads:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def run(self, db: Session, snapshot: ModelSnapshot, progress: Optional[ProgressCallback] = None) -> Dict:
+        """Replace user_recommendations with `snapshot`'s top-K for every user; returns timing stats."""
+        started = time.perf_counter()
+        total = len(snapshot.user_ids)
+        item_ids = snapshot.engine.item_ids
+        max_ad_id = int(item_ids.max()) if len(item_ids) else 0
+
+        # Old rows are useless once this version is live; serving falls back until the new ones land
+        db.execute(delete(UserRecommendation))
+        db.commit()
+
+        done, write_seconds = 0, 0.0
+        if progress:
+            progress("materialize", 0, total)
+        for user_ids, ad_ids, scores in self.compute(snapshot):
+            write_started = time.perf_counter()
+            rows = []
+            for user_id, user_ad_ids, user_scores in zip(user_ids.tolist(), ad_ids, scores):
+                ad_blob, score_blob = encode_top_k(user_ad_ids, user_scores)
+                rows.append({
+                    "user_id": user_id,
+                    "model_version": snapshot.version,
+                    "ad_ids": ad_blob,
+                    "scores": score_blob,
+                    "max_ad_id": max_ad_id
+                })
+            db.execute(insert(UserRecommendation), rows)
+            db.commit()
+            write_seconds += time.perf_counter() - write_started
+            done += len(rows)
+            if progress:
+                progress("materialize", done, total)
+
+        seconds = time.perf_counter() - started
+        stats = {
+            "model_version": snapshot.version,
+            "users": done,
+            "items": len(item_ids),
+            "top_k": self.top_k,
+            "threads": self.threads,
+            "seconds": seconds,
+            "write_seconds": write_seconds,
+            "users_per_second": done / seconds if seconds else 0.0
+        }
+        logger.info(
+            "Materialized top-%d for %d users x %d ads in %.2fs (%.0f users/s, %.2fs writing)",
+            self.top_k, done, len(item_ids), seconds, stats["users_per_second"], write_seconds
+        )
+        return stats
+
+class PrecomputedRecommendations:
+    """Serving side of user_recommendations: one primary-key read per request.
+
+    Ads created after the table was computed are scored for the user on the
+    spot and merged in, so they are not hidden until the next training run.
+    """
+    def __init__(self, enabled: Optional[bool] = None):
+        self.enabled = settings.MATERIALIZE_RECOMMENDATIONS if enabled is None else enabled
+        # (engine, max_ad_id, engine rows of the ads newer than max_ad_id)
+        self._fresh = None
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stale": 0, "merged": 0}
+
+    def get(self, db: Session, snapshot: ModelSnapshot, user_id: int) -> Optional[Candidates]:
+        """The user's stored candidates under `snapshot`'s version, or None to score online."""
+        if not self.enabled:
+            return None
+        row = db.execute(select(
+            UserRecommendation.model_version,
+            UserRecommendation.ad_ids,
+            UserRecommendation.scores,
+            UserRecommendation.max_ad_id
+        ).where(UserRecommendation.user_id == user_id)).first()
+        if row is None or row.model_version != snapshot.version:
+            self._count("misses" if row is None else "stale")
+            return None
+
+        ad_ids, scores = decode_top_k(row.ad_ids, row.scores)
+        engine = snapshot.engine
+        fresh = self._fresh_rows(engine, row.max_ad_id)
+        if len(fresh):
+            extra = engine.recommend_rows(snapshot.get_user_embeddings([user_id]), fresh, top_k=len(ad_ids))[0]
+            ad_ids = np.concatenate([ad_ids, np.array([ad_id for ad_id, _ in extra], dtype=np.int64)])
+            scores = np.concatenate([scores, np.array([score for _, score in extra], dtype=np.float32)])
+            order = np.argsort(-scores, kind="stable")[:len(ad_ids) - len(extra)]
+            ad_ids, scores = ad_ids[order], scores[order]
+            self._count("merged")
+        self._count("hits")
+        return Candidates(ad_ids, scores)
+
+    def _fresh_rows(self, engine, max_ad_id: int) -> np.ndarray:
+        fresh = self._fresh
+        if fresh is None or fresh[0] is not engine or fresh[1] != max_ad_id:
+            # Once per engine (i.e. per ad created), not per request
+            fresh = (engine, max_ad_id, np.flatnonzero(engine.item_ids > max_ad_id))
+            self._fresh = fresh
+        return fresh[2]
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"] + counters["stale"]
+        return {**counters, "enabled": self.enabled, "hit_rate": counters["hits"] / lookups if lookups else 0.0}
+
+precomputed_recommendations = PrecomputedRecommendations()
+
+def main():
+    from app.core.recommendation.jobs import JobStatus
+    from app.core.recommendation.snapshot import add_cold_start_ads
+    from app.db.models import users  # noqa: F401  (registers the tables the foreign keys point at)
+    from app.db.models.training_jobs import TrainingJob
+    from app.db.session import Base, SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--block-size", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        version = db.query(TrainingJob.model_version).filter(
+            TrainingJob.status == JobStatus.DONE.value,
+            TrainingJob.model_version.isnot(None)
+        ).order_by(TrainingJob.model_version.desc()).limit(1).scalar()
+        snapshot = ModelSnapshot.from_database(db, version) if version is not None else None
+        if snapshot is None:
+            print("no trained model to materialize")
+            return
+        add_cold_start_ads(db, snapshot)
+        stats = TopKMaterializer(block_size=args.block_size, threads=args.threads).run(db, snapshot)
+    print(
+        f"top-{stats['top_k']} for {stats['users']:,} users x {stats['items']:,} ads in {stats['seconds']:.2f}s "
+        f"({stats['users_per_second']:,.0f} users/s, {stats['threads']} threads, {stats['write_seconds']:.2f}s writing)"
+    )
+
+if __name__ == "__main__":
+    main()
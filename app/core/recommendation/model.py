@@ -1,10 +1,15 @@
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from typing import List, Tuple
-import json
+from typing import Callable, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
+import copy
+import os
+import threading
+from app.config import settings
+from app.core.recommendation.scoring import ScoringEngine
+from app.db.types import encode_embedding
 
 class RecommenderModel(nn.Module):
     def __init__(self, n_users: int, n_items: int, embedding_dim: int):
@@ -17,62 +22,228 @@ class RecommenderModel(nn.Module):
     def forward(self, user_ids: torch.Tensor, item_ids: torch.Tensor) -> torch.Tensor:
         user_embeds = self.user_embeddings(user_ids)
         item_embeds = self.item_embeddings(item_ids)
-        user_bias = self.user_bias(user_ids).squeeze()
-        item_bias = self.item_bias(item_ids).squeeze()
+        user_bias = self.user_bias(user_ids).squeeze(-1)
+        item_bias = self.item_bias(item_ids).squeeze(-1)
         
         dot_product = torch.sum(user_embeds * item_embeds, dim=1)
         return dot_product + user_bias + item_bias
+    
+    def grown(self, n_users: int, n_items: int) -> "RecommenderModel":
+        """A larger copy of this model: existing rows keep their learned values."""
+        model = RecommenderModel(n_users, n_items, self.user_embeddings.embedding_dim)
+        with torch.no_grad():
+            for name in ("user_embeddings", "user_bias", "item_embeddings", "item_bias"):
+                old = getattr(self, name).weight
+                getattr(model, name).weight[:old.shape[0]] = old
+        return model
+
+class InteractionBatches:
+    """DataLoader-style iterator yielding shuffled mini-batches of preallocated tensors.
+
+    Batches are gathered with one index_select per tensor instead of the
+    per-sample indexing and collation a torch DataLoader would do.
+    """
+    def __init__(self, tensors: Tuple[torch.Tensor, ...], batch_size: int, shuffle: bool = True, generator=None):
+        self.tensors = tensors
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.generator = generator
+        self.size = len(tensors[0])
+    
+    def __len__(self) -> int:
+        return (self.size + self.batch_size - 1) // self.batch_size
+    
+    def __iter__(self) -> Iterator[Tuple[torch.Tensor, ...]]:
+        if self.shuffle:
+            order = torch.randperm(self.size, generator=self.generator)
+        else:
+            order = torch.arange(self.size)
+        for start in range(0, self.size, self.batch_size):
+            idx = order[start:start + self.batch_size]
+            yield tuple(tensor.index_select(0, idx) for tensor in self.tensors)
+
+@contextmanager
+def torch_threads(num_threads: int):
+    """Cap intra-op threads for a training run, leaving cores for the API workers."""
+    previous = torch.get_num_threads()
+    torch.set_num_threads(max(1, num_threads or (os.cpu_count() or 2) // 2))
+    try:
+        yield
+    finally:
+        torch.set_num_threads(previous)
+
+EpochCallback = Callable[[int, int, float, Optional[float]], None]
 
 class AdsRecommender:
-    def __init__(self, embedding_size: int = 64):
-        self.embedding_size = embedding_size
+    def __init__(self, embedding_size: Optional[int] = None, learning_rate: Optional[float] = None):
+        self.embedding_size = embedding_size or settings.EMBEDDING_SIZE
+        self.learning_rate = learning_rate or settings.LEARNING_RATE
         self.model = None
         self.user_map = {}
         self.item_map = {}
+        # Held while weights change so snapshots never copy a half-trained model
+        self.lock = threading.RLock()
+        self._engine = None
+        self.history = []
+        self.best_epoch = None
+        
+    def _prepare_data(
+        self,
+        users: np.ndarray,
+        items: np.ndarray,
+        ratings: np.ndarray,
+        warm_start: bool = False
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        # Map users and items to consecutive indices; a warm start keeps existing ones
+        if not warm_start:
+            self.user_map = {}
+            self.item_map = {}
         
-    def _prepare_data(self, interactions: List[Tuple[int, int, float]]) -> torch.Tensor:
-        users, items, ratings = zip(*interactions)
         return (
-            torch.LongTensor(users),
-            torch.LongTensor(items),
-            torch.FloatTensor(ratings)
+            torch.from_numpy(self._index_ids(self.user_map, users)),
+            torch.from_numpy(self._index_ids(self.item_map, items)),
+            torch.from_numpy(np.asarray(ratings, dtype=np.float32))
         )
     
-    def train(self, interactions: List[Tuple[int, int, float]], epochs: int = 10):
-        # Map users and items to consecutive indices
-        unique_users = sorted(set(user for user, _, _ in interactions))
-        unique_items = sorted(set(item for _, item, _ in interactions))
-        
-        self.user_map = {user: idx for idx, user in enumerate(unique_users)}
-        self.item_map = {item: idx for idx, item in enumerate(unique_items)}
+    @staticmethod
+    def _index_ids(mapping: dict, ids: np.ndarray) -> np.ndarray:
+        """Row index for each id, appending ids `mapping` has not seen yet."""
+        unique, inverse = np.unique(ids, return_inverse=True)
+        for value in unique.tolist():
+            if value not in mapping:
+                mapping[value] = len(mapping)
+        rows = np.fromiter((mapping[value] for value in unique.tolist()), dtype=np.int64, count=len(unique))
+        return rows[inverse.ravel()]
+    
+    def train(self, interactions: List[Tuple[int, int, float]], epochs: Optional[int] = None, **options):
+        users, items, ratings = zip(*interactions)
+        self.train_arrays(np.asarray(users), np.asarray(items), np.asarray(ratings), epochs, **options)
+    
+    def train_arrays(
+        self,
+        users: np.ndarray,
+        items: np.ndarray,
+        ratings: np.ndarray,
+        epochs: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        validation_split: Optional[float] = None,
+        patience: Optional[int] = None,
+        num_threads: Optional[int] = None,
+        on_epoch: Optional[EpochCallback] = None,
+        warm_start: bool = False
+    ):
+        """Train from parallel arrays of user ids, ad ids and interaction weights.
+
+        With `warm_start`, the current model is fine-tuned on these interactions:
+        known users and ads keep their rows and learned weights, and the
+        embedding tables grow for new ones. Unset options fall back to the
+        TRAINING_* settings.
+        """
+        with self.lock, torch_threads(num_threads if num_threads is not None else settings.TRAINING_NUM_THREADS):
+            self._train(
+                users, items, ratings,
+                epochs=epochs or settings.TRAINING_EPOCHS,
+                batch_size=batch_size or settings.TRAINING_BATCH_SIZE,
+                validation_split=settings.VALIDATION_SPLIT if validation_split is None else validation_split,
+                patience=settings.EARLY_STOPPING_PATIENCE if patience is None else patience,
+                on_epoch=on_epoch,
+                warm_start=warm_start and self.model is not None
+            )
+            self._engine = None
+
+    def _split(self, tensors: Tuple[torch.Tensor, ...], validation_split: float, generator):
+        """Random held-out split; no validation set if it would be empty."""
+        size = len(tensors[0])
+        n_val = int(size * validation_split)
+        if n_val == 0 or n_val == size:
+            return tensors, None
+        order = torch.randperm(size, generator=generator)
+        val_idx, train_idx = order[:n_val], order[n_val:]
+        return (
+            tuple(tensor.index_select(0, train_idx) for tensor in tensors),
+            tuple(tensor.index_select(0, val_idx) for tensor in tensors)
+        )
+
+    def _train(
+        self,
+        users: np.ndarray,
+        items: np.ndarray,
+        ratings: np.ndarray,
+        epochs: int,
+        batch_size: int,
+        validation_split: float,
+        patience: int,
+        on_epoch: Optional[EpochCallback],
+        warm_start: bool
+    ):
+        tensors = self._prepare_data(users, items, ratings, warm_start)
         
         # Initialize model
-        self.model = RecommenderModel(
-            n_users=len(self.user_map),
-            n_items=len(self.item_map),
-            embedding_dim=self.embedding_size
-        )
+        if warm_start:
+            self.model = self.model.grown(len(self.user_map), len(self.item_map))
+        else:
+            self.model = RecommenderModel(
+                n_users=len(self.user_map),
+                n_items=len(self.item_map),
+                embedding_dim=self.embedding_size
+            )
         
-        # Prepare data
-        mapped_interactions = [
-            (self.user_map[user], self.item_map[item], rating)
-            for user, item, rating in interactions
-        ]
-        users, items, ratings = self._prepare_data(mapped_interactions)
+        generator = torch.Generator().manual_seed(0)
+        train_set, val_set = self._split(tensors, validation_split, generator)
+        batches = InteractionBatches(train_set, batch_size, generator=generator)
         
         # Training loop
-        optimizer = optim.Adam(self.model.parameters())
+        optimizer = optim.Adam(self.model.parameters(), lr=self.learning_rate)
         criterion = nn.MSELoss()
         
-        for epoch in range(epochs):
+        self.history = []
+        best_loss, best_state, stale_epochs = float("inf"), None, 0
+        for epoch in range(1, epochs + 1):
             self.model.train()
-            optimizer.zero_grad()
+            total_loss = 0.0
+            for batch_users, batch_items, batch_ratings in batches:
+                optimizer.zero_grad()
+                
+                predictions = self.model(batch_users, batch_items)
+                loss = criterion(predictions, batch_ratings)
+                
+                loss.backward()
+                optimizer.step()
+                total_loss += loss.item() * len(batch_users)
+            
+            train_loss = total_loss / batches.size
+            val_loss = None
+            if val_set is not None:
+                self.model.eval()
+                with torch.no_grad():
+                    val_loss = criterion(self.model(val_set[0], val_set[1]), val_set[2]).item()
             
-            predictions = self.model(users, items)
-            loss = criterion(predictions, ratings)
+            self.history.append({"epoch": epoch, "train_loss": train_loss, "val_loss": val_loss})
+            if on_epoch:
+                on_epoch(epoch, epochs, train_loss, val_loss)
             
-            loss.backward()
-            optimizer.step()
+            # Early stopping on held-out loss (training loss when there is no held-out set)
+            monitored = train_loss if val_loss is None else val_loss
+            if monitored < best_loss:
+                best_loss, stale_epochs = monitored, 0
+                best_state = copy.deepcopy(self.model.state_dict())
+                self.best_epoch = epoch
+            else:
+                stale_epochs += 1
+                if stale_epochs >= patience:
+                    break
+        
+        if best_state is not None:
+            self.model.load_state_dict(best_state)
+    
+    def export_embeddings(self) -> Tuple[List[int], np.ndarray, List[int], np.ndarray]:
+        """Copies of the user and item tables, with the id each row belongs to."""
+        with self.lock:
+            user_ids = sorted(self.user_map, key=self.user_map.get)
+            item_ids = sorted(self.item_map, key=self.item_map.get)
+            user_weights = self.model.user_embeddings.weight.detach().cpu().numpy().copy()
+            item_weights = self.model.item_embeddings.weight.detach().cpu().numpy().copy()
+            return user_ids, user_weights, item_ids, item_weights
     
     def get_user_embedding(self, user_id: int) -> np.ndarray:
         if user_id not in self.user_map:
@@ -92,19 +263,48 @@ class AdsRecommender:
             embedding = self.model.item_embeddings(item_idx)
             return embedding.numpy().squeeze()
     
-    def recommend(self, user_id: int, item_ids: List[int], top_k: int = 10) -> List[Tuple[int, float]]:
-        user_embedding = self.get_user_embedding(user_id)
-        item_embeddings = np.vstack([self.get_item_embedding(item_id) for item_id in item_ids])
-        
-        # Calculate similarities
-        similarities = cosine_similarity([user_embedding], item_embeddings)[0]
+    def get_user_embeddings(self, user_ids: List[int]) -> np.ndarray:
+        """Embeddings for many users at once; unknown users get zero rows."""
+        embeddings = np.zeros((len(user_ids), self.embedding_size), dtype=np.float32)
+        if self.model is None:
+            return embeddings
         
-        # Get top-k recommendations
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
-        recommendations = [(item_ids[idx], similarities[idx]) for idx in top_indices]
-        
-        return recommendations
+        rows = np.array([self.user_map.get(user_id, -1) for user_id in user_ids], dtype=np.int64)
+        known = rows >= 0
+        if known.any():
+            with torch.no_grad():
+                weights = self.model.user_embeddings.weight
+                embeddings[known] = weights[torch.from_numpy(rows[known])].numpy()
+        return embeddings
+    
+    def scoring_engine(self) -> Optional[ScoringEngine]:
+        """Item matrix for scoring, rebuilt lazily after each training run."""
+        if self.model is None:
+            return None
+        engine = self._engine
+        if engine is None:
+            with self.lock:
+                item_ids = sorted(self.item_map, key=self.item_map.get)
+                weights = self.model.item_embeddings.weight.detach().numpy()
+                engine = self._engine = ScoringEngine(item_ids, weights)
+        return engine
+    
+    def recommend_batch(
+        self,
+        user_ids: List[int],
+        item_ids: Optional[List[int]] = None,
+        top_k: int = 10
+    ) -> List[List[Tuple[int, float]]]:
+        """Score several users against the same items with one matrix product."""
+        engine = self.scoring_engine()
+        if engine is None:
+            item_ids = list(item_ids or [])[:top_k]
+            return [[(item_id, 0.0) for item_id in item_ids] for _ in user_ids]
+        return engine.recommend_batch(self.get_user_embeddings(user_ids), item_ids, top_k)
+    
+    def recommend(self, user_id: int, item_ids: List[int], top_k: int = 10) -> List[Tuple[int, float]]:
+        return self.recommend_batch([user_id], item_ids, top_k)[0]
 
-    def save_embeddings(self, user_id: int) -> str:
+    def save_embeddings(self, user_id: int) -> bytes:
         embedding = self.get_user_embedding(user_id)
-        return json.dumps(embedding.tolist())
\ No newline at end of file
+        return encode_embedding(embedding)
\ No newline at end of file
@@ -0,0 +1,258 @@
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+from app.config import settings
+from app.core.recommendation.batching import RecommendationBatcher, recommendation_batcher
+from app.core.recommendation.features import USER_FEATURES
+
+logger = logging.getLogger(__name__)
+
+_CLICK, _SAVE, _PURCHASE, _SPENT = (
+    USER_FEATURES.index(name) for name in ("click_count", "save_count", "purchase_count", "total_spent")
+)
+
+
+class RankingRequest:
+    """Everything one ranking needs, gathered by the caller before the pipeline runs."""
+    __slots__ = (
+        "snapshot", "catalog", "user_id", "limit", "candidate_rows", "user_features", "min_similarity", "retrieved"
+    )
+
+    def __init__(
+        self,
+        snapshot,
+        catalog,
+        user_id: int,
+        limit: int,
+        candidate_rows: Optional[np.ndarray] = None,
+        user_features: Optional[np.ndarray] = None,
+        min_similarity: float = 0.0,
+        retrieved: Optional["Candidates"] = None
+    ):
+        self.snapshot = snapshot
+        self.catalog = catalog
+        self.user_id = user_id
+        self.limit = limit
+        # Catalog rows the user may be shown; None means the whole catalog
+        self.candidate_rows = candidate_rows
+        # A USER_FEATURES row, or None when the pipeline does not need one
+        self.user_features = user_features
+        self.min_similarity = min_similarity
+        # Retrieval results computed ahead of time, e.g. materialized after training
+        self.retrieved = retrieved
+
+
+class Candidates:
+    """Parallel arrays over the ads still in the running, best first."""
+    __slots__ = ("ids", "similarity", "scores")
+
+    def __init__(self, ids: np.ndarray, similarity: np.ndarray, scores: Optional[np.ndarray] = None):
+        self.ids = ids
+        self.similarity = similarity
+        self.scores = similarity if scores is None else scores
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def take(self, positions: np.ndarray) -> "Candidates":
+        return Candidates(self.ids[positions], self.similarity[positions], self.scores[positions])
+
+    def to_list(self) -> List[Tuple[int, float]]:
+        return list(zip(self.ids.tolist(), self.scores.astype(float).tolist()))
+
+
+class Stage(ABC):
+    """One pipeline step with its own latency budget.
+
+    Optional stages improve the result but are not needed for a valid
+    one, so the pipeline skips them once the budget up to and including
+    them is already spent.
+    """
+    name = "stage"
+    optional = False
+    needs_user_features = False
+
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+
+    @abstractmethod
+    def run(self, request: RankingRequest, candidates: Optional[Candidates]) -> Candidates:
+        ...
+
+
+class EmbeddingRetrieval(Stage):
+    """Top-`size` ads by embedding similarity: ANN over the whole catalog, or exact over the allowed rows.
+
+    Precomputed candidates on the request are used as they are. Otherwise
+    whole-catalog lookups go through `batcher` when it is enabled, so
+    concurrent requests share one batched search.
+    """
+    name = "retrieval"
+
+    def __init__(self, budget_ms: float, size: int, batcher: Optional[RecommendationBatcher] = None):
+        super().__init__(budget_ms)
+        self.size = size
+        self.batcher = batcher
+
+    def run(self, request: RankingRequest, candidates: Optional[Candidates]) -> Candidates:
+        size = max(self.size, request.limit)
+        if request.retrieved is not None:
+            return request.retrieved.take(np.arange(min(size, len(request.retrieved))))
+        if request.candidate_rows is None and self.batcher is not None and self.batcher.enabled:
+            ranked = self.batcher.recommend(request.snapshot, request.user_id, size)
+        elif request.candidate_rows is None:
+            ranked = request.snapshot.recommend(request.user_id, top_k=size)
+        else:
+            ranked = request.snapshot.recommend_among(
+                request.user_id, request.catalog, request.candidate_rows, top_k=size
+            )
+        return Candidates(
+            np.fromiter((ad_id for ad_id, _ in ranked), dtype=np.int64, count=len(ranked)),
+            np.fromiter((score for _, score in ranked), dtype=np.float32, count=len(ranked))
+        )
+
+
+class LogisticReranker(Stage):
+    """Logistic score over a few features per candidate, computed for the whole batch at once.
+
+    Features are the embedding similarity, how far the ad's log price is
+    from what the user usually pays (0 without purchases), and similarity
+    scaled by how engaged the user is, so the model is trusted more for
+    active users. The default weights are hand-set; pass fitted ones to
+    replace them.
+    """
+    name = "rerank"
+    optional = True
+    needs_user_features = True
+    FEATURES = ("similarity", "price_gap", "engaged_similarity")
+    DEFAULT_WEIGHTS = {"similarity": 4.0, "price_gap": -1.0, "engaged_similarity": 0.5}
+    DEFAULT_BIAS = -2.0
+
+    def __init__(self, budget_ms: float, weights: Optional[Dict[str, float]] = None, bias: Optional[float] = None):
+        super().__init__(budget_ms)
+        weights = {**self.DEFAULT_WEIGHTS, **(weights or {})}
+        self.weights = np.array([weights[name] for name in self.FEATURES], dtype=np.float32)
+        self.bias = self.DEFAULT_BIAS if bias is None else bias
+
+    def feature_matrix(self, request: RankingRequest, candidates: Candidates) -> np.ndarray:
+        user = request.user_features if request.user_features is not None else np.zeros(len(USER_FEATURES))
+        catalog = request.catalog
+        rows = np.fromiter(
+            (-1 if row is None else row for row in map(catalog.row, candidates.ids.tolist())),
+            dtype=np.int64,
+            count=len(candidates)
+        )
+        prices = np.where(rows >= 0, catalog.prices[rows], np.nan)
+
+        features = np.zeros((len(candidates), len(self.FEATURES)), dtype=np.float32)
+        features[:, 0] = candidates.similarity
+        if user[_PURCHASE] > 0:
+            typical = np.log1p(user[_SPENT] / user[_PURCHASE])
+            features[:, 1] = np.nan_to_num(np.abs(np.log1p(np.maximum(prices, 0)) - typical))
+        features[:, 2] = candidates.similarity * np.log1p(user[_CLICK] + user[_SAVE] + user[_PURCHASE])
+        return features
+
+    def run(self, request: RankingRequest, candidates: Optional[Candidates]) -> Candidates:
+        if not len(candidates):
+            return candidates
+        logits = self.feature_matrix(request, candidates) @ self.weights + self.bias
+        scores = (1.0 / (1.0 + np.exp(-logits))).astype(np.float32)
+        order = np.argsort(-scores, kind="stable")
+        return Candidates(candidates.ids[order], candidates.similarity[order], scores[order])
+
+
+class BusinessRules(Stage):
+    """Drops weak matches, caps ads per category and cuts the list to the requested length."""
+    name = "rules"
+
+    def __init__(self, budget_ms: float, max_per_category: int = 0):
+        super().__init__(budget_ms)
+        self.max_per_category = max_per_category
+
+    def run(self, request: RankingRequest, candidates: Optional[Candidates]) -> Candidates:
+        # Users the model has never seen score 0 everywhere; the cutoff would hide everything
+        if request.user_id in request.snapshot.user_map:
+            candidates = candidates.take(np.flatnonzero(candidates.similarity >= request.min_similarity))
+        if self.max_per_category:
+            seen: Dict[Optional[str], int] = {}
+            keep = []
+            for position, ad_id in enumerate(candidates.ids.tolist()):
+                category = request.catalog.category_of(ad_id)
+                if seen.get(category, 0) < self.max_per_category:
+                    seen[category] = seen.get(category, 0) + 1
+                    keep.append(position)
+                    if len(keep) == request.limit:
+                        break
+            candidates = candidates.take(np.array(keep, dtype=np.int64))
+        return candidates.take(np.arange(min(request.limit, len(candidates))))
+
+
+class RankingPipeline:
+    """Retrieval, then optional re-ranking, then rules, each timed against its budget.
+
+    Stage timings are kept as running counters for /metrics; a stage that
+    overruns is counted and logged, never interrupted.
+    """
+    def __init__(self, stages: Sequence[Stage]):
+        self.stages = list(stages)
+        self._lock = threading.Lock()
+        self._stats = {
+            stage.name: {"runs": 0, "skipped": 0, "over_budget": 0, "total_ms": 0.0, "max_ms": 0.0, "budget_ms": stage.budget_ms}
+            for stage in self.stages
+        }
+
+    @classmethod
+    def from_settings(cls) -> "RankingPipeline":
+        stages = [EmbeddingRetrieval(
+            settings.PIPELINE_RETRIEVAL_BUDGET_MS, settings.PIPELINE_CANDIDATES, recommendation_batcher
+        )]
+        if settings.PIPELINE_RERANK:
+            stages.append(LogisticReranker(settings.PIPELINE_RERANK_BUDGET_MS))
+        stages.append(BusinessRules(settings.PIPELINE_RULES_BUDGET_MS, settings.PIPELINE_MAX_PER_CATEGORY))
+        return cls(stages)
+
+    @property
+    def needs_user_features(self) -> bool:
+        return any(stage.needs_user_features for stage in self.stages)
+
+    def run(self, request: RankingRequest) -> List[Tuple[int, float]]:
+        started = time.perf_counter()
+        allowed_ms = 0.0
+        candidates = None
+        for stage in self.stages:
+            allowed_ms += stage.budget_ms
+            if stage.optional and (time.perf_counter() - started) * 1000 > allowed_ms:
+                self._record(stage, None)
+                continue
+            stage_started = time.perf_counter()
+            candidates = stage.run(request, candidates)
+            self._record(stage, (time.perf_counter() - stage_started) * 1000)
+        return candidates.to_list()
+
+    def _record(self, stage: Stage, elapsed_ms: Optional[float]):
+        with self._lock:
+            stats = self._stats[stage.name]
+            if elapsed_ms is None:
+                stats["skipped"] += 1
+                return
+            stats["runs"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            over = elapsed_ms > stage.budget_ms
+            if over:
+                stats["over_budget"] += 1
+        if over:
+            logger.debug("Ranking stage %s took %.1f ms (budget %.1f ms)", stage.name, elapsed_ms, stage.budget_ms)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                name: {**stats, "avg_ms": stats["total_ms"] / stats["runs"] if stats["runs"] else 0.0}
+                for name, stats in self._stats.items()
+            }
+
+
+recommendation_pipeline = RankingPipeline.from_settings()
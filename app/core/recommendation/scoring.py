@@ -0,0 +1,204 @@
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize each row; all-zero rows stay zero so they score 0 everywhere."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    np.maximum(norms, np.finfo(np.float32).tiny, out=norms)
+    return vectors / norms
+
+
+def select_top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k best scores per row, best first.
+
+    Uses argpartition so only the selected k entries are fully sorted.
+    """
+    scores = np.atleast_2d(scores)
+    n = scores.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(n), (scores.shape[0], 1))
+
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class IdIndex:
+    """Read-only id -> row lookup over an id array, through a sort order instead of a dict.
+
+    Costs 8 bytes per id for the order (none when it is passed in, e.g.
+    memory-mapped from an embedding file) rather than a Python object per id.
+    """
+
+    def __init__(self, ids: Sequence[int], order: Optional[np.ndarray] = None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.order = np.argsort(self.ids, kind="stable") if order is None else np.asarray(order, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def __contains__(self, item_id) -> bool:
+        return self.get(item_id) is not None
+
+    def __getitem__(self, item_id) -> int:
+        row = self.get(item_id)
+        if row is None:
+            raise KeyError(item_id)
+        return row
+
+    def get(self, item_id, default=None):
+        row = int(self.rows([item_id])[0])
+        return default if row < 0 else row
+
+    def rows(self, ids: Sequence[int]) -> np.ndarray:
+        """Row of each id; -1 for ids not in the index."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(ids.shape, -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.ids, ids, sorter=self.order), len(self.ids) - 1)
+        rows = self.order[positions]
+        return np.where(self.ids[rows] == ids, rows, -1)
+
+
+class ScoringEngine:
+    """Cosine scoring against a contiguous, pre-normalized item-embedding matrix.
+
+    Items appended later go into a separate in-memory tail, so the base
+    matrix, which may be memory-mapped and shared between workers, is never
+    copied. Pass `normalized=True` when rows are already unit length.
+    """
+
+    def __init__(
+        self,
+        item_ids: Sequence[int],
+        item_embeddings: np.ndarray,
+        normalized: bool = False,
+        id_order: Optional[np.ndarray] = None
+    ):
+        if normalized:
+            base = np.asarray(item_embeddings, dtype=np.float32)
+        else:
+            base = normalize_rows(item_embeddings)
+            base.flags.writeable = False
+        self._init(np.asarray(item_ids, dtype=np.int64), [base], IdIndex(item_ids, id_order))
+
+    def _init(self, item_ids: np.ndarray, segments: List[np.ndarray], item_index: IdIndex):
+        self.item_ids = item_ids
+        self.item_index = item_index
+        # The base matrix, then at most one tail of appended items
+        self.segments = segments
+        self.embedding_size = segments[0].shape[1]
+
+    def __len__(self) -> int:
+        return len(self.item_ids)
+
+    @property
+    def item_matrix(self) -> np.ndarray:
+        """All item vectors as one array; copies once items have been appended."""
+        return self.segments[0] if len(self.segments) == 1 else np.vstack(self.segments)
+
+    def with_items(self, item_ids: Sequence[int], item_embeddings: np.ndarray) -> "ScoringEngine":
+        """A new engine with extra items appended; this one is left untouched."""
+        new = normalize_rows(item_embeddings)
+        tail = new if len(self.segments) == 1 else np.vstack([self.segments[1], new])
+        tail.flags.writeable = False
+        ids = np.concatenate([self.item_ids, np.asarray(item_ids, dtype=np.int64)])
+        engine = ScoringEngine.__new__(ScoringEngine)
+        engine._init(ids, [self.segments[0], tail], IdIndex(ids))
+        return engine
+
+    def rows_for(self, item_ids: Sequence[int]) -> np.ndarray:
+        """Matrix rows for `item_ids`; -1 marks items the model has never seen."""
+        return self.item_index.rows(item_ids)
+
+    def vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Normalized vectors of the given matrix rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(self.segments) == 1:
+            return self.segments[0][rows]
+        base, tail = self.segments
+        vectors = np.empty((len(rows), self.embedding_size), dtype=np.float32)
+        in_base = rows < len(base)
+        vectors[in_base] = base[rows[in_base]]
+        vectors[~in_base] = tail[rows[~in_base] - len(base)]
+        return vectors
+
+    def mean_vector(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        if rows is not None:
+            return self.vectors(rows).mean(axis=0)
+        total = sum(segment.sum(axis=0, dtype=np.float64) for segment in self.segments)
+        return (total / max(1, len(self))).astype(np.float32)
+
+    def score(self, user_vectors: np.ndarray, item_ids: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Cosine similarity of each user vector against the catalog (or `item_ids`).
+
+        Returns a (n_users, n_items) matrix computed with a single GEMM per
+        segment. Unknown items score 0, like an all-zero embedding would.
+        """
+        users = normalize_rows(np.atleast_2d(user_vectors))
+        if item_ids is None:
+            if len(self.segments) == 1:
+                return users @ self.segments[0].T
+            return np.hstack([users @ segment.T for segment in self.segments])
+
+        rows = self.rows_for(item_ids)
+        known = rows >= 0
+        scores = np.zeros((users.shape[0], len(rows)), dtype=np.float32)
+        if known.any():
+            scores[:, known] = users @ self.vectors(rows[known]).T
+        return scores
+
+    def top_k(self, user_vectors: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Item ids and scores of each user's top_k over the whole matrix, as (n_users, k) arrays."""
+        scores = self.score(user_vectors)
+        top = select_top_k(scores, top_k)
+        return self.item_ids[top], np.take_along_axis(scores, top, axis=1)
+
+    def recommend_batch(
+        self,
+        user_vectors: np.ndarray,
+        item_ids: Optional[Sequence[int]] = None,
+        top_k: int = 10
+    ) -> List[List[Tuple[int, float]]]:
+        scores = self.score(user_vectors, item_ids)
+        ids = self.item_ids if item_ids is None else np.asarray(item_ids, dtype=np.int64)
+        top = select_top_k(scores, top_k)
+        return [
+            [(int(ids[col]), float(row_scores[col])) for col in row_top]
+            for row_scores, row_top in zip(scores, top)
+        ]
+
+    def recommend_rows(
+        self,
+        user_vectors: np.ndarray,
+        rows: np.ndarray,
+        top_k: int = 10
+    ) -> List[List[Tuple[int, float]]]:
+        """Like recommend_batch, but only the given matrix rows are scored."""
+        rows = np.asarray(rows, dtype=np.int64)
+        scores = normalize_rows(np.atleast_2d(user_vectors)) @ self.vectors(rows).T
+        ids = self.item_ids[rows]
+        top = select_top_k(scores, top_k)
+        return [
+            [(int(ids[col]), float(row_scores[col])) for col in row_top]
+            for row_scores, row_top in zip(scores, top)
+        ]
+
+    def recommend(
+        self,
+        user_vector: np.ndarray,
+        item_ids: Optional[Sequence[int]] = None,
+        top_k: int = 10
+    ) -> List[Tuple[int, float]]:
+        return self.recommend_batch(user_vector[np.newaxis, :], item_ids, top_k)[0]
@@ -0,0 +1,213 @@
+import threading
+import numpy as np
+from collections import defaultdict
+from typing import Callable, List, Optional, Sequence, Tuple
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.db.models.ads import Ad
+from app.db.models.users import User
+from app.core.recommendation.ann import CandidateIndex, build_candidate_index
+from app.core.recommendation.scoring import IdIndex, ScoringEngine
+
+
+def _read_only(array) -> np.ndarray:
+    """A read-only float32 array: shared as is when it already is one (e.g. memory-mapped), else copied."""
+    if isinstance(array, np.ndarray) and array.dtype == np.float32 and not array.flags.writeable:
+        return array
+    array = np.array(array, dtype=np.float32)
+    array.flags.writeable = False
+    return array
+
+
+class ModelSnapshot:
+    """Immutable, versioned copy of trained embeddings used to serve requests.
+
+    The trained arrays never change. Ads created after training are appended
+    to the serving structures (`engine` and `index`) with a cold-start vector.
+
+    Read-only float32 arrays, such as the memory-mapped ones of an
+    EmbeddingStore file, are used without copying; with `normalized` the
+    item vectors are already unit length and the engine shares them too.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        user_ids: Sequence[int],
+        user_embeddings: np.ndarray,
+        item_ids: Sequence[int],
+        item_embeddings: np.ndarray,
+        created_at: Optional[datetime] = None,
+        normalized: bool = False,
+        index: Optional[CandidateIndex] = None,
+        user_order: Optional[np.ndarray] = None,
+        item_order: Optional[np.ndarray] = None
+    ):
+        self.version = version
+        self.created_at = created_at or datetime.utcnow()
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.user_map = IdIndex(self.user_ids, user_order)
+        self.item_map = IdIndex(self.item_ids, item_order)
+        # Snapshots are shared between request threads, so nothing may mutate them
+        self.user_embeddings = _read_only(user_embeddings)
+        self.item_embeddings = _read_only(item_embeddings)
+        self.embedding_size = self.item_embeddings.shape[1]
+        self.normalized = normalized
+        self.engine = ScoringEngine(self.item_ids, self.item_embeddings, normalized=normalized, id_order=item_order)
+        self.index = index or build_candidate_index(self.item_ids, self.item_embeddings, normalized=normalized)
+        self._lock = threading.Lock()
+        # (engine, catalog data, engine row of each catalog row), see recommend_among
+        self._alignment = None
+
+    @classmethod
+    def from_recommender(cls, recommender, version: int) -> "ModelSnapshot":
+        user_ids, user_embeddings, item_ids, item_embeddings = recommender.export_embeddings()
+        return cls(version, user_ids, user_embeddings, item_ids, item_embeddings)
+
+    @classmethod
+    def from_database(cls, db: Session, version: int) -> Optional["ModelSnapshot"]:
+        """Rebuild a snapshot from the embeddings a trainer wrote back to the database."""
+        user_ids, user_embeddings = _load_embeddings(db, User)
+        item_ids, item_embeddings = _load_embeddings(db, Ad)
+        if not item_ids:
+            return None
+        if not user_ids:
+            user_embeddings = np.zeros((0, item_embeddings.shape[1]), dtype=np.float32)
+        return cls(version, user_ids, user_embeddings, item_ids, item_embeddings)
+
+    def get_user_embedding(self, user_id: int) -> np.ndarray:
+        row = self.user_map.get(user_id)
+        if row is None:
+            return np.zeros(self.embedding_size, dtype=np.float32)
+        return self.user_embeddings[row]
+
+    def get_item_embedding(self, item_id: int) -> np.ndarray:
+        row = self.item_map.get(item_id)
+        if row is None:
+            return np.zeros(self.embedding_size, dtype=np.float32)
+        return self.item_embeddings[row]
+
+    def get_user_embeddings(self, user_ids: List[int]) -> np.ndarray:
+        rows = self.user_map.rows(user_ids)
+        embeddings = np.zeros((len(user_ids), self.embedding_size), dtype=np.float32)
+        known = rows >= 0
+        embeddings[known] = self.user_embeddings[rows[known]]
+        return embeddings
+
+    def recommend_batch(
+        self,
+        user_ids: List[int],
+        item_ids: Optional[List[int]] = None,
+        top_k: int = 10
+    ) -> List[List[Tuple[int, float]]]:
+        """Top-k items per user: from the ANN index, or exactly over `item_ids`."""
+        user_embeddings = self.get_user_embeddings(user_ids)
+        if item_ids is None:
+            return self.index.search(user_embeddings, top_k)
+        return self.engine.recommend_batch(user_embeddings, item_ids, top_k)
+
+    def recommend(self, user_id: int, item_ids: Optional[List[int]] = None, top_k: int = 10) -> List[Tuple[int, float]]:
+        return self.recommend_batch([user_id], item_ids, top_k)[0]
+
+    def recommend_among(self, user_id: int, catalog, catalog_rows: np.ndarray, top_k: int = 10) -> List[Tuple[int, float]]:
+        """Exact top-k restricted to some rows of an AdCatalog version; nothing else is scored."""
+        engine = self.engine
+        alignment = self._alignment
+        if alignment is None or alignment[0] is not engine or alignment[1] is not catalog:
+            # Once per model and catalog version, not per request
+            alignment = (engine, catalog, engine.rows_for(catalog.ids))
+            self._alignment = alignment
+        rows = alignment[2][catalog_rows]
+        rows = rows[rows >= 0]
+        return engine.recommend_rows(self.get_user_embeddings([user_id]), rows, top_k)[0]
+
+    def cold_start_embedding(self, peer_ids: List[int]) -> np.ndarray:
+        """Mean vector of the known `peer_ids`, or of the whole catalog if none are known."""
+        engine = self.engine
+        rows = engine.rows_for(peer_ids)
+        rows = rows[rows >= 0]
+        return engine.mean_vector(rows if len(rows) else None)
+
+    def add_items(self, item_ids: List[int], embeddings: np.ndarray):
+        """Make new items retrievable without retraining."""
+        with self._lock:
+            new = np.flatnonzero(self.engine.rows_for(item_ids) < 0).tolist()
+            if not new:
+                return
+            ids = [item_ids[row] for row in new]
+            vectors = np.atleast_2d(embeddings)[new]
+            self.engine = self.engine.with_items(ids, vectors)
+            self.index.add(ids, vectors)
+
+
+def _load_embeddings(db: Session, model, chunk_size: int = 10000) -> Tuple[List[int], Optional[np.ndarray]]:
+    statement = select(model.id, model.embedding).where(
+        model.embedding.isnot(None)
+    ).execution_options(yield_per=chunk_size)
+    ids, vectors = [], []
+    for row_id, embedding in db.execute(statement):
+        ids.append(row_id)
+        vectors.append(embedding)
+    return ids, (np.vstack(vectors) if vectors else None)
+
+
+def add_cold_start_ads(db: Session, snapshot: ModelSnapshot):
+    """Ads nobody has interacted with yet get their category's mean vector."""
+    ads_by_category = defaultdict(list)
+    for ad_id, category in db.query(Ad.id, Ad.category):
+        ads_by_category[category].append(ad_id)
+
+    new_ids, vectors = [], []
+    for ad_ids in ads_by_category.values():
+        missing = [ad_id for ad_id, row in zip(ad_ids, snapshot.engine.rows_for(ad_ids).tolist()) if row < 0]
+        if missing:
+            vector = snapshot.cold_start_embedding(ad_ids)
+            new_ids.extend(missing)
+            vectors.extend([vector] * len(missing))
+
+    if new_ids:
+        snapshot.add_items(new_ids, np.vstack(vectors))
+
+
+class ModelRegistry:
+    """Holds the snapshot currently being served and swaps it atomically."""
+
+    def __init__(self):
+        self._snapshot: Optional[ModelSnapshot] = None
+        self._version = 0
+        self._lock = threading.Lock()
+        self._subscribers: List[Callable[[ModelSnapshot], None]] = []
+
+    def subscribe(self, callback: Callable[[ModelSnapshot], None]):
+        """Call `callback(snapshot)` after every successful publish."""
+        self._subscribers.append(callback)
+
+    def current(self) -> Optional[ModelSnapshot]:
+        # A single attribute read; callers keep the reference for the whole request
+        return self._snapshot
+
+    @property
+    def version(self) -> Optional[int]:
+        snapshot = self._snapshot
+        return snapshot.version if snapshot else None
+
+    def next_version(self) -> int:
+        with self._lock:
+            self._version += 1
+            return self._version
+
+    def publish(self, snapshot: ModelSnapshot) -> bool:
+        """Serve `snapshot` from now on, unless a newer version is already live."""
+        with self._lock:
+            if self._snapshot is not None and snapshot.version <= self._snapshot.version:
+                return False
+            self._version = max(self._version, snapshot.version)
+            self._snapshot = snapshot
+        for callback in self._subscribers:
+            callback(snapshot)
+        return True
+
+
+model_registry = ModelRegistry()
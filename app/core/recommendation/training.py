@@ -1,11 +1,22 @@
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from app.db.models.ads import UserActivity, Ad
+from app.db.models.ads import Ad
+from app.db.models.training_jobs import TrainingJob
 from app.db.models.users import User
+from app.core.recommendation.embedding_store import EmbeddingStore, embedding_store
 from app.core.recommendation.features import FeatureExtractor
+from app.core.recommendation.materialize import TopKMaterializer
 from app.core.recommendation.model import AdsRecommender
+from app.core.recommendation.snapshot import ModelSnapshot, add_cold_start_ads, model_registry
+from app.core.recommendation.writeback import EmbeddingWriter
 from datetime import datetime
-import json
+from typing import Callable, Optional
+import logging
+import numpy as np
 from enum import Enum
+from app.config import settings
+
+logger = logging.getLogger(__name__)
 
 class TrainingStatus(Enum):
     IDLE = "idle"
@@ -15,41 +26,96 @@ class TrainingStatus(Enum):
     FAILED = "failed"
 
 class ModelTrainer:
-    def __init__(self):
+    def __init__(self, registry=model_registry, store: Optional[EmbeddingStore] = embedding_store):
         self.feature_extractor = FeatureExtractor()
         self.recommender = AdsRecommender()
+        self.materializer = TopKMaterializer()
+        # None when training out of process: the API loads the result from the database
+        self.registry = registry
+        # Where other workers pick up new versions without scanning the database
+        self.store = store if store is not None and store.enabled else None
+        self.progress_listener: Optional[Callable[[dict], None]] = None
         self.status = TrainingStatus.IDLE
         self.last_training = None
         self.error_message = None
+        self.progress = {}
+        self.sample_count = 0
+        # Highest activity id the current model has been trained on
+        self.checkpoint_activity_id = None
+        # Model version this trainer last wrote back (None outside the job queue)
+        self.written_version = None
+        self.incremental_runs = 0
+        self.mode = None
+        self.materialize_stats = None
+    
+    def _use_incremental(self, incremental: Optional[bool]) -> bool:
+        if incremental is None:
+            incremental = settings.INCREMENTAL_TRAINING
+        return (
+            incremental
+            and self.recommender.model is not None
+            and self.checkpoint_activity_id is not None
+            # Periodic full rebuilds stop fine-tuning drift from accumulating
+            and self.incremental_runs < settings.FULL_RETRAIN_EVERY
+        )
     
-    async def train_model(self, db: Session):
+    def train_model(self, db: Session, incremental: Optional[bool] = None, version: Optional[int] = None):
+        """Run one training pass; blocking, so call it from a worker, never the event loop."""
         try:
             self.status = TrainingStatus.TRAINING
+            self.progress = {}
+            incremental = self._use_incremental(incremental)
+            self.mode = "incremental" if incremental else "full"
             
-            # Get all activities
-            activities = db.query(UserActivity).all()
-            
-            # Extract features
-            training_data = self.feature_extractor.prepare_training_data(activities)
+            # Stream activities into compact weighted interaction arrays; an
+            # incremental run only reads what arrived since the last checkpoint
+            through_id = self.feature_extractor.latest_activity_id(db)
+            users, ads, weights = self.feature_extractor.load_training_arrays(
+                db,
+                after_id=self.checkpoint_activity_id if incremental else None,
+                through_id=through_id,
+                since=self.feature_extractor.training_window_start()
+            )
+            self.sample_count = len(weights)
             
             # Train the model
-            if training_data:
-                self.recommender.train(training_data)
-                
-                # Update all user embeddings
-                users = db.query(User).all()
-                for user in users:
-                    embedding = self.recommender.get_user_embedding(user.id)
-                    user.embedding = json.dumps(embedding.tolist())
-                
-                # Update all ad embeddings
-                ads = db.query(Ad).all()
-                for ad in ads:
-                    embedding = self.recommender.get_item_embedding(ad.id)
-                    ad.embedding = json.dumps(embedding.tolist())
+            if self.sample_count:
+                self.recommender.train_arrays(
+                    users, ads, weights,
+                    on_epoch=self._report_epoch,
+                    warm_start=incremental
+                )
                 
+                # Stream the new embeddings back in chunks, without loading rows
+                user_ids, user_embeddings, item_ids, item_embeddings = self.recommender.export_embeddings()
+                if incremental and self._owns_stored_embeddings(db):
+                    # Only rows touched by the new activities have changed
+                    user_ids, user_embeddings = self._touched(user_ids, user_embeddings, users)
+                    item_ids, item_embeddings = self._touched(item_ids, item_embeddings, ads)
+                writer = EmbeddingWriter(progress=self._report_progress)
+                writer.write(db, User, user_ids, user_embeddings, stage="user_embeddings")
+                writer.write(db, Ad, item_ids, item_embeddings, stage="ad_embeddings")
                 db.commit()
+                self.written_version = version
+                
+                # Swap the served model only once the new version is complete
+                offline = self.store is not None or settings.MATERIALIZE_RECOMMENDATIONS
+                if self.registry is not None or (offline and version is not None):
+                    snapshot = ModelSnapshot.from_recommender(
+                        self.recommender,
+                        version=version or self.registry.next_version()
+                    )
+                    add_cold_start_ads(db, snapshot)
+                    if self.registry is not None:
+                        self.registry.publish(snapshot)
+                    if self.store is not None:
+                        self.store.save(snapshot)
+                    if settings.MATERIALIZE_RECOMMENDATIONS:
+                        self._materialize(db, snapshot.version)
             
+            if through_id is not None:
+                self.checkpoint_activity_id = through_id
+            self.incremental_runs = self.incremental_runs + 1 if incremental else 0
             self.status = TrainingStatus.COMPLETED
             self.last_training = datetime.utcnow()
             
@@ -58,9 +124,76 @@ class ModelTrainer:
             self.error_message = str(e)
             raise
     
+    def _served_snapshot(self, db: Session, version: int) -> Optional[ModelSnapshot]:
+        """`version` as the API workers load it: the stored file, else the embeddings written back.
+
+        Scoring the in-process model instead could rank with vectors that
+        differ from what was written, which serving never sees.
+        """
+        if self.store is not None:
+            snapshot = self.store.load(version)
+        else:
+            snapshot = ModelSnapshot.from_database(db, version)
+        if snapshot is not None:
+            add_cold_start_ads(db, snapshot)
+        return snapshot
+
+    def _materialize(self, db: Session, version: int):
+        # The model is already trained and written back; requests score online if this fails
+        try:
+            snapshot = self._served_snapshot(db, version)
+            if snapshot is None:
+                logger.warning("No stored embeddings for model version %s; not materializing", version)
+                return
+            self.materialize_stats = self.materializer.run(db, snapshot, progress=self._report_progress)
+            # Kept as the final progress, so the job record shows the timings too
+            self._set_progress({"stage": "materialize", "done": self.materialize_stats["users"],
+                                "total": self.materialize_stats["users"], **self.materialize_stats})
+        except Exception:
+            db.rollback()
+            logger.exception("Materializing recommendations for model version %s failed", version)
+    
+    def _owns_stored_embeddings(self, db: Session) -> bool:
+        """Whether the embeddings in the database are the ones this trainer's model wrote.
+
+        If another trainer (or this one before a restart) published since, its
+        rows come from a separately trained embedding space; writing back only
+        the touched rows would mix the two, so every row is written instead.
+        """
+        latest = db.query(func.max(TrainingJob.model_version)).scalar()
+        return latest == self.written_version
+
+    @staticmethod
+    def _touched(ids, embeddings: np.ndarray, seen: np.ndarray):
+        mask = np.isin(ids, seen)
+        return np.asarray(ids)[mask], embeddings[mask]
+    
+    def _set_progress(self, progress: dict):
+        self.progress = progress
+        if self.progress_listener:
+            self.progress_listener(progress)
+    
+    def _report_epoch(self, epoch: int, epochs: int, train_loss: float, val_loss):
+        self._set_progress({
+            "stage": "training",
+            "done": epoch,
+            "total": epochs,
+            "train_loss": train_loss,
+            "val_loss": val_loss
+        })
+    
+    def _report_progress(self, stage: str, done: int, total: int):
+        self._set_progress({"stage": stage, "done": done, "total": total})
+    
     def get_status(self):
         return {
             "status": self.status.value,
             "last_training": self.last_training,
-            "error_message": self.error_message
+            "error_message": self.error_message,
+            "model_version": self.registry.version if self.registry else None,
+            "progress": self.progress,
+            "sample_count": self.sample_count,
+            "mode": self.mode,
+            "checkpoint_activity_id": self.checkpoint_activity_id,
+            "materialize": self.materialize_stats
         }
\ No newline at end of file
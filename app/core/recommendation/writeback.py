@@ -0,0 +1,85 @@
+import io
+import numpy as np
+from typing import Callable, Optional, Sequence
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+from sqlalchemy.types import LargeBinary
+from app.config import settings
+from app.db.types import encode_embedding
+
+ProgressCallback = Callable[[str, int, int], None]
+
+
+class EmbeddingWriter:
+    """Writes trained embeddings back to an `embedding` column in bounded chunks.
+
+    Rows are never loaded as ORM objects. Each chunk becomes one executemany
+    UPDATE, or on PostgreSQL with psycopg2 a COPY into a temporary staging
+    table followed by a single UPDATE ... FROM. Only rows the model knows
+    about are written.
+    """
+
+    def __init__(
+        self,
+        chunk_size: Optional[int] = None,
+        strategy: Optional[str] = None,
+        progress: Optional[ProgressCallback] = None
+    ):
+        self.chunk_size = chunk_size or settings.EMBEDDING_WRITEBACK_CHUNK_SIZE
+        self.strategy = strategy or settings.EMBEDDING_WRITEBACK_STRATEGY
+        self.progress = progress
+
+    def _use_copy(self, db: Session) -> bool:
+        if self.strategy == "executemany":
+            return False
+        bind = db.get_bind()
+        supported = bind.dialect.name == "postgresql" and bind.dialect.driver == "psycopg2"
+        if self.strategy == "copy" and not supported:
+            raise ValueError("COPY write-back requires PostgreSQL with psycopg2")
+        return supported
+
+    def write(self, db: Session, model, ids: Sequence[int], embeddings: np.ndarray, stage: str) -> int:
+        """Write `embeddings[i]` to the row of `model` with primary key `ids[i]`."""
+        total = len(ids)
+        use_copy = self._use_copy(db)
+        table = model.__table__
+        statement = update(table).where(
+            table.c.id == bindparam("row_id")
+        ).values(embedding=bindparam("blob", type_=LargeBinary))
+
+        self._report(stage, 0, total)
+        for start in range(0, total, self.chunk_size):
+            chunk_ids = ids[start:start + self.chunk_size]
+            blobs = [encode_embedding(vector) for vector in embeddings[start:start + self.chunk_size]]
+            if use_copy:
+                self._copy_chunk(db, table.name, chunk_ids, blobs)
+            else:
+                db.execute(statement, [
+                    {"row_id": int(row_id), "blob": blob} for row_id, blob in zip(chunk_ids, blobs)
+                ])
+            self._report(stage, min(start + self.chunk_size, total), total)
+        return total
+
+    def _copy_chunk(self, db: Session, table_name: str, ids: Sequence[int], blobs: Sequence[bytes]):
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS embedding_staging "
+                "(id integer PRIMARY KEY, embedding bytea) ON COMMIT DROP"
+            )
+            cursor.execute("TRUNCATE embedding_staging")
+            # COPY text format: bytea as hex, with the backslash itself escaped
+            buffer = io.StringIO("".join(
+                f"{int(row_id)}\t\\\\x{blob.hex()}\n" for row_id, blob in zip(ids, blobs)
+            ))
+            cursor.copy_expert("COPY embedding_staging (id, embedding) FROM STDIN", buffer)
+            cursor.execute(
+                f"UPDATE {table_name} AS target SET embedding = staging.embedding "
+                f"FROM embedding_staging AS staging WHERE target.id = staging.id"
+            )
+        finally:
+            cursor.close()
+
+    def _report(self, stage: str, done: int, total: int):
+        if self.progress:
+            self.progress(stage, done, total)
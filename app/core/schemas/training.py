@@ -1,9 +1,29 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Dict, Any
 from app.core.recommendation.training import TrainingStatus
 
 class TrainingResponse(BaseModel):
     status: str
     timestamp: datetime
-    message: Optional[str] = None
\ No newline at end of file
+    message: Optional[str] = None
+    model_version: Optional[int] = None
+    progress: Optional[Dict[str, Any]] = None
+    job_id: Optional[int] = None
+
+class TrainingJobResponse(BaseModel):
+    id: int
+    status: str
+    force: bool
+    mode: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    heartbeat_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    sample_count: Optional[int] = None
+    model_version: Optional[int] = None
+    progress: Optional[Dict[str, Any]] = None
+    error_message: Optional[str] = None
+
+    class Config:
+        from_attributes = True
@@ -29,4 +29,17 @@ class UserActivity(BaseModel):
     timestamp: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class UserActivityStatsResponse(BaseModel):
+    user_id: int
+    view_count: int
+    click_count: int
+    save_count: int
+    purchase_count: int
+    other_count: int
+    total_count: int
+    total_spent: float
+    first_activity_at: Optional[datetime] = None
+    last_activity_at: Optional[datetime] = None
+    engagement: float  # time-decayed activity weight as of the request
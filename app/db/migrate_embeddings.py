@@ -0,0 +1,85 @@
+"""Convert legacy JSON-text embeddings to the binary format in app/db/types.py.
+
+Usage:
+    python -m app.db.migrate_embeddings [--dtype float16] [--batch-size 1000]
+
+On PostgreSQL the `embedding` columns are first altered from VARCHAR to BYTEA
+(the JSON text is kept as UTF-8 bytes). SQLite needs no DDL. Rows are then
+re-encoded in batches; rows already in binary form are left alone, so the
+script can be re-run safely.
+"""
+import argparse
+from sqlalchemy import bindparam, column, inspect, select, table, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.types import Integer, LargeBinary
+from app.db.types import decode_embedding, encode_embedding, is_legacy_embedding
+
+EMBEDDING_TABLES = ("users", "ads")
+
+
+def upgrade_column_types(engine: Engine):
+    if engine.dialect.name != "postgresql":
+        return
+
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table_name in EMBEDDING_TABLES:
+            columns = {col["name"]: col for col in inspector.get_columns(table_name)}
+            if isinstance(columns["embedding"]["type"], LargeBinary):
+                continue
+            conn.execute(text(
+                f"ALTER TABLE {table_name} ALTER COLUMN embedding "
+                f"TYPE BYTEA USING convert_to(embedding, 'UTF8')"
+            ))
+
+
+def migrate_json_rows(engine: Engine, dtype: str = None, batch_size: int = 1000) -> dict:
+    """Re-encode legacy rows; returns the number of rows converted per table."""
+    converted = {}
+    for table_name in EMBEDDING_TABLES:
+        # Untyped columns so values come back raw rather than through the Embedding decoder
+        rows_table = table(table_name, column("id", Integer), column("embedding"))
+        statement = update(rows_table).where(
+            rows_table.c.id == bindparam("row_id")
+        ).values(embedding=bindparam("blob", type_=LargeBinary))
+
+        converted[table_name] = 0
+        last_id = 0
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(
+                    select(rows_table.c.id, rows_table.c.embedding)
+                    .where(rows_table.c.id > last_id)
+                    .where(rows_table.c.embedding.isnot(None))
+                    .order_by(rows_table.c.id)
+                    .limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+
+                params = [
+                    {"row_id": row.id, "blob": encode_embedding(decode_embedding(row.embedding), dtype)}
+                    for row in rows if is_legacy_embedding(row.embedding)
+                ]
+                if params:
+                    conn.execute(statement, params)
+                    converted[table_name] += len(params)
+    return converted
+
+
+def main():
+    from app.db.session import engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dtype", choices=["float32", "float16", "int8"], default=None)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    upgrade_column_types(engine)
+    for table_name, count in migrate_json_rows(engine, args.dtype, args.batch_size).items():
+        print(f"{table_name}: converted {count} embeddings")
+
+
+if __name__ == "__main__":
+    main()
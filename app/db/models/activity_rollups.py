@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, Date, ForeignKey, UniqueConstraint
+from app.db.session import Base
+
+class ActivityRollup(Base):
+    """Daily activity counts kept after retention drops the raw user_activities rows."""
+    __tablename__ = "activity_rollups"
+    __table_args__ = (
+        UniqueConstraint("user_id", "ad_id", "activity_type", "day", name="uq_activity_rollups_key"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    ad_id = Column(Integer, ForeignKey("ads.id"))
+    activity_type = Column(String, nullable=False)
+    day = Column(Date, nullable=False)
+    count = Column(Integer, nullable=False)
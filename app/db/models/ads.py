@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, Table
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.db.session import Base
+from app.db.types import Embedding
 
 class Ad(Base):
     __tablename__ = "ads"
@@ -17,10 +18,16 @@ class Ad(Base):
     
     # Relationships
     user_interactions = relationship("UserActivity", back_populates="ad")
-    embedding = Column(String)  # Store as JSON string
+    embedding = Column(Embedding)  # Binary float32 vector, see app/db/types.py
 
 class UserActivity(Base):
     __tablename__ = "user_activities"
+    __table_args__ = (
+        # Serves per-user history newest first, with id breaking timestamp ties
+        Index("ix_user_activities_user_timestamp", "user_id", "timestamp", "id"),
+        # Time-window scans (training, retention) where there are no partitions to prune
+        Index("ix_user_activities_timestamp", "timestamp"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index, JSON, text
+from datetime import datetime
+from app.db.session import Base
+
+class TrainingJob(Base):
+    """One requested training run, from queueing to completion."""
+    __tablename__ = "training_jobs"
+    __table_args__ = (
+        # At most one queued job: concurrent triggers collapse onto it
+        Index(
+            "uq_training_jobs_queued",
+            "status",
+            unique=True,
+            sqlite_where=text("status = 'queued'"),
+            postgresql_where=text("status = 'queued'")
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String, index=True, nullable=False)  # queued, running, done, failed
+    force = Column(Boolean, default=False)
+    mode = Column(String)  # full or incremental, known once the job runs
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    # Renewed by the worker while the job runs; a stale one means the worker is gone
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    sample_count = Column(Integer)
+    model_version = Column(Integer)
+    progress = Column(JSON)
+    error_message = Column(String)
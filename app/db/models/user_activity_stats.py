@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from datetime import datetime
+from app.db.session import Base
+
+class UserActivityStats(Base):
+    """Running per-user aggregates of user_activities, kept current on ingest."""
+    __tablename__ = "user_activity_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    view_count = Column(Integer, default=0, nullable=False)
+    click_count = Column(Integer, default=0, nullable=False)
+    save_count = Column(Integer, default=0, nullable=False)
+    purchase_count = Column(Integer, default=0, nullable=False)
+    other_count = Column(Integer, default=0, nullable=False)  # unrecognised activity types
+    total_spent = Column(Float, default=0.0, nullable=False)
+    first_activity_at = Column(DateTime)
+    last_activity_at = Column(DateTime)
+    # Sum of weight * exp((timestamp - ENGAGEMENT_EPOCH) / DECAY_DAYS); decayed when read
+    engagement_base = Column(Float, default=0.0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, LargeBinary
+from datetime import datetime
+from app.db.session import Base
+
+class UserRecommendation(Base):
+    """A user's top-K ads under one model version, computed offline after training."""
+    __tablename__ = "user_recommendations"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    model_version = Column(Integer, nullable=False)
+    # Raw little-endian int32 ad ids and float32 similarities, best first
+    ad_ids = Column(LargeBinary, nullable=False)
+    scores = Column(LargeBinary, nullable=False)
+    # Ads created after this one were not scored; serving merges them in
+    max_ad_id = Column(Integer, nullable=False)
+    computed_at = Column(DateTime, default=datetime.utcnow)
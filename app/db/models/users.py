@@ -2,6 +2,7 @@ from sqlalchemy import Column, Integer, String, DateTime, Boolean
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.db.session import Base
+from app.db.types import Embedding
 
 class User(Base):
     __tablename__ = "users"
@@ -14,7 +15,7 @@ class User(Base):
     
     # User preferences and behavior
     preferences = Column(String)  # Store as JSON string
-    embedding = Column(String)  # Store as JSON string
+    embedding = Column(Embedding)  # Binary float32 vector, see app/db/types.py
     
     # Relationships
     activities = relationship("UserActivity", back_populates="user")
\ No newline at end of file
@@ -0,0 +1,261 @@
+"""Monthly time partitions for activity tables, and the retention job that drops old months.
+
+Usage (retention, daily, e.g. from cron):
+    python -m app.db.partitions [--retention-days 365] [--ahead 2]
+
+On PostgreSQL, activity tables created by `create_all` are native
+`PARTITION BY RANGE (timestamp)` tables with one partition per month plus a
+DEFAULT partition. Queries with a time window only touch the months they
+cover, and retention drops a month with DROP TABLE. Every API process
+re-creates the coming months' partitions every
+ACTIVITY_PARTITION_CHECK_INTERVAL seconds (see `keep_ahead`), so new months
+never depend on the cron job. The primary key becomes
+(id, timestamp), as PostgreSQL requires the partition key in it. Existing
+unpartitioned tables are left as they are and handled like SQLite.
+
+SQLite has no partitioning, so the same months are emulated as timestamp
+ranges over ix_user_activities_timestamp. Retention deletes one month at a
+time rather than dropping a table.
+
+Before raw user_activities rows are removed they are rolled up into daily
+counts in activity_rollups, which user_activity_stats rebuilds read. Each
+month is rolled up and dropped in one transaction, so a rerun after a crash
+never counts a month twice.
+"""
+import argparse
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import Column, ForeignKey, MetaData, Table, delete, func, inspect, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+from app.config import settings
+from app.db.models.activity_rollups import ActivityRollup
+from app.db.models.ads import UserActivity
+from app.db.session import Base
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("user_activities", "extended_user_activities")
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def partition_name(table_name: str, month: datetime) -> str:
+    return f"{table_name}_y{month.year:04d}m{month.month:02d}"
+
+class ActivityPartitions:
+    """Creates the partitioned activity tables and applies retention to them."""
+    def __init__(
+        self,
+        metadata: MetaData = Base.metadata,
+        table_names=PARTITIONED_TABLES,
+        ahead: Optional[int] = None,
+        retention_days: Optional[int] = None
+    ):
+        self.metadata = metadata
+        self.table_names = table_names
+        self.ahead = settings.ACTIVITY_PARTITIONS_AHEAD if ahead is None else ahead
+        self.retention_days = settings.ACTIVITY_RETENTION_DAYS if retention_days is None else retention_days
+
+    def tables(self) -> List[Table]:
+        """The partitionable tables whose models are loaded."""
+        return [self.metadata.tables[name] for name in self.table_names if name in self.metadata.tables]
+
+    def partitioned_table(self, table: Table) -> Table:
+        """A copy of `table` declared for RANGE partitioning on timestamp, for DDL only."""
+        metadata = MetaData()
+        for other in self.metadata.sorted_tables:
+            if other is not table:
+                other.to_metadata(metadata)
+        columns = [
+            Column(
+                column.name,
+                column.type,
+                *[ForeignKey(foreign_key.target_fullname) for foreign_key in column.foreign_keys],
+                primary_key=column.primary_key or column.name == "timestamp",
+                autoincrement=True if column.primary_key else False,
+                nullable=column.nullable and not column.primary_key and column.name != "timestamp"
+            )
+            for column in table.columns
+        ]
+        return Table(table.name, metadata, *columns, postgresql_partition_by="RANGE (timestamp)")
+
+    def create_all(self, engine: Engine, now: Optional[datetime] = None):
+        """`Base.metadata.create_all`, with the activity tables partitioned on PostgreSQL."""
+        if engine.dialect.name != "postgresql":
+            self.metadata.create_all(bind=engine)
+            return
+
+        partitioned = self.tables()
+        self.metadata.create_all(
+            bind=engine,
+            tables=[table for table in self.metadata.sorted_tables if table not in partitioned]
+        )
+        with engine.begin() as conn:
+            for table in partitioned:
+                if inspect(conn).has_table(table.name):
+                    continue
+                conn.execute(CreateTable(self.partitioned_table(table)))
+                for index in table.indexes:
+                    index.create(conn)
+                conn.execute(text(f"CREATE TABLE {table.name}_default PARTITION OF {table.name} DEFAULT"))
+            self.ensure_partitions(conn, now)
+
+    def is_partitioned(self, conn: Connection, table_name: str) -> bool:
+        if conn.dialect.name != "postgresql":
+            return False
+        return conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = :name"
+        ), {"name": table_name}).first() is not None
+
+    def ensure_partitions(self, conn: Connection, now: Optional[datetime] = None) -> List[str]:
+        """Create the current month's partition and `ahead` more; returns the names ensured.
+
+        Run this before a month starts: once its rows have landed in the
+        DEFAULT partition PostgreSQL refuses to create the month's partition.
+        """
+        current = month_start(now or datetime.utcnow())
+        ensured = []
+        for table in self.tables():
+            if not self.is_partitioned(conn, table.name):
+                continue
+            for offset in range(self.ahead + 1):
+                month = add_months(current, offset)
+                name = partition_name(table.name, month)
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table.name} "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+                ))
+                ensured.append(name)
+        return ensured
+
+    async def keep_ahead(self, engine: Engine, interval: Optional[float] = None):
+        """Run `ensure_partitions` every `interval` seconds until cancelled.
+
+        The API starts this in its lifespan, which is always running, so the
+        partitions made at startup never run out however long it lives.
+        """
+        interval = settings.ACTIVITY_PARTITION_CHECK_INTERVAL if interval is None else interval
+        while True:
+            try:
+                await asyncio.to_thread(self._ensure_partitions_committed, engine)
+            except Exception:
+                logger.exception("Creating activity partitions failed")
+            await asyncio.sleep(interval)
+
+    def _ensure_partitions_committed(self, engine: Engine) -> List[str]:
+        with engine.begin() as conn:
+            return self.ensure_partitions(conn)
+
+    def retention_cutoff(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        """Months starting before this are expired; None when retention is off.
+
+        Aligned to a month boundary so whole partitions are dropped.
+        """
+        if not self.retention_days:
+            return None
+        return month_start((now or datetime.utcnow()) - timedelta(days=self.retention_days))
+
+    def apply_retention(self, db: Session, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Roll up and drop every expired month; returns rows removed per table."""
+        cutoff = self.retention_cutoff(now)
+        removed = {}
+        if cutoff is None:
+            return removed
+        existing = set(inspect(db.connection()).get_table_names())
+        for table in self.tables():
+            if table.name not in existing:
+                continue
+            removed[table.name] = 0
+            oldest = db.execute(select(func.min(table.c.timestamp)).where(table.c.timestamp < cutoff)).scalar()
+            month = month_start(oldest) if oldest is not None else cutoff
+            while month < cutoff:
+                end = add_months(month, 1)
+                if table is UserActivity.__table__:
+                    self.rollup(db, month, end)
+                removed[table.name] += self._drop_month(db, table, month, end)
+                db.commit()
+                month = end
+        return removed
+
+    def rollup(self, db: Session, start: datetime, end: datetime, chunk_size: Optional[int] = None) -> int:
+        """Add [start, end) of user_activities to activity_rollups (caller commits); returns rows read."""
+        chunk_size = chunk_size or settings.TRAINING_CHUNK_SIZE
+        statement = select(
+            UserActivity.user_id,
+            UserActivity.ad_id,
+            UserActivity.activity_type,
+            UserActivity.timestamp
+        ).where(
+            UserActivity.timestamp >= start,
+            UserActivity.timestamp < end
+        ).execution_options(yield_per=chunk_size)
+
+        total = 0
+        upsert = self._rollup_upsert(db)
+        for rows in db.execute(statement).partitions():
+            counts = Counter(
+                (user_id, ad_id, activity_type, timestamp.date())
+                for user_id, ad_id, activity_type, timestamp in rows
+            )
+            db.execute(upsert, [
+                {"user_id": user_id, "ad_id": ad_id, "activity_type": activity_type, "day": day, "count": count}
+                for (user_id, ad_id, activity_type, day), count in counts.items()
+            ])
+            total += len(rows)
+        return total
+
+    def _rollup_upsert(self, db: Session):
+        table = ActivityRollup.__table__
+        dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+        statement = dialect.insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.ad_id, table.c.activity_type, table.c.day],
+            set_={"count": table.c.count + statement.excluded.count}
+        )
+
+    def _drop_month(self, db: Session, table: Table, start: datetime, end: datetime) -> int:
+        removed = 0
+        conn = db.connection()
+        name = partition_name(table.name, start)
+        if self.is_partitioned(conn, table.name) and inspect(conn).has_table(name):
+            removed += conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+            conn.execute(text(f"ALTER TABLE {table.name} DETACH PARTITION {name}"))
+            conn.execute(text(f"DROP TABLE {name}"))
+        # Without partitions, or for rows that landed in the DEFAULT partition
+        result = db.execute(delete(table).where(table.c.timestamp >= start, table.c.timestamp < end))
+        return removed + result.rowcount
+
+activity_partitions = ActivityPartitions()
+
+def main():
+    from app.db.models import users  # noqa: F401  (registers the tables the foreign keys point at)
+    from app.db.session import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retention-days", type=int, default=None)
+    parser.add_argument("--ahead", type=int, default=None)
+    args = parser.parse_args()
+
+    partitions = ActivityPartitions(ahead=args.ahead, retention_days=args.retention_days)
+    partitions.create_all(engine)
+    with SessionLocal() as db:
+        if engine.dialect.name == "postgresql":
+            print("partitions ensured:", ", ".join(partitions.ensure_partitions(db.connection())) or "none")
+            db.commit()
+        removed = partitions.apply_retention(db)
+    for table_name, count in removed.items():
+        print(f"{table_name}: {count} expired rows removed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Engine construction: per-backend pool defaults, fork safety and pool statistics."""
+import os
+import threading
+import time
+import weakref
+from typing import Dict
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+from app.config import settings
+
+# Pool size when DB_POOL_SIZE is 0; SQLite gains little from many connections
+DEFAULT_POOL_SIZE = {"postgresql": 10, "sqlite": 5}
+
+def _empty_wait_stats() -> Dict:
+    return {"checkouts": 0, "timeouts": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+class CheckoutTimer:
+    """Pool mixin timing checkouts, including the wait for a free connection.
+
+    Counters live on the pool, so they restart when an engine is disposed.
+    """
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self._record(started, timed_out=True)
+            raise
+        self._record(started)
+        return connection
+
+    def _record(self, started: float, timed_out: bool = False):
+        waited_ms = (time.perf_counter() - started) * 1000
+        with _stats_lock:
+            stats = self.__dict__.setdefault("_wait_stats", _empty_wait_stats())
+            if timed_out:
+                stats["timeouts"] += 1
+                return
+            stats["checkouts"] += 1
+            stats["wait_ms_total"] += waited_ms
+            stats["wait_ms_max"] = max(stats["wait_ms_max"], waited_ms)
+
+    def wait_stats(self) -> Dict:
+        with _stats_lock:
+            stats = dict(self.__dict__.get("_wait_stats") or _empty_wait_stats())
+        stats["wait_ms_avg"] = stats["wait_ms_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        return stats
+
+class TimedQueuePool(CheckoutTimer, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(CheckoutTimer, AsyncAdaptedQueuePool):
+    pass
+
+_stats_lock = threading.Lock()
+_engines: "weakref.WeakSet[Engine]" = weakref.WeakSet()
+
+def pool_options(url: str, asynchronous: bool = False) -> Dict:
+    """create_engine pool arguments for `url`'s backend, from the DB_POOL_* settings.
+
+    DB_MAX_CONNECTIONS caps pool plus overflow, per engine and per worker
+    process. In-memory SQLite gets one shared connection (StaticPool) and
+    no sizing at all, which it would reject.
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == "sqlite" and url.database in (None, "", ":memory:"):
+        return {"poolclass": StaticPool}
+
+    pool_size = min(settings.DB_POOL_SIZE or DEFAULT_POOL_SIZE.get(backend, 10), settings.DB_MAX_CONNECTIONS)
+    network = backend != "sqlite"
+    return {
+        "poolclass": TimedAsyncQueuePool if asynchronous else TimedQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": settings.DB_MAX_CONNECTIONS - pool_size,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        # Servers and proxies drop idle connections; a local file does not
+        "pool_recycle": settings.DB_POOL_RECYCLE if network else -1,
+        "pool_pre_ping": network if settings.DB_POOL_PRE_PING is None else settings.DB_POOL_PRE_PING
+    }
+
+def make_engine(url: str) -> Engine:
+    engine = create_engine(url, **pool_options(url))
+    _engines.add(engine)
+    return engine
+
+def make_async_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(url, **pool_options(url, asynchronous=True))
+    _engines.add(engine.sync_engine)
+    return engine
+
+def _after_fork_in_child():
+    global _stats_lock
+    _stats_lock = threading.Lock()
+    # Connections inherited from the parent (e.g. gunicorn --preload) belong
+    # to it; drop them without closing so each worker opens its own
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+def pool_status(engine: Engine) -> Dict:
+    """Occupancy and checkout waits of `engine`'s pool, for /metrics."""
+    pool = engine.pool
+    status = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            # Negative while the pool itself is not yet full
+            "overflow": max(0, pool.overflow())
+        })
+    if isinstance(pool, CheckoutTimer):
+        status.update(pool.wait_stats())
+    return status
@@ -1,14 +1,38 @@
-from sqlalchemy import create_engine
+from typing import Dict
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.config import settings
+from app.db.pool import make_async_engine, make_engine, pool_status
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    pool_size=settings.DB_MAX_CONNECTIONS,
-    max_overflow=0
-)
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+def async_database_url(url: str) -> str:
+    """`url` with its driver swapped for the asyncio one (asyncpg, aiosqlite)."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}; set ASYNC_DATABASE_URL")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+engine = make_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Same database through an asyncio driver, for the `async def` endpoints.
+# Objects stay usable after commit, as lazy loads cannot run outside await
+async_engine = make_async_engine(settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Read-only endpoints go to the replica when one is configured. It may lag
+# the primary, so anything that must see a write it just made stays on get_db
+if settings.DB_READ_REPLICA_URL:
+    read_engine = make_engine(settings.DB_READ_REPLICA_URL)
+    async_read_engine = make_async_engine(async_database_url(settings.DB_READ_REPLICA_URL))
+else:
+    read_engine, async_read_engine = engine, async_engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -16,4 +40,30 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_session_factory():
+    """For streamed responses, which must open their session inside the body generator."""
+    return ReadSessionLocal
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+def pool_stats() -> Dict:
+    """Per-engine pool occupancy and checkout waits of this worker process."""
+    engines = {"primary": engine, "primary_async": async_engine.sync_engine}
+    if read_engine is not engine:
+        engines.update({"replica": read_engine, "replica_async": async_read_engine.sync_engine})
+    return {name: pool_status(each) for name, each in engines.items()}
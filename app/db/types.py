@@ -0,0 +1,78 @@
+import json
+import struct
+import numpy as np
+from typing import Optional, Union
+from sqlalchemy.types import LargeBinary, TypeDecorator
+from app.config import settings
+
+# Blob layout: magic, format version, dtype code, dimension, int8 scale, then raw values
+EMBEDDING_MAGIC = b"EM"
+EMBEDDING_FORMAT_VERSION = 1
+HEADER = struct.Struct("<2sBBIf")
+
+DTYPE_CODES = {"float32": 0, "float16": 1, "int8": 2}
+CODE_DTYPES = {code: np.dtype(name) for name, code in DTYPE_CODES.items()}
+
+
+def encode_embedding(vector, dtype: Optional[str] = None) -> bytes:
+    """Pack a vector into a self-describing binary blob."""
+    dtype = dtype or settings.EMBEDDING_STORAGE_DTYPE
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+    values = np.asarray(vector, dtype=np.float32).ravel()
+    scale = 1.0
+    if dtype == "int8":
+        # Symmetric quantization: the largest magnitude maps to 127
+        peak = float(np.abs(values).max()) if values.size else 0.0
+        scale = peak / 127 if peak > 0 else 1.0
+        values = np.round(values / scale)
+    payload = values.astype(CODE_DTYPES[DTYPE_CODES[dtype]]).tobytes()
+    return HEADER.pack(EMBEDDING_MAGIC, EMBEDDING_FORMAT_VERSION, DTYPE_CODES[dtype], values.size, scale) + payload
+
+
+def is_legacy_embedding(value: Union[str, bytes, memoryview]) -> bool:
+    """True for embeddings still stored in the old JSON text format."""
+    if isinstance(value, str):
+        return True
+    return bytes(value[:1]) == b"["
+
+
+def decode_embedding(value: Union[str, bytes, memoryview]) -> np.ndarray:
+    """Read a blob (or a legacy JSON string) back into a float32 vector.
+
+    float32 blobs are returned as a read-only view over the buffer, without copying.
+    """
+    if is_legacy_embedding(value):
+        text = value if isinstance(value, str) else bytes(value).decode("utf-8")
+        return np.asarray(json.loads(text), dtype=np.float32)
+
+    magic, version, code, dim, scale = HEADER.unpack_from(value)
+    if magic != EMBEDDING_MAGIC or version != EMBEDDING_FORMAT_VERSION or code not in CODE_DTYPES:
+        raise ValueError("Unrecognized embedding blob")
+
+    values = np.frombuffer(value, dtype=CODE_DTYPES[code], count=dim, offset=HEADER.size)
+    if code == DTYPE_CODES["float32"]:
+        return values
+    if code == DTYPE_CODES["int8"]:
+        return values.astype(np.float32) * np.float32(scale)
+    return values.astype(np.float32)
+
+
+class Embedding(TypeDecorator):
+    """Binary column holding one embedding vector; accepts and returns NumPy arrays."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, (bytes, bytearray)):
+            return value
+        if isinstance(value, str):
+            value = json.loads(value)
+        return encode_embedding(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return decode_embedding(value)
@@ -1,16 +1,49 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1.endpoints import ads, users, training
 from app.config import settings
-from app.db.session import engine, Base
+from app.core.recommendation.batching import recommendation_batcher
+from app.core.recommendation.cache import recommendation_cache
+from app.core.recommendation.jobs import snapshot_refresher, training_runner
+from app.core.recommendation.materialize import precomputed_recommendations
+from app.core.recommendation.pipeline import recommendation_pipeline
+from app.db.partitions import activity_partitions
+from app.db.session import engine, pool_stats
+from app.services.activity_ingest import activity_ingestor
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+# Create database tables (activity tables partitioned by month on PostgreSQL)
+activity_partitions.create_all(engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # With a shared embedding store, serve the current model from the first request
+    if snapshot_refresher.store is not None:
+        try:
+            snapshot_refresher.refresh()
+        except Exception:
+            logger.exception("Loading the current embedding file failed")
+    # Months need their partition before their first row; startup only covers the next few
+    partition_task = None
+    if engine.dialect.name == "postgresql":
+        partition_task = asyncio.create_task(activity_partitions.keep_ahead(engine))
+    yield
+    if partition_task is not None:
+        partition_task.cancel()
+    # Write out queued activity before the process goes away
+    activity_ingestor.shutdown()
+    training_runner.stop()
+    recommendation_batcher.shutdown()
 
 app = FastAPI(
     title="Ads Recommendation Service",
     version="1.0.0",
-    description="ML-powered advertising recommendation system"
+    description="ML-powered advertising recommendation system",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -29,4 +62,15 @@ app.include_router(training.router, prefix=f"/api/{settings.API_VERSION}/trainin
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/metrics")
+def metrics():
+    return {
+        "activity_ingest": activity_ingestor.metrics(),
+        "recommendation_cache": recommendation_cache.stats(),
+        "recommendation_pipeline": recommendation_pipeline.stats(),
+        "recommendation_batching": recommendation_batcher.stats(),
+        "precomputed_recommendations": precomputed_recommendations.stats(),
+        "db_pools": pool_stats()
+    }
\ No newline at end of file
@@ -0,0 +1,166 @@
+import codecs
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.core.schemas.users import UserActivity
+from app.services.activity_ingest import ActivityIngestor, normalize_timestamp
+
+MAX_REPORTED_ERRORS = 100
+MAX_RECORD_BYTES = 64 * 1024
+
+# (line, parsed value, error message); exactly one of value / error is set
+Record = Tuple[int, Any, Optional[str]]
+
+class ActivityStreamParser:
+    """Splits an NDJSON or JSON-array body into records as bytes arrive.
+
+    The format is picked from the first non-blank character: `[` means a
+    JSON array, anything else NDJSON. For NDJSON, `line` is the line number
+    and a bad line is reported and skipped. For an array it is the
+    element's 1-based position; a syntax error there ends the parse,
+    because there is no way to find the next element.
+    """
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._format: Optional[str] = None
+        self._line = 0
+        self._expect_value = True
+        self.done = False
+
+    def feed(self, data: bytes, final: bool = False) -> List[Record]:
+        if self.done:
+            return []
+        self._buffer += self._decoder.decode(data, final)
+        if self._format is None:
+            stripped = self._buffer.lstrip()
+            if not stripped:
+                return []
+            if stripped[0] == "[":
+                self._format = "array"
+                self._buffer = stripped[1:]
+            else:
+                self._format = "ndjson"
+        if self._format == "array":
+            return self._feed_array(final)
+        return self._feed_lines(final)
+
+    def _feed_lines(self, final: bool) -> List[Record]:
+        lines = self._buffer.split("\n")
+        self._buffer = "" if final else lines.pop()
+        records = []
+        for line in lines:
+            self._line += 1
+            if not line.strip():
+                continue
+            try:
+                records.append((self._line, json.loads(line), None))
+            except json.JSONDecodeError as e:
+                records.append((self._line, None, f"invalid JSON: {e.msg}"))
+        return records
+
+    def _feed_array(self, final: bool) -> List[Record]:
+        records = []
+        buffer, pos = self._buffer, 0
+        while not self.done:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos == len(buffer):
+                if final:
+                    records.append(self._fail("unterminated JSON array"))
+                break
+
+            if not self._expect_value:
+                if buffer[pos] == ",":
+                    self._expect_value = True
+                    pos += 1
+                elif buffer[pos] == "]":
+                    self.done = True
+                else:
+                    records.append(self._fail("expected ',' or ']' after element"))
+                continue
+
+            if buffer[pos] == "]" and self._line == 0:
+                self.done = True
+                continue
+            try:
+                value, end = self._json.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if final or len(buffer) - pos > MAX_RECORD_BYTES:
+                    self._line += 1
+                    records.append(self._fail(f"invalid JSON: {e.msg}"))
+                break  # probably cut off mid-element; wait for more bytes
+            if end == len(buffer) and not final:
+                break  # a number may continue in the next chunk
+            self._line += 1
+            records.append((self._line, value, None))
+            self._expect_value = False
+            pos = end
+
+        self._buffer = buffer[pos:]
+        return records
+
+    def _fail(self, message: str) -> Record:
+        self.done = True
+        return (max(self._line, 1), None, message)
+
+def validate_activity(value: Any) -> Tuple[Optional[Dict], Optional[str]]:
+    """Check one record against the UserActivity schema; returns (row, error)."""
+    try:
+        activity = UserActivity.model_validate(value)
+    except ValidationError as e:
+        return None, "; ".join(
+            f"{'.'.join(str(part) for part in error['loc']) or 'record'}: {error['msg']}"
+            for error in e.errors()
+        )
+    row = activity.model_dump()
+    row["timestamp"] = normalize_timestamp(row["timestamp"])
+    return row, None
+
+async def load_activity_stream(
+    chunks: AsyncIterator[bytes],
+    db: AsyncSession,
+    ingestor: ActivityIngestor,
+    chunk_size: Optional[int] = None
+) -> Dict:
+    """Validate a streamed body record by record and insert it chunk by chunk.
+
+    Valid rows are written as one multi-row INSERT (and commit) per
+    `chunk_size` rows, so memory stays bounded whatever the body size.
+    Invalid records are skipped and reported by line.
+    """
+    chunk_size = chunk_size or settings.INGEST_BATCH_SIZE
+    parser = ActivityStreamParser()
+    pending: List[Dict] = []
+    errors: List[Dict] = []
+    report = {"accepted": 0, "rejected": 0}
+
+    async def write_pending(final: bool = False):
+        while len(pending) >= chunk_size or (final and pending):
+            rows = pending[:chunk_size]
+            del pending[:chunk_size]
+            # The sync write path, with its I/O awaited on the async connection
+            report["accepted"] += await db.run_sync(ingestor.write_now, rows)
+
+    def handle(records: List[Record]):
+        for line, value, error in records:
+            row = None
+            if error is None:
+                row, error = validate_activity(value)
+            if error is not None:
+                report["rejected"] += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"line": line, "error": error})
+            else:
+                pending.append(row)
+
+    async for data in chunks:
+        handle(parser.feed(data))
+        await write_pending()
+    handle(parser.feed(b"", final=True))
+    await write_pending(final=True)
+
+    return {**report, "errors": errors, "errors_truncated": report["rejected"] > len(errors)}
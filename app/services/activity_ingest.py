@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.db.models.ads import UserActivity
+from app.db.session import SessionLocal
+from app.services.activity_stats import ActivityStatsStore, activity_stats
+
+logger = logging.getLogger(__name__)
+
+BatchListener = Callable[[List[Dict]], None]
+
+def normalize_timestamp(timestamp: Optional[datetime]) -> datetime:
+    """Naive UTC, as stored; events without a timestamp are stamped on acceptance."""
+    if timestamp is None:
+        return datetime.utcnow()
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+class ActivityIngestor:
+    """Accepts activity events into a bounded queue and group-commits them.
+
+    `submit` only enqueues, so the request returns immediately. A flusher
+    thread writes whatever has arrived, up to `batch_size` rows, as one
+    executemany INSERT and one commit. When the queue is full `submit`
+    waits at most `enqueue_timeout` seconds and then rejects the event,
+    which the endpoint turns into a 503 so clients back off.
+    """
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        max_queue: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        enqueue_timeout: Optional[float] = None,
+        stats: Optional[ActivityStatsStore] = activity_stats
+    ):
+        self.session_factory = session_factory
+        self.stats = stats
+        self.batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.INGEST_FLUSH_INTERVAL
+        self.enqueue_timeout = settings.INGEST_ENQUEUE_TIMEOUT if enqueue_timeout is None else enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_queue or settings.INGEST_QUEUE_SIZE)
+        self._listeners: List[BatchListener] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._counters = {
+            "enqueued": 0,
+            "rejected": 0,
+            "written": 0,
+            "failed": 0,
+            "batches": 0,
+            "last_batch_size": 0,
+            "last_flush_ms": 0.0,
+            "max_queue_depth": 0
+        }
+
+    def add_listener(self, listener: BatchListener):
+        """Call `listener(rows)` after every committed batch."""
+        self._listeners.append(listener)
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self._counters[name] += value
+
+    def submit(self, event: Dict) -> bool:
+        """Enqueue one event; False means the queue stayed full and it was rejected."""
+        self.ensure_started()
+        event = {**event, "timestamp": normalize_timestamp(event.get("timestamp"))}
+        try:
+            self._queue.put(event, timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._count(rejected=1)
+            return False
+        self._enqueued()
+        return True
+
+    async def submit_async(self, event: Dict) -> bool:
+        """`submit` for the event loop: waits for room with asyncio.sleep instead of blocking."""
+        self.ensure_started()
+        event = {**event, "timestamp": normalize_timestamp(event.get("timestamp"))}
+        deadline = time.monotonic() + self.enqueue_timeout
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                break
+            except queue.Full:
+                if time.monotonic() >= deadline:
+                    self._count(rejected=1)
+                    return False
+                await asyncio.sleep(min(0.005, self.enqueue_timeout))
+        self._enqueued()
+        return True
+
+    def _enqueued(self):
+        with self._lock:
+            self._counters["enqueued"] += 1
+            self._counters["max_queue_depth"] = max(self._counters["max_queue_depth"], self._queue.qsize())
+
+    def write_batch(self, db: Session, rows: List[Dict]) -> int:
+        """Insert `rows` with a single executemany statement (not committed)."""
+        if rows:
+            db.execute(insert(UserActivity), rows)
+            self._update_stats(db, rows)
+        return len(rows)
+
+    def _update_stats(self, db: Session, rows: List[Dict]):
+        # Same transaction as the insert, so the aggregates never drift from the rows
+        if self.stats is not None:
+            self.stats.apply(db, rows)
+
+    def write_now(self, db: Session, rows: List[Dict]) -> int:
+        """Insert `rows` right away as one multi-row INSERT and commit, bypassing the queue."""
+        if not rows:
+            return 0
+        started = time.perf_counter()
+        db.execute(insert(UserActivity).values(rows))
+        self._update_stats(db, rows)
+        db.commit()
+        self._committed(rows, started)
+        return len(rows)
+
+    def _committed(self, rows: List[Dict], started: float):
+        with self._lock:
+            self._counters["written"] += len(rows)
+            self._counters["batches"] += 1
+            self._counters["last_batch_size"] = len(rows)
+            self._counters["last_flush_ms"] = (time.perf_counter() - started) * 1000
+        self.notify(rows)
+
+    def notify(self, rows: List[Dict]):
+        for listener in self._listeners:
+            try:
+                listener(rows)
+            except Exception:
+                logger.exception("Activity batch listener failed")
+
+    def _drain(self, first: Optional[Dict] = None) -> List[Dict]:
+        rows = [first] if first is not None else []
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def flush(self, first: Optional[Dict] = None) -> int:
+        """Write one batch of queued events; returns how many rows were committed."""
+        rows = self._drain(first)
+        if not rows:
+            return 0
+
+        started = time.perf_counter()
+        try:
+            written = self._write_isolating(rows)
+        except Exception:
+            logger.exception("Failed to write %d activity events", len(rows))
+            self._count(failed=len(rows))
+            return 0
+
+        if written:
+            self._committed(written, started)
+        return len(written)
+
+    def _write_isolating(self, rows: List[Dict]) -> List[Dict]:
+        """Commit `rows`; if a row breaks a constraint, bisect so only the bad rows are dropped.
+
+        Events are accepted before they are validated, so one unknown user or
+        ad id must not take the rest of its batch down with it. Any other
+        error (the database is unreachable) fails the whole batch at once.
+        """
+        try:
+            with self.session_factory() as db:
+                self.write_batch(db, rows)
+                db.commit()
+            return rows
+        except (IntegrityError, DataError) as error:
+            if len(rows) == 1:
+                logger.warning("Dropped activity event %s: %s", rows[0], error.orig)
+                self._count(failed=1)
+                return []
+        middle = len(rows) // 2
+        return self._write_isolating(rows[:middle]) + self._write_isolating(rows[middle:])
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # Give a burst a moment to accumulate so it lands in one commit
+            if self._queue.qsize() < self.batch_size and not self._stop.is_set():
+                time.sleep(min(self.flush_interval, 0.01))
+            self.flush(first)
+
+    def ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="activity-ingest", daemon=True)
+                self._thread.start()
+
+    def shutdown(self, timeout: float = 10.0):
+        """Stop the flusher thread and write out everything still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # Until empty: a batch whose rows were all dropped commits nothing but is not the last
+        while not self._queue.empty():
+            self.flush()
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize
+            }
+
+activity_ingestor = ActivityIngestor()
+
+def get_activity_ingestor() -> ActivityIngestor:
+    return activity_ingestor
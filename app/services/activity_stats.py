@@ -0,0 +1,223 @@
+"""Per-user activity aggregates, maintained as events are ingested.
+
+Usage (backfill or repair):
+    python -m app.services.activity_stats
+
+Rebuilds user_activity_stats from the full user_activities table plus the
+daily activity_rollups left by retention. Run it while ingestion is
+stopped, or events written during the rebuild may be counted twice.
+"""
+import argparse
+import math
+import numpy as np
+from datetime import datetime, time
+from typing import Dict, List, Optional, Sequence
+from sqlalchemy import case, delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.core.recommendation.features import (
+    DECAY_DAYS, ONE_DAY_US, PURCHASE, UNKNOWN_ACTIVITY, USER_FEATURES, FeatureExtractor, group_by_user
+)
+from app.db.models.activity_rollups import ActivityRollup
+from app.db.models.ads import Ad, UserActivity
+from app.db.models.user_activity_stats import UserActivityStats
+
+# Engagement is stored relative to a fixed epoch so that adding an event is a
+# plain addition; float64 has headroom for about 58 years past it
+ENGAGEMENT_EPOCH = datetime(2020, 1, 1)
+ENGAGEMENT_EPOCH_US = int(np.datetime64(ENGAGEMENT_EPOCH, "us").astype(np.int64))
+
+COUNT_COLUMNS = ("view_count", "click_count", "save_count", "purchase_count", "other_count")
+ADDITIVE_COLUMNS = COUNT_COLUMNS + ("total_spent", "engagement_base")
+
+class ActivityStatsStore:
+    """Reads and incremental upserts of user_activity_stats.
+
+    Each batch is reduced to one row per user in NumPy and merged with a
+    single INSERT ... ON CONFLICT DO UPDATE, so counts and spend add up,
+    first/last timestamps widen, and nothing is read back first. The
+    engagement score decays at read time from the stored base.
+    """
+    def __init__(self):
+        self.feature_extractor = FeatureExtractor()
+
+    def apply(self, db: Session, rows: List[Dict]) -> int:
+        """Fold a batch of new activity rows into the stats (caller commits)."""
+        if not rows:
+            return 0
+        now = datetime.utcnow()
+        purchased = {row["ad_id"] for row in rows if row["activity_type"] == "purchase"}
+        prices = dict(db.execute(select(Ad.id, Ad.price).where(Ad.id.in_(purchased))).all()) if purchased else {}
+        return self.apply_columns(
+            db,
+            [row["user_id"] for row in rows],
+            self.feature_extractor.encode_activity_types([row["activity_type"] for row in rows]),
+            [row.get("timestamp") or now for row in rows],
+            np.array([prices.get(row["ad_id"]) or 0.0 for row in rows], dtype=np.float64)
+        )
+
+    def apply_columns(self, db: Session, user_ids, type_codes, timestamps, prices) -> int:
+        return self._write(db, self._aggregate(user_ids, type_codes, timestamps, prices))
+
+    def _aggregate(self, user_ids, type_codes, timestamps, prices, counts=None):
+        """One row per user: additive columns summed, first/last timestamp in microseconds.
+
+        `counts` weights each row as that many identical events (rollup rows).
+        """
+        type_codes = np.asarray(type_codes, dtype=np.int64)
+        stamps = np.asarray(timestamps, dtype="datetime64[us]").astype(np.int64)
+        sums = np.zeros((len(type_codes), len(ADDITIVE_COLUMNS)), dtype=np.float64)
+        sums[np.arange(len(type_codes)), type_codes] = 1.0
+        sums[:, UNKNOWN_ACTIVITY + 1] = np.where(type_codes == PURCHASE, np.nan_to_num(prices), 0.0)
+        days = (stamps - ENGAGEMENT_EPOCH_US) / ONE_DAY_US
+        sums[:, UNKNOWN_ACTIVITY + 2] = self.feature_extractor.type_weights()[type_codes] * np.exp(days / DECAY_DAYS)
+        if counts is not None:
+            sums *= np.asarray(counts, dtype=np.float64)[:, None]
+        return group_by_user(np.asarray(user_ids, dtype=np.int64), sums, stamps, stamps)
+
+    def _write(self, db: Session, aggregates, batch_size: int = 5000) -> int:
+        users, totals, firsts, lasts = aggregates
+        now = datetime.utcnow()
+        params = [
+            {
+                "user_id": user_id,
+                **{name: int(value) for name, value in zip(COUNT_COLUMNS, counts)},
+                "total_spent": float(spent),
+                "engagement_base": float(engagement),
+                "first_activity_at": first,
+                "last_activity_at": last,
+                "updated_at": now
+            }
+            for user_id, (*counts, spent, engagement), first, last in zip(
+                users.tolist(),
+                totals.tolist(),
+                firsts.astype("datetime64[us]").tolist(),
+                lasts.astype("datetime64[us]").tolist()
+            )
+        ]
+        statement = self._upsert(db)
+        for start in range(0, len(params), batch_size):
+            db.execute(statement, params[start:start + batch_size])
+        return len(params)
+
+    def _upsert(self, db: Session):
+        table = UserActivityStats.__table__
+        dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+        statement = dialect.insert(table)
+        new = statement.excluded
+        updates = {name: table.c[name] + new[name] for name in ADDITIVE_COLUMNS}
+        updates["first_activity_at"] = case(
+            (new.first_activity_at < table.c.first_activity_at, new.first_activity_at),
+            else_=table.c.first_activity_at
+        )
+        updates["last_activity_at"] = case(
+            (new.last_activity_at > table.c.last_activity_at, new.last_activity_at),
+            else_=table.c.last_activity_at
+        )
+        updates["updated_at"] = new.updated_at
+        return statement.on_conflict_do_update(index_elements=[table.c.user_id], set_=updates)
+
+    def rebuild(self, db: Session, chunk_size: Optional[int] = None) -> int:
+        """Recompute every user's stats from user_activities and activity_rollups.
+
+        Returns the number of activities counted. Rolled-up days count as
+        midnight for first/last activity and engagement.
+        """
+        chunk_size = chunk_size or settings.TRAINING_CHUNK_SIZE
+        db.execute(delete(UserActivityStats))
+        activities = select(
+            UserActivity.user_id,
+            UserActivity.activity_type,
+            UserActivity.timestamp,
+            Ad.price
+        ).outerjoin(Ad, Ad.id == UserActivity.ad_id).execution_options(yield_per=chunk_size)
+        rollups = select(
+            ActivityRollup.user_id,
+            ActivityRollup.activity_type,
+            ActivityRollup.day,
+            Ad.price,
+            ActivityRollup.count
+        ).outerjoin(Ad, Ad.id == ActivityRollup.ad_id).execution_options(yield_per=chunk_size)
+
+        # Each chunk is reduced to per-user partials, so memory follows users, not rows
+        partials, total = [], 0
+        for rows in db.execute(activities).partitions():
+            user_ids, activity_types, timestamps, prices = zip(*rows)
+            partials.append(self._aggregate(
+                user_ids,
+                self.feature_extractor.encode_activity_types(activity_types),
+                timestamps,
+                np.array([np.nan if price is None else price for price in prices], dtype=np.float64)
+            ))
+            total += len(rows)
+        for rows in db.execute(rollups).partitions():
+            user_ids, activity_types, days, prices, counts = zip(*rows)
+            partials.append(self._aggregate(
+                user_ids,
+                self.feature_extractor.encode_activity_types(activity_types),
+                [datetime.combine(day, time()) for day in days],
+                np.array([np.nan if price is None else price for price in prices], dtype=np.float64),
+                counts
+            ))
+            total += sum(counts)
+        if partials:
+            users, totals, firsts, lasts = (np.concatenate(parts) for parts in zip(*partials))
+            self._write(db, group_by_user(users, totals, firsts, lasts))
+        db.commit()
+        return total
+
+    def engagement(self, stats: UserActivityStats, current_time: Optional[datetime] = None) -> float:
+        """Decayed engagement score as of `current_time`."""
+        current_time = current_time or datetime.utcnow()
+        days = (current_time - ENGAGEMENT_EPOCH).total_seconds() / 86400
+        return stats.engagement_base * math.exp(-days / DECAY_DAYS)
+
+    def get(self, db: Session, user_id: int, current_time: Optional[datetime] = None) -> Optional[Dict]:
+        stats = db.get(UserActivityStats, user_id)
+        if stats is None:
+            return None
+        return {
+            "user_id": stats.user_id,
+            **{name: getattr(stats, name) for name in COUNT_COLUMNS + ("total_spent",)},
+            "total_count": sum(getattr(stats, name) for name in COUNT_COLUMNS),
+            "first_activity_at": stats.first_activity_at,
+            "last_activity_at": stats.last_activity_at,
+            "engagement": self.engagement(stats, current_time)
+        }
+
+    def event_count(self, db: Session, user_id: int) -> int:
+        """Events counted for `user_id` so far; it changes with every batch that includes the user."""
+        total = db.execute(
+            select(sum(getattr(UserActivityStats, name) for name in COUNT_COLUMNS)).where(UserActivityStats.user_id == user_id)
+        ).scalar()
+        return int(total or 0)
+
+    def user_features(self, db: Session, user_ids: Sequence[int]) -> np.ndarray:
+        """USER_FEATURES rows for `user_ids` from one indexed read; zeros for users without activity."""
+        features = np.zeros((len(user_ids), len(USER_FEATURES)))
+        row_of = {user_id: row for row, user_id in enumerate(user_ids)}
+        statement = select(UserActivityStats).where(UserActivityStats.user_id.in_(list(row_of)))
+        for stats in db.execute(statement).scalars():
+            counts = [getattr(stats, name) for name in COUNT_COLUMNS]
+            time_span = (stats.last_activity_at - stats.first_activity_at).days + 1
+            features[row_of[stats.user_id]] = counts[:UNKNOWN_ACTIVITY] + [stats.total_spent, sum(counts) / time_span]
+        return features
+
+activity_stats = ActivityStatsStore()
+
+def main():
+    from app.db.models import users  # noqa: F401  (registers the tables the foreign keys point at)
+    from app.db.session import Base, SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        total = activity_stats.rebuild(db, args.chunk_size)
+    print(f"user_activity_stats rebuilt from {total} activities")
+
+if __name__ == "__main__":
+    main()
@@ -1,97 +1,131 @@
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from app.core.recommendation.model import AdsRecommender
-from app.db.models.ads import Ad, UserActivity
-from app.core.schemas.ads import AdCreate
-from datetime import datetime
-import json
-
-from app.db.models.users import User
+from sqlalchemy.orm import Session, defer
+from typing import List, Optional, Tuple
+from app.config import settings
+from app.core.recommendation.cache import recommendation_cache
+from app.core.recommendation.catalog import CatalogData, ad_catalog
+from app.core.recommendation.jobs import snapshot_refresher
+from app.core.recommendation.materialize import PrecomputedRecommendations, precomputed_recommendations
+from app.core.recommendation.pipeline import RankingPipeline, RankingRequest, recommendation_pipeline
+from app.core.recommendation.snapshot import ModelSnapshot, model_registry
+from app.db.models.ads import Ad
+from app.core.schemas.ads import AdCreate, AdResponse, RecommendationResponse
+from app.services.activity_ingest import activity_ingestor
+from app.services.activity_stats import activity_stats
+from app.services.preferences import CandidateFilter, preference_cache
 
 class AdsService:
-    def __init__(self):
-        self.recommender = AdsRecommender()
+    def __init__(
+        self,
+        registry=model_registry,
+        refresher=snapshot_refresher,
+        catalog=ad_catalog,
+        cache=recommendation_cache,
+        preferences=preference_cache,
+        similarity_threshold: Optional[float] = None,
+        pipeline: RankingPipeline = recommendation_pipeline,
+        precomputed: Optional[PrecomputedRecommendations] = precomputed_recommendations
+    ):
+        self.registry = registry
+        self.refresher = refresher
+        self.catalog = catalog
+        self.cache = cache
+        self.preferences = preferences
+        self.pipeline = pipeline
+        self.precomputed = precomputed
+        self.similarity_threshold = (
+            settings.SIMILARITY_THRESHOLD if similarity_threshold is None else similarity_threshold
+        )
         
     def create_ad(self, db: Session, ad: AdCreate) -> Ad:
         db_ad = Ad(**ad.dict())
         db.add(db_ad)
         db.commit()
         db.refresh(db_ad)
-        return db_ad
-    
-    def get_recommendations(self, db: Session, user_id: int, limit: int = 10) -> List[Ad]:
-        # Get user activities
-        activities = db.query(UserActivity).filter(
-            UserActivity.user_id == user_id
-        ).all()
         
-        # Prepare training data
-        training_data = [
-            (act.user_id, act.ad_id, self._get_activity_weight(act.activity_type))
-            for act in activities
-        ]
+        catalog = self.catalog.get(db)
+        self.catalog.add_ad(db_ad.id, db_ad.category, db_ad.price)
         
-        # Train model if we have data
-        if training_data:
-            self.recommender.train(training_data)
+        # Make the new ad retrievable right away, placed among its category peers
+        snapshot = self.registry.current()
+        if snapshot is not None:
+            peer_ids = catalog.ids[catalog.category_rows(db_ad.category)].tolist()
+            snapshot.add_items([db_ad.id], snapshot.cold_start_embedding(peer_ids))
+        return db_ad
+    
+    def get_recommendations(self, db: Session, user_id: int, limit: int = 10) -> List[RecommendationResponse]:
+        # Pick up models trained by the worker process (checked in the background)
+        if self.refresher is not None:
+            self.refresher.maybe_refresh()
         
-        # Get all available ads
-        ads = db.query(Ad).all()
-        ad_ids = [ad.id for ad in ads]
+        # Read the published model once so the whole request sees one version
+        snapshot = self.registry.current()
         
         # Get recommendations
-        recommendations = self.recommender.recommend(user_id, ad_ids, top_k=limit)
-        
-        # Fetch recommended ads
-        recommended_ads = []
-        for ad_id, score in recommendations:
-            ad = db.query(Ad).filter(Ad.id == ad_id).first()
-            if ad:
-                setattr(ad, 'similarity_score', score)
-                recommended_ads.append(ad)
-                
-        return recommended_ads
-    
-    def track_activity(self, db: Session, activity: UserActivity) -> UserActivity:
-        db_activity = UserActivity(**activity.dict())
-        db.add(db_activity)
-        db.commit()
-        db.refresh(db_activity)
-        
-        # Update user embedding after new activity
-        self._update_user_embedding(db, activity.user_id)
+        if snapshot is None:
+            # No model trained yet: every eligible ad scores zero, as an untrained model would
+            catalog = self.catalog.get(db)
+            candidate_filter = self._candidate_filter(db, user_id)
+            ad_ids = catalog.ids if candidate_filter is None else catalog.ids[candidate_filter.rows(catalog)]
+            recommendations = [(ad_id, 0.0) for ad_id in ad_ids[:limit].tolist()]
+        else:
+            key = (user_id, limit, snapshot.version)
+            cached = self.cache is not None and self.cache.enabled
+            # Read before ranking: activity arriving meanwhile makes the stored entry stale
+            watermark = activity_stats.event_count(db, user_id) if cached else None
+            recommendations = self.cache.get(key, watermark) if cached else None
+            if recommendations is None:
+                recommendations = self._rank(db, snapshot, user_id, limit)
+                if cached:
+                    self.cache.put(key, recommendations, watermark)
         
-        return db_activity
+        return self._hydrate(db, recommendations)
     
-    def get_categories(self, db: Session) -> List[str]:
-        return db.query(Ad.category).distinct().all()
+    def _candidate_filter(self, db: Session, user_id: int) -> Optional[CandidateFilter]:
+        return self.preferences.get(db, user_id) if self.preferences is not None else None
     
-    def _get_activity_weight(self, activity_type: str) -> float:
-        """Convert activity type to numerical weight for training."""
-        weights = {
-            "view": 0.2,
-            "click": 0.5,
-            "save": 0.8,
-            "purchase": 1.0
-        }
-        return weights.get(activity_type, 0.1)
+    def _rank(self, db: Session, snapshot: ModelSnapshot, user_id: int, limit: int) -> List[Tuple[int, float]]:
+        candidate_filter = self._candidate_filter(db, user_id)
+        catalog = self.catalog.get(db)
+        # Without a filter candidates come from the table materialized after
+        # training, else the snapshot's ANN index; with one, filtered-out ads
+        # are never scored
+        retrieved = None
+        if candidate_filter is None and self.precomputed is not None:
+            retrieved = self.precomputed.get(db, snapshot, user_id)
+        request = RankingRequest(
+            snapshot,
+            catalog,
+            user_id,
+            limit,
+            candidate_rows=None if candidate_filter is None else candidate_filter.rows(catalog),
+            user_features=activity_stats.user_features(db, [user_id])[0] if self.pipeline.needs_user_features else None,
+            min_similarity=self.similarity_threshold,
+            retrieved=retrieved
+        )
+        return self.pipeline.run(request)
     
-    def _update_user_embedding(self, db: Session, user_id: int):
-        """Update user embedding based on recent activities."""
-        activities = db.query(UserActivity).filter(
-            UserActivity.user_id == user_id
+    def _hydrate(self, db: Session, recommendations: List[Tuple[int, float]]) -> List[RecommendationResponse]:
+        """Load the recommended ads with one IN query, keeping score order."""
+        if not recommendations:
+            return []
+        ads = db.query(Ad).options(defer(Ad.embedding)).filter(
+            Ad.id.in_([ad_id for ad_id, _ in recommendations])
         ).all()
-        
-        if activities:
-            training_data = [
-                (act.user_id, act.ad_id, self._get_activity_weight(act.activity_type))
-                for act in activities
-            ]
-            self.recommender.train(training_data)
-            
-            # Save updated embedding
-            embedding = self.recommender.get_user_embedding(user_id)
-            user = db.query(User).filter(User.id == user_id).first()
-            if user:
-                user.embedding = json.dumps(embedding.tolist())
-                db.commit()
\ No newline at end of file
+        ads_by_id = {ad.id: ad for ad in ads}
+        # Ads deleted since the model was trained are skipped
+        return [
+            RecommendationResponse(ad=AdResponse.model_validate(ads_by_id[ad_id]), score=score)
+            for ad_id, score in recommendations
+            if ad_id in ads_by_id
+        ]
+    
+    def get_catalog(self, db: Session) -> CatalogData:
+        return self.catalog.get(db)
+    
+    def get_categories(self, db: Session) -> List[str]:
+        return self.catalog.get(db).categories
+
+# New activity changes what a user should see; drop their cached rankings
+activity_ingestor.add_listener(
+    lambda rows: recommendation_cache.invalidate_users(row["user_id"] for row in rows)
+)
@@ -0,0 +1,94 @@
+import json
+import logging
+import math
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.core.recommendation.catalog import CatalogData
+from app.core.schemas.users import UserPreferences
+from app.db.models.users import User
+
+logger = logging.getLogger(__name__)
+
+class CandidateFilter:
+    """The catalog restrictions implied by a user's stored preferences."""
+    __slots__ = ("categories", "min_price", "max_price")
+
+    def __init__(self, categories: Tuple[str, ...] = (), min_price: Optional[float] = None, max_price: Optional[float] = None):
+        self.categories = categories
+        self.min_price = min_price
+        self.max_price = max_price
+
+    @classmethod
+    def from_preferences(cls, preferences: UserPreferences) -> Optional["CandidateFilter"]:
+        """None when the preferences do not restrict anything (the defaults)."""
+        price_range = preferences.price_range or {}
+        min_price = price_range.get("min")
+        max_price = price_range.get("max")
+        if min_price is not None and min_price <= 0:
+            min_price = None
+        if max_price is not None and math.isinf(max_price):
+            max_price = None
+        categories = tuple(sorted(set(preferences.categories)))
+        if not categories and min_price is None and max_price is None:
+            return None
+        return cls(categories, min_price, max_price)
+
+    def rows(self, catalog: CatalogData) -> np.ndarray:
+        return catalog.filter_rows(self.categories, self.min_price, self.max_price)
+
+class PreferenceCache:
+    """Parsed per-user candidate filters, so preferences JSON is decoded once per change.
+
+    Bounded LRU; `invalidate` must be called whenever a user's preferences
+    are written. That only reaches this process, so entries also expire
+    after `ttl` seconds, which bounds how long other workers filter with
+    preferences that have since changed.
+    """
+    def __init__(
+        self,
+        max_users: Optional[int] = None,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_users = max_users or settings.PREFERENCE_CACHE_SIZE
+        self.ttl = settings.PREFERENCE_CACHE_TTL if ttl is None else ttl
+        self.clock = clock
+        # user id -> (expires at, filter)
+        self._filters: "OrderedDict[int, Tuple[float, Optional[CandidateFilter]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, user_id: int) -> Optional[CandidateFilter]:
+        with self._lock:
+            entry = self._filters.get(user_id)
+            if entry is not None:
+                if entry[0] > self.clock():
+                    self._filters.move_to_end(user_id)
+                    return entry[1]
+                del self._filters[user_id]
+
+        raw = db.execute(select(User.preferences).where(User.id == user_id)).scalar()
+        candidate_filter = None
+        if raw:
+            try:
+                candidate_filter = CandidateFilter.from_preferences(UserPreferences.model_validate(json.loads(raw)))
+            except ValueError:
+                logger.warning("Ignoring unreadable preferences of user %s", user_id)
+
+        with self._lock:
+            self._filters[user_id] = (self.clock() + self.ttl, candidate_filter)
+            self._filters.move_to_end(user_id)
+            while len(self._filters) > self.max_users:
+                self._filters.popitem(last=False)
+        return candidate_filter
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._filters.pop(user_id, None)
+
+preference_cache = PreferenceCache()
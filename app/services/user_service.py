@@ -1,14 +1,40 @@
+import base64
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from app.db.models.users import User
 from app.db.models.ads import UserActivity
+from app.core.recommendation.cache import recommendation_cache
 from app.core.schemas.users import UserCreate, UserPreferences
+from app.services.activity_stats import activity_stats
+from app.services.preferences import preference_cache
 from datetime import datetime
 import json
 from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+ACTIVITY_COLUMNS = (
+    UserActivity.id,
+    UserActivity.user_id,
+    UserActivity.ad_id,
+    UserActivity.activity_type,
+    UserActivity.timestamp
+)
+
+def encode_cursor(timestamp: datetime, activity_id: int) -> str:
+    """Opaque position after the row (timestamp, id) in newest-first order."""
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{activity_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError on anything it did not produce."""
+    try:
+        timestamp, activity_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(activity_id)
+    except (ValueError, UnicodeError) as error:
+        raise ValueError("Invalid cursor") from error
+
 class UserService:
     def create_user(self, db: Session, user: UserCreate) -> User:
         hashed_password = pwd_context.hash(user.password)
@@ -24,6 +50,9 @@ class UserService:
     def get_user(self, db: Session, user_id: int) -> Optional[User]:
         return db.query(User).filter(User.id == user_id).first()
     
+    async def get_user_async(self, db: AsyncSession, user_id: int) -> Optional[User]:
+        return await db.get(User, user_id)
+    
     def get_user_by_email(self, db: Session, email: str) -> Optional[User]:
         return db.query(User).filter(User.email == email).first()
     
@@ -33,12 +62,79 @@ class UserService:
             db_user.preferences = json.dumps(preferences.model_dump())
             db.commit()
             db.refresh(db_user)
+            # Rankings were filtered with the old preferences
+            preference_cache.invalidate(user_id)
+            recommendation_cache.invalidate_users([user_id])
         return db_user
     
-    def get_activity_history(self, db: Session, user_id: int) -> List[UserActivity]:
-        return db.query(UserActivity).filter(
-            UserActivity.user_id == user_id
-        ).order_by(UserActivity.timestamp.desc()).all()
+    def _activity_query(
+        self,
+        user_id: int,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        after: Optional[Tuple[datetime, int]] = None
+    ):
+        # Keyset order (timestamp, id) descending, an index range scan on
+        # ix_user_activities_user_timestamp however deep the page is
+        statement = select(*ACTIVITY_COLUMNS).where(UserActivity.user_id == user_id)
+        if since is not None:
+            statement = statement.where(UserActivity.timestamp >= since)
+        if until is not None:
+            statement = statement.where(UserActivity.timestamp < until)
+        if after is not None:
+            statement = statement.where(tuple_(UserActivity.timestamp, UserActivity.id) < tuple_(*after))
+        return statement.order_by(UserActivity.timestamp.desc(), UserActivity.id.desc())
+
+    def get_activity_history(
+        self,
+        db: Session,
+        user_id: int,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """One page of activity, newest first, and the cursor for the next page (None on the last).
+
+        `since` is inclusive and `until` exclusive. Raises ValueError for a
+        malformed cursor.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        statement = self._activity_query(user_id, since, until, after).limit(limit + 1)
+        rows = [dict(row._mapping) for row in db.execute(statement)]
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+
+    def iter_activity_history(
+        self,
+        db: Session,
+        user_id: int,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        page_size: int = 1000
+    ) -> Iterator[Dict]:
+        """The whole (windowed) history, newest first, fetched one keyset page at a time.
+
+        Each page is its own short query and the transaction is rolled back
+        between pages, so an export never holds a cursor or a snapshot open
+        while the client reads slowly. Do not pass a session with pending
+        changes.
+        """
+        after = None
+        while True:
+            statement = self._activity_query(user_id, since, until, after).limit(page_size)
+            rows = [dict(row._mapping) for row in db.execute(statement)]
+            db.rollback()
+            yield from rows
+            if len(rows) < page_size:
+                return
+            after = (rows[-1]["timestamp"], rows[-1]["id"])
+    
+    def get_activity_stats(self, db: Session, user_id: int) -> Optional[dict]:
+        """Aggregates kept current on ingest; one primary-key read instead of a history scan."""
+        return activity_stats.get(db, user_id)
     
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
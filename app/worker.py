@@ -0,0 +1,32 @@
+"""Standalone training worker.
+
+Usage:
+    python -m app.worker
+
+Runs queued training jobs from the training_jobs table and writes the
+embeddings back to the database; API processes pick the new model up from
+there. Run exactly one per deployment, with TRAINING_WORKER_MODE=external
+(the default) on the API side.
+"""
+import logging
+import signal
+import threading
+from app.core.recommendation.jobs import TrainingJobQueue, TrainingWorker
+from app.core.recommendation.training import ModelTrainer
+from app.db.partitions import activity_partitions
+from app.db.session import engine
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    # Same schema as the API: a plain create_all here would leave the activity tables unpartitioned
+    activity_partitions.create_all(engine)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    worker = TrainingWorker(TrainingJobQueue(), ModelTrainer(registry=None))
+    worker.run_forever(stop)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Recall@k and latency of the ANN candidate index against brute force.
+
+Usage:
+    python -m benchmarks.ann_benchmark --sizes 10000 100000 1000000 --k 10
+
+Embeddings are synthetic: a Gaussian mixture shaped like trained ad
+embeddings (items cluster by category), L2-normalized like the serving path.
+"""
+import argparse
+import time
+import numpy as np
+from app.core.recommendation.ann import BruteForceIndex, IVFFlatIndex
+
+
+def make_embeddings(n: int, dim: int, n_clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    return centers[labels] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+
+
+def time_queries(index, queries: np.ndarray, k: int, **kwargs):
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append(index.search(query, k, **kwargs)[0])
+    elapsed = time.perf_counter() - start
+    return results, elapsed / len(queries) * 1000
+
+
+def recall_at_k(approximate, exact) -> float:
+    hits = sum(
+        len({ad_id for ad_id, _ in found} & {ad_id for ad_id, _ in truth})
+        for found, truth in zip(approximate, exact)
+    )
+    return hits / sum(len(truth) for truth in exact)
+
+
+def run(size: int, dim: int, k: int, n_queries: int, n_probes, seed: int):
+    rng = np.random.default_rng(seed)
+    vectors = make_embeddings(size, dim, n_clusters=max(16, size // 2000), rng=rng)
+    ids = np.arange(size)
+    queries = make_embeddings(n_queries, dim, n_clusters=16, rng=rng)
+
+    brute = BruteForceIndex().build(ids, vectors)
+    exact, brute_ms = time_queries(brute, queries, k)
+
+    start = time.perf_counter()
+    ivf = IVFFlatIndex().build(ids, vectors)
+    build_s = time.perf_counter() - start
+
+    print(f"\nn={size:,} dim={dim} k={k} lists={len(ivf._lists)} build={build_s:.1f}s")
+    print(f"  {'brute force':<14} recall=1.000  latency={brute_ms:8.3f} ms")
+    for n_probe in n_probes:
+        found, ivf_ms = time_queries(ivf, queries, k, n_probe=n_probe)
+        print(
+            f"  {'ivf n_probe=' + str(n_probe):<14} recall={recall_at_k(found, exact):.3f}"
+            f"  latency={ivf_ms:8.3f} ms  speedup={brute_ms / ivf_ms:5.1f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.dim, args.k, args.queries, args.n_probe, args.seed)
+
+
+if __name__ == "__main__":
+    main()
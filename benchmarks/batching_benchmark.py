@@ -0,0 +1,107 @@
+"""Retrieval throughput with and without request micro-batching.
+
+Usage:
+    python -m benchmarks.batching_benchmark --items 100000 --threads 64 --windows 0 1 2 5 --indexes brute ivf
+
+Each of `--threads` threads asks for top-k of random users back to back,
+the way concurrent recommendation requests reach the retrieval stage.
+Window 0 scores every request alone; larger windows go through a
+RecommendationBatcher with that window. Every index is reported on its
+own, starting with one `--max-batch` search against the same users
+scored one at a time.
+"""
+import argparse
+import threading
+import time
+import numpy as np
+from app.core.recommendation.ann import BruteForceIndex, IVFFlatIndex
+from app.core.recommendation.batching import RecommendationBatcher
+from app.core.recommendation.snapshot import ModelSnapshot
+
+
+def time_batch(snapshot, users: int, k: int, repeats: int = 5):
+    user_ids = list(range(users))
+    timings = {}
+    for name, search in (
+        ("batched", lambda: snapshot.recommend_batch(user_ids, top_k=k)),
+        ("one at a time", lambda: [snapshot.recommend(user_id, top_k=k) for user_id in user_ids])
+    ):
+        search()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            search()
+        timings[name] = (time.perf_counter() - start) / repeats
+    print(
+        f"{users} users in one search: {timings['batched'] * 1000:.1f} ms batched, "
+        f"{timings['one at a time'] * 1000:.1f} ms one at a time"
+    )
+
+
+def run(snapshot, window_ms: float, threads: int, requests: int, max_batch: int, k: int):
+    batcher = RecommendationBatcher(window_ms=window_ms, max_batch=max_batch) if window_ms > 0 else None
+    n_users = len(snapshot.user_map)
+    latencies = [[] for _ in range(threads)]
+    per_thread = requests // threads
+
+    def client(slot: int):
+        rng = np.random.default_rng(slot)
+        for user_id in rng.integers(0, n_users, size=per_thread).tolist():
+            start = time.perf_counter()
+            if batcher is None:
+                snapshot.recommend(user_id, top_k=k)
+            else:
+                batcher.recommend(snapshot, user_id, k)
+            latencies[slot].append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=client, args=(slot,)) for slot in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    p50, p99 = np.percentile(np.concatenate(latencies) * 1000, [50, 99])
+    line = f"window {window_ms:4.1f} ms: {per_thread * threads / elapsed:8,.0f} req/s  p50 {p50:6.2f} ms  p99 {p99:6.2f} ms"
+    if batcher is not None:
+        line += f"  avg batch {batcher.stats()['avg_batch_size']:.1f}"
+        batcher.shutdown()
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--k", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 1, 2, 5])
+    parser.add_argument("--indexes", nargs="+", choices=["brute", "ivf"], default=["brute", "ivf"])
+    parser.add_argument("--n-probe", type=int, default=16)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    user_embeddings = rng.normal(size=(args.users, args.dim))
+    item_ids = np.arange(args.items)
+    item_embeddings = rng.normal(size=(args.items, args.dim))
+    for name in args.indexes:
+        index = BruteForceIndex() if name == "brute" else IVFFlatIndex(n_probe=args.n_probe)
+        snapshot = ModelSnapshot(
+            version=1,
+            user_ids=list(range(args.users)),
+            user_embeddings=user_embeddings,
+            item_ids=item_ids,
+            item_embeddings=item_embeddings,
+            index=index.build(item_ids, item_embeddings)
+        )
+        print(f"{name}, {args.items:,} items")
+        time_batch(snapshot, args.max_batch, args.k)
+        for window_ms in args.windows:
+            run(snapshot, window_ms, args.threads, args.requests, args.max_batch, args.k)
+
+
+if __name__ == "__main__":
+    main()
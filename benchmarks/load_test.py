@@ -0,0 +1,92 @@
+"""Throughput and latency of the hot endpoints under concurrent load.
+
+Usage (against a running server, e.g. `uvicorn app.main:app --workers 1`):
+    python -m benchmarks.load_test --url http://localhost:8000 --concurrency 500 --requests 20000
+
+Each of `--concurrency` clients sends requests back to back, cycling through
+recommendations, categories, user lookups and track-activity for random
+ids up to `--users` / `--ads`. Non-2xx answers other than 404 count as
+errors. Adding `health` to `--endpoints` shows how long a request that
+does no work waits for the event loop while the others run.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter, defaultdict
+import httpx
+import numpy as np
+
+
+def request_for(kind, rng, args):
+    user_id = rng.randint(1, args.users)
+    if kind == "recommendations":
+        return "GET", f"/api/v1/ads/recommendations/{user_id}", None
+    if kind == "categories":
+        return "GET", "/api/v1/ads/categories", None
+    if kind == "user":
+        return "GET", f"/api/v1/users/{user_id}", None
+    if kind == "health":
+        return "GET", "/health", None
+    activity = {"user_id": user_id, "ad_id": rng.randint(1, args.ads), "activity_type": "view"}
+    return "POST", "/api/v1/ads/track-activity", activity
+
+
+async def client_loop(client, kinds, remaining, latencies, statuses, rng, args):
+    while remaining[0] > 0:
+        remaining[0] -= 1
+        kind = kinds[remaining[0] % len(kinds)]
+        method, path, body = request_for(kind, rng, args)
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, path, json=body)
+            status = response.status_code
+        except httpx.HTTPError as error:
+            status = type(error).__name__
+        latencies[kind].append(time.perf_counter() - start)
+        statuses[(kind, status)] += 1
+
+
+async def run(args):
+    kinds = args.endpoints.split(",")
+    remaining = [args.requests]
+    latencies = defaultdict(list)
+    statuses = Counter()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            client_loop(client, kinds, remaining, latencies, statuses, random.Random(seed), args)
+            for seed in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+
+    total = sum(statuses.values())
+    errors = sum(
+        count for (_, status), count in statuses.items()
+        if not (isinstance(status, int) and (status < 300 or status == 404))
+    )
+    print(f"{total:,} requests, concurrency {args.concurrency}: {total / elapsed:,.0f} req/s, {errors:,} errors")
+    for kind in kinds:
+        seconds = np.array(latencies[kind]) * 1000
+        if not len(seconds):
+            continue
+        p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+        codes = ", ".join(f"{status}={count}" for (name, status), count in sorted(statuses.items(), key=str) if name == kind)
+        print(f"  {kind:<16} p50 {p50:7.1f} ms  p95 {p95:7.1f} ms  p99 {p99:7.1f} ms  [{codes}]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--ads", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--endpoints", default="recommendations,categories,user,track-activity")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,28 +3,37 @@ import sys
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 from app.main import app
-from app.db.session import Base, get_db
+from app.core.recommendation.catalog import ad_catalog
+from app.db.session import Base, get_async_db, get_async_read_db, get_db, get_read_db, get_read_session_factory
 from app.db.models.users import User
 from app.db.models.ads import Ad, UserActivity
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Create test database
-SQLALCHEMY_DATABASE_URL = "sqlite://"  # In-memory SQLite database
-
+# Create test database: a file per test rather than :memory:, so the sync
+# and async engines see the same data
 @pytest.fixture(scope="function")
-def engine():
+def engine(tmp_path):
     engine = create_engine(
-        SQLALCHEMY_DATABASE_URL,
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
+        f"sqlite:///{tmp_path / 'test.db'}",
+        connect_args={"check_same_thread": False}
     )
     Base.metadata.create_all(bind=engine)
     yield engine
-    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+@pytest.fixture(scope="function")
+def async_engine(engine):
+    # NullPool: connections never outlive the event loop that opened them
+    return create_async_engine(engine.url.set(drivername="sqlite+aiosqlite"), poolclass=NullPool)
+
+@pytest.fixture(scope="function")
+def AsyncTestingSessionLocal(async_engine):
+    return async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 @pytest.fixture(scope="function")
 def TestingSessionLocal(engine):
@@ -40,14 +49,24 @@ def db(TestingSessionLocal):
         session.close()
 
 @pytest.fixture(scope="function")
-def client(db):
+def client(db, TestingSessionLocal, AsyncTestingSessionLocal):
     def override_get_db():
         try:
             yield db
         finally:
             pass
     
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as session:
+            yield session
+    
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_read_session_factory] = lambda: TestingSessionLocal
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_async_read_db] = override_get_async_db
+    # The catalog cache is process-wide; start every test from its own database
+    ad_catalog.invalidate()
     with TestClient(app) as client:
         yield client
     app.dependency_overrides.clear()
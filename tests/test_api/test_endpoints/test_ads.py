@@ -1,15 +1,23 @@
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from app.main import app
-from app.db.session import Base, get_db
+from app.config import settings
+from app.core.recommendation.catalog import ad_catalog
+from app.db.session import Base, get_async_db, get_async_read_db, get_db, get_read_db
 from app.core.schemas.ads import AdCreate
+from app.db.models.ads import UserActivity
+from app.services.activity_ingest import ActivityIngestor, get_activity_ingestor
 
 # Setup test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 def override_get_db():
     try:
@@ -18,11 +26,19 @@ def override_get_db():
     finally:
         db.close()
 
+async def override_get_async_db():
+    async with AsyncTestingSessionLocal() as db:
+        yield db
+
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
+app.dependency_overrides[get_async_read_db] = override_get_async_db
 
 @pytest.fixture
 def client():
     Base.metadata.create_all(bind=engine)
+    ad_catalog.invalidate()
     with TestClient(app) as c:
         yield c
     Base.metadata.drop_all(bind=engine)
@@ -63,4 +79,89 @@ def test_get_recommendations(client):
     response = client.get(f"/api/v1/ads/recommendations/{user_id}")
     assert response.status_code == 200
     recommendations = response.json()
-    assert isinstance(recommendations, list)
\ No newline at end of file
+    assert isinstance(recommendations, list)
+
+def test_recommendation_limit_outside_its_bounds_is_rejected(client):
+    for limit in (0, -3, settings.MAX_RECOMMENDATIONS + 1):
+        response = client.get(f"/api/v1/ads/recommendations/1?limit={limit}")
+        assert response.status_code == 422
+
+def test_track_activity_is_accepted_and_written(client):
+    ingestor = ActivityIngestor(session_factory=TestingSessionLocal)
+    app.dependency_overrides[get_activity_ingestor] = lambda: ingestor
+    try:
+        response = client.post("/api/v1/ads/track-activity", json={
+            "user_id": 1,
+            "ad_id": 1,
+            "activity_type": "click"
+        })
+        assert response.status_code == 202
+        assert response.json() == {"status": "accepted"}
+
+        ingestor.shutdown()
+        db = TestingSessionLocal()
+        try:
+            assert db.query(UserActivity).filter(UserActivity.activity_type == "click").count() == 1
+        finally:
+            db.close()
+    finally:
+        del app.dependency_overrides[get_activity_ingestor]
+
+def test_track_activity_full_queue_returns_503(client):
+    ingestor = ActivityIngestor(session_factory=TestingSessionLocal, max_queue=1, enqueue_timeout=0)
+    ingestor.ensure_started = lambda: None
+    app.dependency_overrides[get_activity_ingestor] = lambda: ingestor
+    try:
+        event = {"user_id": 1, "ad_id": 1, "activity_type": "view"}
+        assert client.post("/api/v1/ads/track-activity", json=event).status_code == 202
+        response = client.post("/api/v1/ads/track-activity", json=event)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+    finally:
+        del app.dependency_overrides[get_activity_ingestor]
+
+def test_track_activity_batch_accepts_ndjson(client):
+    body = "\n".join([
+        '{"user_id": 1, "ad_id": 1, "activity_type": "view"}',
+        '{"user_id": 1, "ad_id": 2, "activity_type": "purchase"}',
+        'not json'
+    ])
+    response = client.post(
+        "/api/v1/ads/track-activity/batch",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["accepted"] == 2
+    assert data["rejected"] == 1
+    assert data["errors"][0]["line"] == 3
+
+def test_categories_support_conditional_requests(client):
+    for category in ["sports", "books", "sports"]:
+        client.post("/api/v1/ads/", json={
+            "title": "Test Ad",
+            "description": "Test Description",
+            "image_url": "http://example.com/image.jpg",
+            "category": category,
+            "price": 10.0
+        })
+
+    response = client.get("/api/v1/ads/categories")
+    assert response.status_code == 200
+    assert response.json() == ["books", "sports"]
+    etag = response.headers["ETag"]
+
+    response = client.get("/api/v1/ads/categories", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    client.post("/api/v1/ads/", json={
+        "title": "Test Ad",
+        "description": "Test Description",
+        "image_url": "http://example.com/image.jpg",
+        "category": "music",
+        "price": 10.0
+    })
+    response = client.get("/api/v1/ads/categories", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == ["books", "music", "sports"]
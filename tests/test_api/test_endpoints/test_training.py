@@ -0,0 +1,26 @@
+import pytest
+from app.core.recommendation.jobs import training_runner
+
+@pytest.fixture(autouse=True)
+def external_worker(monkeypatch):
+    # Jobs are only queued here; nothing starts a training process
+    monkeypatch.setattr(training_runner, "mode", "external")
+
+def test_trigger_training_queues_one_job(client):
+    first = client.post("/api/v1/training/trigger")
+    assert first.status_code == 200
+    assert first.json()["status"] == "queued"
+
+    second = client.post("/api/v1/training/trigger")
+    assert second.json()["job_id"] == first.json()["job_id"]
+
+def test_training_status_and_job(client):
+    assert client.get("/api/v1/training/status").json()["status"] == "idle"
+
+    job_id = client.post("/api/v1/training/trigger", params={"force": True}).json()["job_id"]
+    status = client.get("/api/v1/training/status").json()
+    assert status["job_id"] == job_id
+
+    job = client.get(f"/api/v1/training/jobs/{job_id}").json()
+    assert job["force"] is True
+    assert client.get("/api/v1/training/jobs/9999").status_code == 404
@@ -73,4 +73,44 @@ def test_get_activity_history(client):
     # Get activity history
     response = client.get(f"/api/v1/users/{user_id}/activity-history")
     assert response.status_code == 200
-    assert isinstance(response.json(), list)
\ No newline at end of file
+    assert isinstance(response.json(), list)
+
+def test_activity_history_pages_and_export(client, db, test_user, test_ad):
+    lines = [
+        f'{{"user_id": {test_user.id}, "ad_id": {test_ad.id}, "activity_type": "view", "timestamp": "2024-01-0{day}T00:00:00"}}'
+        for day in range(1, 6)
+    ]
+    assert client.post("/api/v1/ads/track-activity/batch", content="\n".join(lines)).status_code == 200
+    url = f"/api/v1/users/{test_user.id}/activity-history"
+
+    first = client.get(url, params={"limit": 3})
+    assert first.status_code == 200
+    assert [item["timestamp"][:10] for item in first.json()] == ["2024-01-05", "2024-01-04", "2024-01-03"]
+    second = client.get(url, params={"limit": 3, "cursor": first.headers["X-Next-Cursor"]})
+    assert [item["timestamp"][:10] for item in second.json()] == ["2024-01-02", "2024-01-01"]
+    assert "X-Next-Cursor" not in second.headers
+
+    window = client.get(url, params={"since": "2024-01-02T00:00:00", "until": "2024-01-04T00:00:00"})
+    assert len(window.json()) == 2
+    assert client.get(url, params={"cursor": "garbage"}).status_code == 400
+
+    export = client.get(f"{url}/export")
+    assert export.status_code == 200
+    assert export.headers["content-type"].startswith("application/x-ndjson")
+    assert len(export.text.splitlines()) == 5
+
+def test_get_user_activity_stats(client, db, test_user, test_ad):
+    assert client.get(f"/api/v1/users/{test_user.id}/activity-stats").status_code == 404
+
+    response = client.post("/api/v1/ads/track-activity/batch", content="\n".join([
+        f'{{"user_id": {test_user.id}, "ad_id": {test_ad.id}, "activity_type": "view"}}',
+        f'{{"user_id": {test_user.id}, "ad_id": {test_ad.id}, "activity_type": "purchase"}}'
+    ]))
+    assert response.json()["accepted"] == 2
+
+    response = client.get(f"/api/v1/users/{test_user.id}/activity-stats")
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["view_count"], data["purchase_count"], data["total_count"]) == (1, 1, 2)
+    assert data["total_spent"] == test_ad.price
+    assert data["engagement"] > 0
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from app.core.recommendation.ann import BruteForceIndex, CandidateIndex, IVFFlatIndex
+
+def make_vectors(n, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, 16))
+    return centers[rng.integers(0, 20, size=n)] + 0.3 * rng.normal(size=(n, 16))
+
+def test_ivf_probing_every_list_is_exact():
+    vectors = make_vectors(2000)
+    ids = np.arange(1000, 3000)
+    brute = BruteForceIndex().build(ids, vectors)
+    ivf = IVFFlatIndex(n_lists=20).build(ids, vectors)
+    queries = make_vectors(5, seed=1)
+    exact = brute.search(queries, 10)
+    approximate = ivf.search(queries, 10, n_probe=20)
+    for found, truth in zip(approximate, exact):
+        assert [ad_id for ad_id, _ in found] == [ad_id for ad_id, _ in truth]
+
+def test_ivf_recall_with_default_probes():
+    vectors = make_vectors(5000)
+    ids = np.arange(5000)
+    brute = BruteForceIndex().build(ids, vectors)
+    ivf = IVFFlatIndex().build(ids, vectors)
+    queries = make_vectors(20, seed=2)
+    hits = sum(
+        len({a for a, _ in found} & {a for a, _ in truth})
+        for found, truth in zip(ivf.search(queries, 10), brute.search(queries, 10))
+    )
+    assert hits / 200 >= 0.9
+
+def test_incremental_insert_is_searchable():
+    vectors = make_vectors(500)
+    ivf = IVFFlatIndex(n_lists=10).build(np.arange(500), vectors)
+    new_vector = np.full((1, 16), 7.0)
+    ivf.add([9999], new_vector)
+    assert len(ivf) == 501
+    assert ivf.search(new_vector, 1)[0][0][0] == 9999
+
+def test_incomplete_index_fails_when_built():
+    class NoSearch(CandidateIndex):
+        def build(self, item_ids, vectors, normalized=False):
+            return self
+
+        def add(self, item_ids, vectors):
+            pass
+
+        def __len__(self):
+            return 0
+
+    with pytest.raises(TypeError):
+        NoSearch()
+
+def test_ivf_batch_matches_queries_searched_alone():
+    vectors = make_vectors(300)
+    ivf = IVFFlatIndex(n_lists=40, n_probe=3).build(np.arange(300), vectors)
+    queries = make_vectors(12, seed=3)
+    batched = ivf.search(queries, 10)
+    for query, found in zip(queries, batched):
+        alone = ivf.search(query[None, :], 10)[0]
+        assert [ad_id for ad_id, _ in found] == [ad_id for ad_id, _ in alone]
+        assert [score for _, score in found] == pytest.approx([score for _, score in alone], abs=1e-5)
+        # Lists smaller than k leave no placeholder entries behind
+        assert all(ad_id >= 0 for ad_id, _ in found) and len(found) <= 10
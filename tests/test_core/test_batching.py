@@ -0,0 +1,86 @@
+import threading
+import numpy as np
+import pytest
+from app.core.recommendation.batching import RecommendationBatcher
+from app.core.recommendation.pipeline import EmbeddingRetrieval, RankingRequest
+from app.core.recommendation.snapshot import ModelSnapshot
+
+class CountingSnapshot(ModelSnapshot):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_sizes = []
+
+    def recommend_batch(self, user_ids, item_ids=None, top_k=10):
+        self.batch_sizes.append(len(user_ids))
+        return super().recommend_batch(user_ids, item_ids, top_k)
+
+@pytest.fixture
+def snapshot():
+    rng = np.random.default_rng(0)
+    return CountingSnapshot(
+        version=1,
+        user_ids=list(range(1, 9)),
+        user_embeddings=rng.normal(size=(8, 4)),
+        item_ids=list(range(100, 120)),
+        item_embeddings=rng.normal(size=(20, 4))
+    )
+
+@pytest.fixture
+def batcher():
+    batcher = RecommendationBatcher(window_ms=50, max_batch=8)
+    yield batcher
+    batcher.shutdown()
+
+def test_concurrent_requests_share_one_search(snapshot, batcher):
+    results = {}
+    start = threading.Barrier(8)
+
+    def request(user_id):
+        start.wait()
+        results[user_id] = batcher.recommend(snapshot, user_id, top_k=2 + user_id % 3)
+
+    threads = [threading.Thread(target=request, args=(user_id,)) for user_id in range(1, 9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batch_sizes = list(snapshot.batch_sizes)
+
+    # Same answers as scoring each user alone, sliced to each caller's top_k
+    for user_id, ranked in results.items():
+        alone = snapshot.recommend(user_id, top_k=2 + user_id % 3)
+        assert [ad_id for ad_id, _ in ranked] == [ad_id for ad_id, _ in alone]
+        assert [score for _, score in ranked] == pytest.approx([score for _, score in alone], abs=1e-5)
+    assert sum(batch_sizes) == 8 and len(batch_sizes) < 8
+    stats = batcher.stats()
+    assert stats["requests"] == 8 and stats["avg_batch_size"] > 1
+
+def test_scoring_errors_reach_every_caller(snapshot, batcher):
+    def fail(*args, **kwargs):
+        raise RuntimeError("index unavailable")
+    snapshot.recommend_batch = fail
+
+    futures = [batcher.submit(snapshot, user_id, 3) for user_id in (1, 2)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+    assert batcher.stats()["failed"] == 2
+
+def test_retrieval_stage_scores_through_the_batcher(snapshot, batcher):
+    retrieval = EmbeddingRetrieval(50, 3, batcher)
+    found = {}
+
+    def request(user_id):
+        found[user_id] = retrieval.run(RankingRequest(snapshot, None, user_id, 3), None)
+
+    threads = [threading.Thread(target=request, args=(user_id,)) for user_id in (1, 2, 3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batch_sizes = list(snapshot.batch_sizes)
+
+    assert {user_id: list(candidates.ids) for user_id, candidates in found.items()} == {
+        user_id: [ad_id for ad_id, _ in snapshot.recommend(user_id, top_k=3)] for user_id in (1, 2, 3)
+    }
+    assert sum(batch_sizes) == 3
@@ -0,0 +1,91 @@
+import threading
+from app.core.recommendation.cache import ENTRY_OVERHEAD_BYTES, RecommendationCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def ranking(*ad_ids):
+    return [(ad_id, 1.0 / (rank + 1)) for rank, ad_id in enumerate(ad_ids)]
+
+def test_hit_returns_the_stored_ranking():
+    cache = RecommendationCache(max_bytes=10_000, ttl=60)
+    assert cache.get((1, 10, 1)) is None
+    cache.put((1, 10, 1), ranking(5, 3, 9))
+
+    cached = cache.get((1, 10, 1))
+    assert [ad_id for ad_id, _ in cached] == [5, 3, 9]
+    assert cached[1][1] == 0.5
+    assert cache.get((1, 10, 2)) is None  # another model version
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 1)
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = RecommendationCache(max_bytes=10_000, ttl=30, clock=clock)
+    cache.put((1, 10, 1), ranking(1, 2))
+    clock.now = 29.0
+    assert cache.get((1, 10, 1)) is not None
+    clock.now = 31.0
+    assert cache.get((1, 10, 1)) is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["bytes"] == 0
+
+def test_least_recently_used_entry_is_evicted_first():
+    entry_size = 2 * 12 + ENTRY_OVERHEAD_BYTES  # two ads: 2 int64 ids + 2 float32 scores
+    cache = RecommendationCache(max_bytes=entry_size * 2, ttl=60)
+    cache.put((1, 2, 1), ranking(1, 2))
+    cache.put((2, 2, 1), ranking(3, 4))
+    cache.get((1, 2, 1))
+    cache.put((3, 2, 1), ranking(5, 6))
+
+    assert cache.get((2, 2, 1)) is None
+    assert cache.get((1, 2, 1)) is not None
+    assert cache.stats()["evictions"] == 1
+
+def test_invalidate_users_drops_every_entry_of_that_user():
+    cache = RecommendationCache(max_bytes=10_000, ttl=60)
+    cache.put((1, 5, 1), ranking(1))
+    cache.put((1, 10, 1), ranking(1, 2))
+    cache.put((2, 5, 1), ranking(3))
+
+    cache.invalidate_users([1])
+    assert cache.get((1, 5, 1)) is None and cache.get((1, 10, 1)) is None
+    assert cache.get((2, 5, 1)) is not None
+    assert cache.stats()["invalidations"] == 2
+
+def test_entry_ranked_before_newer_activity_is_not_served():
+    cache = RecommendationCache(max_bytes=10_000, ttl=60)
+    cache.put((1, 5, 1), ranking(1), watermark=3)
+
+    assert cache.get((1, 5, 1), watermark=3) is not None
+    # Activity written elsewhere, or racing an in-flight ranking, moved the watermark
+    assert cache.get((1, 5, 1), watermark=4) is None
+    assert cache.get((1, 5, 1), watermark=3) is None
+    assert cache.stats()["stale"] == 1
+
+def test_concurrent_access_keeps_accounting_consistent():
+    cache = RecommendationCache(max_bytes=50 * (12 + ENTRY_OVERHEAD_BYTES), ttl=60)
+
+    def worker(offset):
+        for i in range(500):
+            user_id = (offset + i) % 80
+            if cache.get((user_id, 1, 1)) is None:
+                cache.put((user_id, 1, 1), ranking(user_id))
+            if i % 50 == 0:
+                cache.invalidate_users([user_id])
+
+    threads = [threading.Thread(target=worker, args=(n * 7,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = cache.stats()
+    assert stats["entries"] <= 50
+    assert stats["bytes"] == stats["entries"] * (12 + ENTRY_OVERHEAD_BYTES)
+    assert stats["hits"] + stats["misses"] == 8 * 500
@@ -0,0 +1,63 @@
+import numpy as np
+from sqlalchemy import event
+from app.core.recommendation.catalog import AdCatalog
+from app.db.models.ads import Ad
+
+def add_ad(db, category, price, embedding=None):
+    ad = Ad(title="t", description="d", image_url="u", category=category, price=price, embedding=embedding)
+    db.add(ad)
+    db.commit()
+    return ad.id
+
+def test_catalog_columns_are_aligned(db):
+    first = add_ad(db, "sports", 10.0, np.array([1.0, 0.0], dtype=np.float32))
+    second = add_ad(db, "books", 5.0)
+    third = add_ad(db, "sports", 7.5, np.array([0.0, 1.0], dtype=np.float32))
+
+    data = AdCatalog(ttl=0).get(db)
+    assert data.ids.tolist() == [first, second, third]
+    assert data.categories == ["books", "sports"]
+    assert data.category_of(second) == "books"
+    assert data.ids[data.category_rows("sports")].tolist() == [first, third]
+    assert data.prices[data.row(third)] == 7.5
+    assert data.row(12345) is None
+
+def test_add_ad_patches_without_touching_older_versions(db):
+    first = add_ad(db, "sports", 10.0)
+    catalog = AdCatalog(ttl=0)
+    before = catalog.get(db)
+
+    for offset in range(40):  # enough to outgrow the initial buffers
+        catalog.add_ad(first + 1 + offset, "books" if offset % 2 else "music", float(offset))
+    after = catalog.get(db)
+
+    assert len(before) == 1 and before.row(first + 1) is None
+    assert before.categories == ["sports"]
+    assert len(after) == 41
+    assert after.version > before.version
+    assert after.categories == ["books", "music", "sports"]
+    assert len(after.category_rows("music")) == 20
+    assert after.row(first + 40) == 40
+    assert after.categories_etag != before.categories_etag
+
+def test_catalog_never_reads_embeddings(engine, db):
+    add_ad(db, "sports", 1.0, np.array([1.0, 0.0], dtype=np.float32))
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    data = AdCatalog(ttl=0).get(db)
+    assert len(data) == 1 and statements
+    assert not any("embedding" in statement for statement in statements)
+
+def test_filter_rows_combines_categories_and_price_range(db):
+    ids = [
+        add_ad(db, "sports", 10.0),
+        add_ad(db, "books", 5.0),
+        add_ad(db, "sports", 50.0),
+        add_ad(db, "music", 20.0),
+    ]
+    data = AdCatalog(ttl=0).get(db)
+
+    assert data.ids[data.filter_rows(["sports", "music"])].tolist() == [ids[0], ids[2], ids[3]]
+    assert data.ids[data.filter_rows(["sports"], max_price=20.0)].tolist() == [ids[0]]
+    assert data.ids[data.filter_rows(min_price=10.0, max_price=20.0)].tolist() == [ids[0], ids[3]]
+    assert len(data.filter_rows(["unknown"])) == 0
@@ -0,0 +1,87 @@
+import os
+import numpy as np
+import pytest
+from sqlalchemy import event
+from app.config import settings
+from app.core.recommendation.ann import IVFFlatIndex
+from app.core.recommendation.embedding_store import EmbeddingStore, read_embedding_file
+from app.core.recommendation.jobs import SnapshotRefresher, TrainingJobQueue
+from app.core.recommendation.snapshot import ModelRegistry, ModelSnapshot
+
+def make_snapshot(version, n_users=5, n_items=40, seed=0):
+    rng = np.random.default_rng(seed)
+    return ModelSnapshot(
+        version=version,
+        user_ids=rng.permutation(np.arange(1, n_users + 1)),
+        user_embeddings=rng.normal(size=(n_users, 8)),
+        item_ids=rng.permutation(np.arange(100, 100 + n_items)),
+        item_embeddings=rng.normal(size=(n_items, 8))
+    )
+
+def assert_same_rankings(loaded, original, user_ids):
+    for user_id in user_ids:
+        expected = original.recommend(user_id, top_k=5)
+        found = loaded.recommend(user_id, top_k=5)
+        assert [ad_id for ad_id, _ in found] == [ad_id for ad_id, _ in expected]
+        assert [score for _, score in found] == pytest.approx([score for _, score in expected], abs=1e-5)
+
+def test_loaded_snapshot_maps_the_file_and_ranks_the_same(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    original = make_snapshot(1)
+    original.add_items([999], np.ones((1, 8)))
+    store.save(original)
+
+    loaded = store.load()
+    assert loaded.version == 1
+    for array in (loaded.user_embeddings, loaded.item_embeddings, loaded.user_map.order):
+        assert np.memmap in (type(array), type(array.base)) and not array.flags.writeable
+    # The engine scores straight from the mapped matrix
+    assert np.shares_memory(loaded.engine.segments[0], loaded.item_embeddings)
+    # Ads added after training were written with the rest
+    assert 999 in loaded.item_map and 3 in loaded.user_map and 42 not in loaded.user_map
+    assert_same_rankings(loaded, original, range(1, 6))
+
+def test_ivf_lists_are_views_of_the_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ANN_MIN_ITEMS", 10)
+    monkeypatch.setattr(settings, "ANN_N_LISTS", 4)
+    monkeypatch.setattr(settings, "ANN_N_PROBE", 4)
+    store = EmbeddingStore(str(tmp_path))
+    original = make_snapshot(1)
+    assert isinstance(original.index, IVFFlatIndex)
+    store.save(original)
+
+    loaded = store.load()
+    assert isinstance(loaded.index, IVFFlatIndex)
+    assert all(np.shares_memory(vectors, loaded.item_embeddings) for _, vectors in loaded.index._lists)
+    assert_same_rankings(loaded, original, range(1, 6))
+
+def test_current_link_moves_atomically_and_old_versions_are_pruned(tmp_path):
+    store = EmbeddingStore(str(tmp_path), keep=2)
+    assert store.current_version() is None and store.load() is None
+    for version in (1, 2, 3):
+        store.save(make_snapshot(version, seed=version))
+
+    assert store.current_version() == 3
+    assert store.versions() == [2, 3]
+    assert os.readlink(tmp_path / "current") == os.path.basename(store.path_for(3))
+    assert not any(name.startswith("current.tmp") for name in os.listdir(tmp_path))
+    assert store.load(2).version == 2
+
+def test_rejects_files_in_another_format(tmp_path):
+    path = tmp_path / "embeddings-v0000000001.bin"
+    path.write_bytes(b"not an embedding file")
+    with pytest.raises(Exception):
+        read_embedding_file(str(path))
+
+def test_refresher_loads_the_file_without_reading_embeddings(engine, TestingSessionLocal, tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.save(make_snapshot(7))
+    registry = ModelRegistry()
+    refresher = SnapshotRefresher(TrainingJobQueue(TestingSessionLocal), registry, interval=0, store=store)
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert refresher.refresh()
+    assert registry.version == 7
+    assert not any("embedding" in statement for statement in statements)
+    assert not refresher.refresh()
@@ -0,0 +1,73 @@
+import numpy as np
+from datetime import datetime, timedelta
+from app.core.recommendation.features import USER_FEATURES, FeatureExtractor
+from app.db.models.ads import UserActivity
+from app.db.models.users import User
+
+def add_activities(db, test_user, test_ad):
+    now = datetime.utcnow()
+    for days, activity_type in [(0, "view"), (3, "click"), (45, "purchase"), (10, "share"), (90, "save")]:
+        db.add(UserActivity(user_id=test_user.id, ad_id=test_ad.id, activity_type=activity_type,
+                            timestamp=now - timedelta(days=days, hours=1)))
+    db.commit()
+
+def test_streamed_arrays_match_per_row_weights(db, test_user, test_ad):
+    add_activities(db, test_user, test_ad)
+    extractor = FeatureExtractor()
+
+    users, ads, weights = extractor.load_training_arrays(db, chunk_size=2)
+    expected = extractor.prepare_training_data(db.query(UserActivity).all())
+
+    assert len(weights) == 5
+    assert users.tolist() == [user for user, _, _ in expected]
+    assert ads.tolist() == [ad for _, ad, _ in expected]
+    np.testing.assert_allclose(weights, [weight for _, _, weight in expected], rtol=1e-6)
+
+def test_compute_weights_uses_whole_days():
+    now = datetime(2024, 1, 31, 12)
+    weights = FeatureExtractor().compute_weights(
+        ["purchase", "view", "unknown"],
+        [now - timedelta(days=30, hours=23), now, now],
+        current_time=now
+    )
+    np.testing.assert_allclose(weights, [np.exp(-1), 0.2, 0.1], rtol=1e-6)
+
+def reference_features(activities):
+    # The original per-row implementation
+    counts = {"view": 0, "click": 0, "save": 0, "purchase": 0}
+    spent = 0.0
+    for activity in activities:
+        if activity.activity_type in counts:
+            counts[activity.activity_type] += 1
+        if activity.activity_type == "purchase":
+            spent += activity.ad.price if activity.ad else 0
+    timestamps = [a.timestamp for a in activities]
+    time_span = (max(timestamps) - min(timestamps)).days + 1
+    return [counts["view"], counts["click"], counts["save"], counts["purchase"], spent, len(activities) / time_span]
+
+def test_batch_features_match_per_row_features(db, test_user, test_ad):
+    other = User(email="other@example.com", hashed_password="x")
+    db.add(other)
+    db.commit()
+    add_activities(db, test_user, test_ad)
+    now = datetime.utcnow()
+    for hours, activity_type in [(1, "purchase"), (30, "purchase"), (5, "view")]:
+        db.add(UserActivity(user_id=other.id, ad_id=test_ad.id, activity_type=activity_type,
+                            timestamp=now - timedelta(hours=hours)))
+    db.add(UserActivity(user_id=other.id, ad_id=None, activity_type="purchase", timestamp=now))
+    db.commit()
+    extractor = FeatureExtractor()
+
+    users, features = extractor.load_user_features(db, chunk_size=3)
+    assert users.tolist() == [test_user.id, other.id]
+    assert features.shape == (2, len(USER_FEATURES))
+    for user_id, row in zip(users, features):
+        activities = db.query(UserActivity).filter(UserActivity.user_id == int(user_id)).all()
+        np.testing.assert_allclose(row, reference_features(activities))
+        np.testing.assert_allclose(extractor.extract_user_features(activities), row)
+
+def test_features_of_no_activity_are_empty(db):
+    extractor = FeatureExtractor()
+    users, features = extractor.load_user_features(db)
+    assert len(users) == 0 and features.shape == (0, len(USER_FEATURES))
+    np.testing.assert_array_equal(extractor.extract_user_features([]), np.zeros(len(USER_FEATURES)))
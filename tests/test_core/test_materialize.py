@@ -0,0 +1,111 @@
+import numpy as np
+from app.core.recommendation.catalog import AdCatalog
+from app.core.recommendation.embedding_store import EmbeddingStore
+from app.core.recommendation.materialize import PrecomputedRecommendations, TopKMaterializer, decode_top_k
+from app.core.recommendation.snapshot import ModelRegistry, ModelSnapshot
+from app.core.recommendation.training import ModelTrainer
+from app.db.models.ads import Ad, UserActivity
+from app.db.models.user_recommendations import UserRecommendation
+from app.services.ads_service import AdsService
+
+def add_ads(db, count):
+    ads = [
+        Ad(title=f"Ad {i}", description="d", image_url="u", category="test", price=10.0)
+        for i in range(count)
+    ]
+    db.add_all(ads)
+    db.commit()
+    return [ad.id for ad in ads]
+
+def make_snapshot(user_ids, ad_ids, version=1, seed=0):
+    rng = np.random.default_rng(seed)
+    return ModelSnapshot(
+        version=version,
+        user_ids=user_ids,
+        user_embeddings=rng.normal(size=(len(user_ids), 4)),
+        item_ids=ad_ids,
+        item_embeddings=rng.normal(size=(len(ad_ids), 4))
+    )
+
+def test_blocks_on_several_threads_match_exact_scoring(db):
+    snapshot = make_snapshot(list(range(1, 12)), list(range(100, 130)))
+    stats = TopKMaterializer(top_k=5, block_size=2, threads=3).run(db, snapshot)
+    assert stats["users"] == 11 and stats["model_version"] == 1
+    assert stats["seconds"] > 0 and stats["users_per_second"] > 0
+
+    rows = {row.user_id: row for row in db.query(UserRecommendation)}
+    assert set(rows) == set(range(1, 12))
+    for user_id, row in rows.items():
+        ad_ids, scores = decode_top_k(row.ad_ids, row.scores)
+        exact = snapshot.engine.recommend(snapshot.get_user_embedding(user_id), top_k=5)
+        assert ad_ids.tolist() == [ad_id for ad_id, _ in exact]
+        assert np.allclose(scores, [score for _, score in exact], atol=1e-6)
+        assert row.model_version == 1 and row.max_ad_id == 129
+
+def test_service_serves_the_table_only_for_the_live_version(db, test_user):
+    ad_ids = add_ads(db, 6)
+    snapshot = make_snapshot([test_user.id], ad_ids)
+    TopKMaterializer(top_k=6).run(db, snapshot)
+    registry = ModelRegistry()
+    registry.publish(snapshot)
+    precomputed = PrecomputedRecommendations(enabled=True)
+    service = AdsService(
+        registry=registry, refresher=None, catalog=AdCatalog(), cache=None,
+        preferences=None, similarity_threshold=-1.0, precomputed=precomputed
+    )
+    online = AdsService(
+        registry=registry, refresher=None, catalog=AdCatalog(), cache=None,
+        preferences=None, similarity_threshold=-1.0, precomputed=None
+    )
+
+    served = service.get_recommendations(db, test_user.id, limit=4)
+    assert [r.ad.id for r in served] == [r.ad.id for r in online.get_recommendations(db, test_user.id, limit=4)]
+    assert precomputed.stats()["hits"] == 1
+
+    # A newer model makes the stored lists stale until they are recomputed
+    registry.publish(make_snapshot([test_user.id], ad_ids, version=2, seed=1))
+    service.get_recommendations(db, test_user.id, limit=4)
+    assert precomputed.stats()["stale"] == 1
+
+def test_ads_created_after_materializing_are_merged_in(db, test_user):
+    ad_ids = add_ads(db, 3)
+    snapshot = ModelSnapshot(
+        version=1,
+        user_ids=[test_user.id],
+        user_embeddings=np.array([[1.0, 0.0]]),
+        item_ids=ad_ids,
+        item_embeddings=np.array([[0.0, 1.0], [0.6, 0.8], [0.8, 0.6]])
+    )
+    TopKMaterializer(top_k=3).run(db, snapshot)
+    new_id = add_ads(db, 1)[0]
+    snapshot.add_items([new_id], np.array([[1.0, 0.1]]))
+
+    candidates = PrecomputedRecommendations(enabled=True).get(db, snapshot, test_user.id)
+    assert candidates.ids.tolist() == [new_id, ad_ids[2], ad_ids[1]]
+
+def test_training_run_materializes_for_its_version(db, test_user, test_ad):
+    db.add(UserActivity(user_id=test_user.id, ad_id=test_ad.id, activity_type="click"))
+    db.commit()
+    trainer = ModelTrainer(registry=ModelRegistry())
+    trainer.train_model(db)
+
+    row = db.get(UserRecommendation, test_user.id)
+    assert row.model_version == trainer.registry.version
+    assert decode_top_k(row.ad_ids, row.scores)[0].tolist() == [test_ad.id]
+    assert trainer.get_status()["materialize"]["users"] == 1
+    assert trainer.progress["stage"] == "materialize"
+
+def test_training_run_materializes_from_the_vectors_serving_loads(db, test_user, test_ad, tmp_path):
+    db.add(UserActivity(user_id=test_user.id, ad_id=test_ad.id, activity_type="click"))
+    db.commit()
+    store = EmbeddingStore(str(tmp_path))
+    trainer = ModelTrainer(registry=None, store=store)
+    trainer.train_model(db, version=3)
+
+    served = store.load(3)
+    row = db.get(UserRecommendation, test_user.id)
+    assert row.model_version == 3
+    ad_ids, scores = decode_top_k(row.ad_ids, row.scores)
+    exact = served.engine.recommend(served.get_user_embedding(test_user.id), top_k=len(ad_ids))
+    assert ad_ids.tolist() == [ad_id for ad_id, _ in exact]
+    assert scores.tolist() == [np.float32(score) for _, score in exact]
@@ -0,0 +1,50 @@
+import numpy as np
+import torch
+from app.core.recommendation.model import AdsRecommender, InteractionBatches
+
+def make_interactions(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    users = rng.integers(1, 30, size=n)
+    items = rng.integers(100, 140, size=n)
+    ratings = ((users + items) % 5 / 5).astype(np.float32)
+    return users, items, ratings
+
+def test_batches_cover_every_row_once():
+    tensors = (torch.arange(10), torch.arange(10) * 2)
+    batches = InteractionBatches(tensors, batch_size=4, generator=torch.Generator().manual_seed(0))
+    seen = torch.cat([first for first, _ in batches])
+    assert len(batches) == 3
+    assert sorted(seen.tolist()) == list(range(10))
+
+def test_training_stops_early_and_keeps_best_epoch():
+    recommender = AdsRecommender(embedding_size=8, learning_rate=0.5)
+    recommender.train_arrays(*make_interactions(), epochs=50, batch_size=32, validation_split=0.2, patience=2)
+    assert len(recommender.history) < 50
+    val_losses = [entry["val_loss"] for entry in recommender.history]
+    assert recommender.best_epoch == int(np.argmin(val_losses)) + 1
+
+def test_zero_patience_stops_at_the_first_epoch_without_improvement():
+    recommender = AdsRecommender(embedding_size=8, learning_rate=0.5)
+    recommender.train_arrays(*make_interactions(), epochs=50, batch_size=32, validation_split=0.2, patience=0)
+    val_losses = [entry["val_loss"] for entry in recommender.history]
+    assert len(val_losses) < 50
+    assert val_losses[-1] >= min(val_losses[:-1])
+    assert all(loss < min(val_losses[:i]) for i, loss in enumerate(val_losses[:-1]) if i)
+
+def test_training_restores_thread_count():
+    before = torch.get_num_threads()
+    AdsRecommender(embedding_size=4).train_arrays(*make_interactions(50), epochs=1, num_threads=1)
+    assert torch.get_num_threads() == before
+
+def test_warm_start_keeps_known_rows_and_grows_tables():
+    recommender = AdsRecommender(embedding_size=4)
+    recommender.train_arrays(np.array([1, 2]), np.array([10, 20]), np.array([1.0, 0.5]), epochs=1)
+    user_map = dict(recommender.user_map)
+    untouched = recommender.get_user_embedding(2).copy()
+
+    recommender.train_arrays(np.array([1, 3]), np.array([10, 30]), np.array([1.0, 0.2]),
+                             epochs=1, warm_start=True)
+
+    assert recommender.user_map == {**user_map, 3: 2}
+    assert recommender.item_map == {10: 0, 20: 1, 30: 2}
+    np.testing.assert_array_equal(recommender.get_user_embedding(2), untouched)
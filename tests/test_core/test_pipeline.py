@@ -0,0 +1,95 @@
+import time
+import numpy as np
+import pytest
+from app.core.recommendation.catalog import CatalogData
+from app.core.recommendation.features import USER_FEATURES
+from app.core.recommendation.pipeline import (
+    BusinessRules, Candidates, EmbeddingRetrieval, LogisticReranker, RankingPipeline, RankingRequest, Stage
+)
+from app.core.recommendation.snapshot import ModelSnapshot
+
+def make_catalog(ids, categories, prices):
+    names = sorted(set(categories))
+    codes = np.array([names.index(category) for category in categories], dtype=np.int32)
+    return CatalogData(
+        version=1,
+        ids=np.array(ids, dtype=np.int64),
+        category_codes=codes,
+        category_names=names,
+        prices=np.array(prices, dtype=np.float64),
+        row_of={ad_id: row for row, ad_id in enumerate(ids)},
+        postings={name: np.flatnonzero(codes == code) for code, name in enumerate(names)}
+    )
+
+def user_features(purchases=0, spent=0.0, clicks=0):
+    features = np.zeros(len(USER_FEATURES))
+    features[USER_FEATURES.index("purchase_count")] = purchases
+    features[USER_FEATURES.index("total_spent")] = spent
+    features[USER_FEATURES.index("click_count")] = clicks
+    return features
+
+@pytest.fixture
+def setup():
+    ids = [10, 11, 12, 13]
+    snapshot = ModelSnapshot(
+        version=1,
+        user_ids=[1],
+        user_embeddings=np.array([[1.0, 0.0]]),
+        item_ids=ids,
+        item_embeddings=np.array([[1.0, 0.0], [0.95, 0.31], [0.9, 0.44], [0.0, 1.0]])
+    )
+    catalog = make_catalog(ids, ["a", "a", "b", "b"], [500.0, 20.0, 25.0, 20.0])
+    return snapshot, catalog
+
+def test_reranker_prefers_prices_the_user_pays(setup):
+    snapshot, catalog = setup
+    pipeline = RankingPipeline([EmbeddingRetrieval(50, 10), LogisticReranker(50), BusinessRules(50)])
+
+    cold = pipeline.run(RankingRequest(snapshot, catalog, 1, 3, user_features=user_features()))
+    assert [ad_id for ad_id, _ in cold] == [10, 11, 12]
+
+    # A user who usually spends about 20 gets the cheaper near matches first
+    buyer = pipeline.run(RankingRequest(snapshot, catalog, 1, 3, user_features=user_features(purchases=4, spent=80.0)))
+    assert [ad_id for ad_id, _ in buyer][:2] == [11, 12]
+    assert all(0.0 < score < 1.0 for _, score in buyer)
+
+def test_rules_apply_threshold_category_cap_and_limit(setup):
+    snapshot, catalog = setup
+    pipeline = RankingPipeline([EmbeddingRetrieval(50, 10), BusinessRules(50, max_per_category=1)])
+    ranked = pipeline.run(RankingRequest(snapshot, catalog, 1, 5, min_similarity=0.5))
+    assert [ad_id for ad_id, _ in ranked] == [10, 12]
+
+    # Restricting retrieval to some catalog rows never scores the others
+    pipeline = RankingPipeline([EmbeddingRetrieval(50, 10), BusinessRules(50)])
+    ranked = pipeline.run(RankingRequest(snapshot, catalog, 1, 5, candidate_rows=np.array([2, 3])))
+    assert [ad_id for ad_id, _ in ranked] == [12, 13]
+
+class SlowStage(Stage):
+    name = "slow"
+
+    def run(self, request, candidates):
+        time.sleep(0.01)
+        return candidates
+
+def test_optional_stage_is_skipped_once_the_budget_is_spent(setup):
+    snapshot, catalog = setup
+    pipeline = RankingPipeline([EmbeddingRetrieval(1, 10), SlowStage(0.1), LogisticReranker(0.1), BusinessRules(50)])
+    ranked = pipeline.run(RankingRequest(snapshot, catalog, 1, 2, user_features=user_features()))
+
+    # Retrieval order is kept when the re-ranker does not run
+    assert [ad_id for ad_id, _ in ranked] == [10, 11]
+    stats = pipeline.stats()
+    assert stats["rerank"]["skipped"] == 1 and stats["rerank"]["runs"] == 0
+    assert stats["slow"]["over_budget"] == 1
+    assert stats["retrieval"]["runs"] == 1 and stats["retrieval"]["avg_ms"] > 0
+
+def test_stage_without_run_fails_when_built():
+    class Unfinished(Stage):
+        name = "unfinished"
+
+    with pytest.raises(TypeError):
+        Unfinished(10)
+
+def test_candidates_round_trip():
+    candidates = Candidates(np.array([3, 1]), np.array([0.5, 0.25], dtype=np.float32))
+    assert candidates.take(np.array([1])).to_list() == [(1, 0.25)]
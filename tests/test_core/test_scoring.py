@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from sklearn.metrics.pairwise import cosine_similarity
+from app.core.recommendation.model import AdsRecommender
+from app.core.recommendation.scoring import IdIndex, ScoringEngine, select_top_k
+
+def test_select_top_k_matches_full_sort():
+    rng = np.random.default_rng(0)
+    scores = rng.normal(size=(3, 50))
+    top = select_top_k(scores, 5)
+    expected = np.argsort(-scores, axis=1)[:, :5]
+    np.testing.assert_array_equal(top, expected)
+
+def test_engine_matches_cosine_similarity():
+    rng = np.random.default_rng(1)
+    items = rng.normal(size=(20, 8))
+    users = rng.normal(size=(4, 8))
+    engine = ScoringEngine(list(range(100, 120)), items)
+    np.testing.assert_allclose(engine.score(users), cosine_similarity(users, items), atol=1e-5)
+
+def test_engine_scores_unknown_items_as_zero():
+    engine = ScoringEngine([1, 2], np.eye(2))
+    recommendations = engine.recommend(np.array([1.0, 0.0]), [3, 2, 1], top_k=3)
+    assert recommendations[0] == (1, pytest.approx(1.0))
+    assert {ad_id for ad_id, score in recommendations[1:]} == {2, 3}
+
+def test_recommend_batch_matches_single_user_calls():
+    recommender = AdsRecommender(embedding_size=4)
+    recommender.train([(1, 10, 1.0), (1, 20, 0.2), (2, 30, 0.5), (2, 10, 0.8)], epochs=1)
+    batch = recommender.recommend_batch([1, 2, 99], [10, 20, 30], top_k=2)
+    for user_id, recommendations in zip([1, 2, 99], batch):
+        single = recommender.recommend(user_id, [10, 20, 30], top_k=2)
+        assert [ad_id for ad_id, _ in recommendations] == [ad_id for ad_id, _ in single]
+        assert [score for _, score in recommendations] == pytest.approx([score for _, score in single], abs=1e-5)
+
+def test_recommend_rows_scores_only_the_given_rows():
+    engine = ScoringEngine([10, 20, 30], np.array([[1.0, 0.0], [0.0, 1.0], [0.7, 0.7]]))
+    recommendations = engine.recommend_rows(np.array([1.0, 0.0]), np.array([1, 2]), top_k=5)[0]
+    assert [item_id for item_id, _ in recommendations] == [30, 20]
+
+def test_id_index_finds_rows_of_unsorted_ids():
+    index = IdIndex([30, 10, 20])
+    np.testing.assert_array_equal(index.rows([20, 30, 15, 99, 10]), [2, 0, -1, -1, 1])
+    assert 10 in index and 11 not in index
+    assert index[20] == 2 and index.get(5) is None
+    assert list(index) == [30, 10, 20]
+    assert len(IdIndex([]).rows([1])) == 1
+
+def test_appended_items_leave_the_base_matrix_alone():
+    rng = np.random.default_rng(4)
+    items = rng.normal(size=(10, 8))
+    engine = ScoringEngine(list(range(10)), items)
+    grown = engine.with_items([10, 11], rng.normal(size=(2, 8))).with_items([12], rng.normal(size=(1, 8)))
+
+    assert grown.segments[0] is engine.segments[0] and len(grown.segments[1]) == 3
+    users = rng.normal(size=(2, 8))
+    full = ScoringEngine(list(range(13)), grown.item_matrix, normalized=True)
+    np.testing.assert_allclose(grown.score(users), full.score(users), atol=1e-6)
+    np.testing.assert_array_equal(grown.top_k(users, 5)[0], full.top_k(users, 5)[0])
+    np.testing.assert_allclose(grown.vectors(np.array([11, 2])), full.item_matrix[[11, 2]])
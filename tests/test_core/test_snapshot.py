@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from app.core.recommendation.model import AdsRecommender
+from app.core.recommendation.snapshot import ModelSnapshot, ModelRegistry
+
+def make_snapshot(version):
+    return ModelSnapshot(
+        version=version,
+        user_ids=[1],
+        user_embeddings=np.array([[1.0, 0.0]]),
+        item_ids=[10, 20],
+        item_embeddings=np.array([[1.0, 0.0], [0.0, 1.0]])
+    )
+
+def test_snapshot_recommend_orders_by_similarity():
+    snapshot = make_snapshot(1)
+    recommendations = snapshot.recommend(1, [20, 10], top_k=2)
+    assert [ad_id for ad_id, _ in recommendations] == [10, 20]
+    assert recommendations[0][1] == pytest.approx(1.0)
+
+def test_snapshot_is_read_only():
+    snapshot = make_snapshot(1)
+    with pytest.raises(ValueError):
+        snapshot.item_embeddings[0, 0] = 5.0
+
+def test_registry_keeps_newest_version():
+    registry = ModelRegistry()
+    assert registry.current() is None
+    assert registry.publish(make_snapshot(2))
+    assert not registry.publish(make_snapshot(1))
+    assert registry.version == 2
+
+def test_snapshot_from_recommender_is_detached_from_training():
+    recommender = AdsRecommender(embedding_size=4)
+    recommender.train([(1, 10, 1.0), (1, 20, 0.2), (2, 10, 0.5)], epochs=1)
+    snapshot = ModelSnapshot.from_recommender(recommender, version=1)
+    before = snapshot.get_user_embedding(1).copy()
+
+    recommender.train([(1, 10, 1.0), (1, 20, 0.2), (2, 10, 0.5)], epochs=1)
+    np.testing.assert_array_equal(snapshot.get_user_embedding(1), before)
@@ -0,0 +1,50 @@
+import numpy as np
+from app.core.recommendation.snapshot import ModelRegistry
+from app.core.recommendation.training import ModelTrainer
+from app.db.models.ads import UserActivity
+from app.db.models.training_jobs import TrainingJob
+from app.db.models.users import User
+
+def add_activity(db, user, ad, activity_type="click"):
+    db.add(UserActivity(user_id=user.id, ad_id=ad.id, activity_type=activity_type))
+    db.commit()
+
+def test_second_run_only_trains_on_new_activities(db, test_user, test_ad):
+    trainer = ModelTrainer(registry=ModelRegistry())
+    add_activity(db, test_user, test_ad)
+    add_activity(db, test_user, test_ad, "view")
+
+    trainer.train_model(db)
+    assert trainer.get_status()["mode"] == "full"
+    assert trainer.sample_count == 2
+    assert trainer.registry.version == 1
+
+    add_activity(db, test_user, test_ad, "purchase")
+    trainer.train_model(db)
+    assert trainer.get_status()["mode"] == "incremental"
+    assert trainer.sample_count == 1
+    assert trainer.registry.version == 2
+
+    trainer.train_model(db, incremental=False)
+    assert trainer.sample_count == 3
+
+def test_incremental_run_writes_every_row_after_another_trainer_published(db, test_user, test_ad):
+    other = User(email="other@example.com", hashed_password="x", is_active=True)
+    db.add(other)
+    db.commit()
+    add_activity(db, test_user, test_ad)
+    add_activity(db, other, test_ad)
+    trainer = ModelTrainer(registry=None, store=None)
+    trainer.train_model(db, version=1)
+
+    # A different trainer published version 2, overwriting every row
+    db.add(TrainingJob(status="done", model_version=2))
+    db.query(User).update({User.embedding: np.zeros(trainer.recommender.embedding_size, dtype=np.float32)})
+    db.commit()
+
+    add_activity(db, test_user, test_ad, "purchase")
+    trainer.train_model(db, version=3)
+    assert trainer.mode == "incremental"
+    db.expire_all()
+    # The user without new activity was rewritten too, from this trainer's model
+    assert np.allclose(db.get(User, other.id).embedding, trainer.recommender.get_user_embedding(other.id))
@@ -0,0 +1,84 @@
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from app.core.recommendation.jobs import JobStatus, SnapshotRefresher, TrainingJobQueue, TrainingWorker
+from app.core.recommendation.snapshot import ModelRegistry
+from app.core.recommendation.training import ModelTrainer
+from app.db.models.ads import UserActivity
+from app.db.models.training_jobs import TrainingJob
+
+def test_triggers_are_deduplicated(db, TestingSessionLocal):
+    queue = TrainingJobQueue(TestingSessionLocal)
+    first, created = queue.submit(db)
+    second, created_again = queue.submit(db)
+    assert created and not created_again
+    assert second.id == first.id
+
+    forced, created_forced = queue.submit(db, force=True)
+    assert not created_forced and forced.id == first.id and forced.force
+
+def test_force_queues_behind_running_job(db, TestingSessionLocal):
+    queue = TrainingJobQueue(TestingSessionLocal)
+    queue.submit(db)
+    running = queue.claim_next(db)
+    assert running.status == JobStatus.RUNNING.value
+
+    assert queue.submit(db)[0].id == running.id
+    forced, created = queue.submit(db, force=True)
+    assert created and forced.id != running.id
+
+def test_worker_runs_job_and_other_process_loads_model(db, TestingSessionLocal, test_user, test_ad):
+    db.add(UserActivity(user_id=test_user.id, ad_id=test_ad.id, activity_type="click"))
+    db.commit()
+    queue = TrainingJobQueue(TestingSessionLocal)
+    job, _ = queue.submit(db)
+
+    # Train the way the worker process does: write back only, no local registry
+    worker = TrainingWorker(queue, ModelTrainer(registry=None))
+    assert worker.run_next() == job.id
+    assert worker.run_next() is None
+
+    db.expire_all()
+    job = queue.get(db, job.id)
+    assert job.status == JobStatus.DONE.value
+    assert job.sample_count == 1 and job.model_version == job.id
+
+    registry = ModelRegistry()
+    assert SnapshotRefresher(queue, registry, interval=0).refresh()
+    assert registry.version == job.id
+    assert registry.current().recommend(test_user.id, top_k=1)[0][0] == test_ad.id
+    assert not SnapshotRefresher(queue, registry, interval=0).refresh()
+
+def test_job_of_a_stopped_worker_is_failed_once_its_lease_runs_out(db, TestingSessionLocal):
+    queue = TrainingJobQueue(TestingSessionLocal, lease=60)
+    queue.submit(db)
+    running = queue.claim_next(db)
+    queue.heartbeat(running.id)
+    assert queue.submit(db)[0].id == running.id
+
+    # The worker was terminated: nothing renews the lease any more
+    db.query(TrainingJob).filter(TrainingJob.id == running.id).update(
+        {"heartbeat_at": datetime.utcnow() - timedelta(seconds=61)}
+    )
+    db.commit()
+    job, created = queue.submit(db)
+    assert created and job.id != running.id
+    db.expire_all()
+    abandoned = queue.get(db, running.id)
+    assert abandoned.status == JobStatus.FAILED.value and abandoned.error_message
+
+def test_worker_renews_the_lease_while_training(db, TestingSessionLocal):
+    queue = TrainingJobQueue(TestingSessionLocal)
+    job, _ = queue.submit(db)
+    trainer = ModelTrainer(registry=None)
+    beats = []
+
+    def train_model(session, **kwargs):
+        time.sleep(0.1)
+        with TestingSessionLocal() as other:
+            beats.append(queue.get(other, job.id).heartbeat_at)
+
+    trainer.train_model = train_model
+    TrainingWorker(queue, trainer, heartbeat_interval=0.02).run_next()
+    db.expire_all()
+    assert beats[0] > queue.get(db, job.id).started_at
@@ -0,0 +1,22 @@
+import numpy as np
+from app.core.recommendation.writeback import EmbeddingWriter
+from app.db.models.users import User
+
+def test_writer_updates_rows_in_chunks(db):
+    for i in range(5):
+        db.add(User(email=f"user{i}@example.com", hashed_password="hashed_password"))
+    db.commit()
+
+    progress = []
+    writer = EmbeddingWriter(chunk_size=2, strategy="executemany",
+                             progress=lambda stage, done, total: progress.append((stage, done, total)))
+    ids = [1, 2, 3, 4, 5, 999]
+    embeddings = np.arange(12, dtype=np.float32).reshape(6, 2)
+    writer.write(db, User, ids, embeddings, stage="user_embeddings")
+    db.commit()
+    db.expire_all()
+
+    for user in db.query(User).order_by(User.id):
+        np.testing.assert_array_equal(user.embedding, embeddings[user.id - 1])
+    assert progress[-1] == ("user_embeddings", 6, 6)
+    assert [done for _, done, _ in progress] == [0, 2, 4, 6]
@@ -0,0 +1,46 @@
+import json
+import numpy as np
+import pytest
+from sqlalchemy import text
+from app.db.models.users import User
+from app.db.migrate_embeddings import migrate_json_rows
+from app.db.types import decode_embedding, encode_embedding
+
+@pytest.mark.parametrize("dtype, tolerance", [("float32", 0), ("float16", 1e-3), ("int8", 2e-2)])
+def test_embedding_round_trip(dtype, tolerance):
+    vector = np.random.default_rng(0).normal(size=64).astype(np.float32)
+    decoded = decode_embedding(encode_embedding(vector, dtype))
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, vector, atol=tolerance * np.abs(vector).max())
+
+def test_float32_blob_is_much_smaller_than_json():
+    vector = np.random.default_rng(0).normal(size=64)
+    blob = encode_embedding(vector, "float32")
+    assert len(blob) * 4 < len(json.dumps(vector.tolist()))
+    assert len(encode_embedding(vector, "int8")) < len(blob) / 3
+
+def test_float32_decode_does_not_copy():
+    blob = encode_embedding(np.ones(8), "float32")
+    decoded = decode_embedding(blob)
+    assert decoded.base is blob or decoded.base.obj is blob
+
+def test_legacy_json_is_still_readable():
+    np.testing.assert_array_equal(decode_embedding("[1.0, 2.0]"), np.array([1.0, 2.0], dtype=np.float32))
+
+def test_orm_stores_arrays(db, test_user):
+    test_user.embedding = np.arange(4, dtype=np.float32)
+    db.commit()
+    db.expire_all()
+    np.testing.assert_array_equal(db.get(User, test_user.id).embedding, np.arange(4))
+
+def test_migrate_json_rows(db, engine, test_user):
+    db.execute(text("UPDATE users SET embedding = :value WHERE id = :id"),
+               {"value": "[0.5, 1.5]", "id": test_user.id})
+    db.commit()
+
+    assert migrate_json_rows(engine) == {"users": 1, "ads": 0}
+    assert migrate_json_rows(engine) == {"users": 0, "ads": 0}
+
+    raw = db.execute(text("SELECT embedding FROM users")).scalar()
+    assert isinstance(raw, bytes)
+    np.testing.assert_array_equal(decode_embedding(raw), [0.5, 1.5])
@@ -0,0 +1,107 @@
+import asyncio
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+from app.core.recommendation.features import FeatureExtractor
+from app.db.models.activity_rollups import ActivityRollup
+from app.db.models.ads import UserActivity
+from app.db.partitions import ActivityPartitions, add_months, month_start, partition_name
+from app.services.activity_stats import ActivityStatsStore
+
+def add_activity(db, user_id, ad_id, activity_type, timestamp):
+    db.add(UserActivity(user_id=user_id, ad_id=ad_id, activity_type=activity_type, timestamp=timestamp))
+
+def test_month_arithmetic():
+    assert month_start(datetime(2024, 2, 29, 13)) == datetime(2024, 2, 1)
+    assert add_months(datetime(2024, 11, 1), 3) == datetime(2025, 2, 1)
+    assert add_months(datetime(2024, 1, 1), -1) == datetime(2023, 12, 1)
+    assert partition_name("user_activities", datetime(2024, 3, 1)) == "user_activities_y2024m03"
+
+def test_postgresql_table_is_range_partitioned_on_timestamp():
+    partitions = ActivityPartitions()
+    ddl = str(CreateTable(partitions.partitioned_table(UserActivity.__table__)).compile(dialect=postgresql.dialect()))
+    assert "PARTITION BY RANGE (timestamp)" in ddl
+    assert "PRIMARY KEY (id, timestamp)" in ddl
+    assert "id SERIAL" in ddl
+    assert "REFERENCES users (id)" in ddl
+
+def test_keep_ahead_keeps_ensuring_partitions_after_a_failure(engine, monkeypatch):
+    partitions = ActivityPartitions()
+    calls = []
+    def ensure(conn, now=None):
+        calls.append(now)
+        if len(calls) == 1:
+            raise RuntimeError("database restarting")
+        return []
+    monkeypatch.setattr(partitions, "ensure_partitions", ensure)
+
+    async def run():
+        task = asyncio.create_task(partitions.keep_ahead(engine, interval=0.01))
+        while len(calls) < 3:
+            await asyncio.sleep(0.01)
+        task.cancel()
+    asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert len(calls) >= 3
+
+def test_retention_rolls_up_expired_months_and_keeps_stats(db, test_user, test_ad):
+    now = datetime(2024, 6, 15)
+    store = ActivityStatsStore()
+    history = [
+        ("view", datetime(2023, 3, 3, 8)),
+        ("view", datetime(2023, 3, 3, 20)),
+        ("purchase", datetime(2023, 4, 10)),
+        ("click", datetime(2023, 5, 31, 23)),  # the cutoff month
+        ("save", datetime(2024, 6, 1))
+    ]
+    for activity_type, timestamp in history:
+        add_activity(db, test_user.id, test_ad.id, activity_type, timestamp)
+    db.commit()
+    store.rebuild(db)
+    before = store.get(db, test_user.id, current_time=now)
+
+    partitions = ActivityPartitions(retention_days=365)
+    assert partitions.retention_cutoff(now) == datetime(2023, 6, 1)
+    assert partitions.apply_retention(db, now)["user_activities"] == 4
+
+    remaining = db.execute(select(UserActivity.timestamp)).scalars().all()
+    assert remaining == [datetime(2024, 6, 1)]
+    rollups = {
+        (row.activity_type, row.day): row.count
+        for row in db.execute(select(ActivityRollup)).scalars()
+    }
+    assert rollups == {
+        ("view", date(2023, 3, 3)): 2,
+        ("purchase", date(2023, 4, 10)): 1,
+        ("click", date(2023, 5, 31)): 1
+    }
+
+    # Nothing left to expire, so a second run changes nothing
+    assert partitions.apply_retention(db, now)["user_activities"] == 0
+    assert db.execute(select(func.sum(ActivityRollup.count))).scalar() == 4
+
+    # Rollups stand in for the dropped rows when stats are rebuilt
+    assert store.rebuild(db) == 5
+    after = store.get(db, test_user.id, current_time=now)
+    for name in ("view_count", "click_count", "save_count", "purchase_count", "total_spent", "last_activity_at"):
+        assert after[name] == before[name]
+    assert after["first_activity_at"] == datetime(2023, 3, 3)
+
+def test_retention_disabled_keeps_everything(db, test_user, test_ad):
+    add_activity(db, test_user.id, test_ad.id, "view", datetime(2001, 1, 1))
+    db.commit()
+    assert ActivityPartitions(retention_days=0).apply_retention(db) == {}
+    assert db.query(UserActivity).count() == 1
+
+def test_training_window_skips_old_activity(db, test_user, test_ad, monkeypatch):
+    now = datetime.utcnow()
+    add_activity(db, test_user.id, test_ad.id, "view", now - timedelta(days=400))
+    add_activity(db, test_user.id, test_ad.id, "click", now - timedelta(days=1))
+    db.commit()
+
+    extractor = FeatureExtractor()
+    monkeypatch.setattr("app.core.recommendation.features.settings.TRAINING_WINDOW_DAYS", 180)
+    users, ads, weights = extractor.load_training_arrays(db, since=extractor.training_window_start(now))
+    assert len(weights) == 1
+    monkeypatch.setattr("app.core.recommendation.features.settings.TRAINING_WINDOW_DAYS", 0)
+    assert extractor.training_window_start(now) is None
@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import exc, text
+from sqlalchemy.pool import StaticPool
+from app.db import pool
+from app.db.pool import TimedAsyncQueuePool, TimedQueuePool, make_engine, pool_options, pool_status
+
+def test_backend_defaults():
+    assert pool_options("sqlite://") == {"poolclass": StaticPool}
+    assert pool_options("sqlite:///:memory:") == {"poolclass": StaticPool}
+
+    local = pool_options("sqlite:///./app.db")
+    assert local["poolclass"] is TimedQueuePool
+    assert (local["pool_size"], local["max_overflow"]) == (5, 15)
+    assert (local["pool_recycle"], local["pool_pre_ping"]) == (-1, False)
+
+    server = pool_options("postgresql+asyncpg://u:p@db/ads", asynchronous=True)
+    assert server["poolclass"] is TimedAsyncQueuePool
+    assert (server["pool_size"], server["max_overflow"]) == (10, 10)
+    assert (server["pool_recycle"], server["pool_pre_ping"]) == (1800, True)
+
+def test_explicit_size_is_capped_by_max_connections(monkeypatch):
+    monkeypatch.setattr(pool.settings, "DB_POOL_SIZE", 50)
+    monkeypatch.setattr(pool.settings, "DB_POOL_PRE_PING", False)
+    options = pool_options("postgresql://u:p@db/ads")
+    assert (options["pool_size"], options["max_overflow"], options["pool_pre_ping"]) == (20, 0, False)
+
+def test_status_reports_checkouts_and_timeouts(tmp_path, monkeypatch):
+    monkeypatch.setattr(pool.settings, "DB_MAX_CONNECTIONS", 1)
+    monkeypatch.setattr(pool.settings, "DB_POOL_TIMEOUT", 0.05)
+    engine = make_engine(f"sqlite:///{tmp_path / 'pool.db'}")
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        status = pool_status(engine)
+        assert (status["size"], status["checked_out"], status["overflow"]) == (1, 1, 0)
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+
+    status = pool_status(engine)
+    assert (status["checked_out"], status["checked_in"]) == (0, 1)
+    assert (status["checkouts"], status["timeouts"]) == (1, 1)
+    assert status["wait_ms_max"] >= 0
+    engine.dispose()
+
+def test_fork_hook_gives_the_child_a_fresh_pool(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'fork.db'}")
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    inherited = engine.pool
+    pool._after_fork_in_child()
+    assert engine.pool is not inherited
+    assert engine.pool.checkedin() == 0
+    # The parent's connection was left open, not closed from the child
+    assert inherited.checkedin() == 1
+    engine.dispose()
+    inherited.dispose()
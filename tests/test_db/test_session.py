@@ -0,0 +1,19 @@
+import asyncio
+import pytest
+from sqlalchemy import select
+from app.db.models.users import User
+from app.db.session import async_database_url
+
+def test_async_url_swaps_the_driver_only():
+    assert async_database_url("postgresql://u:p@db:5432/ads") == "postgresql+asyncpg://u:p@db:5432/ads"
+    assert async_database_url("postgresql+psycopg2://u:p@db/ads") == "postgresql+asyncpg://u:p@db/ads"
+    assert async_database_url("sqlite:///./test.db") == "sqlite+aiosqlite:///./test.db"
+    with pytest.raises(ValueError):
+        async_database_url("mysql://u:p@db/ads")
+
+def test_async_session_sees_sync_writes(AsyncTestingSessionLocal, test_user):
+    async def emails():
+        async with AsyncTestingSessionLocal() as db:
+            return (await db.execute(select(User.email))).scalars().all()
+
+    assert asyncio.run(emails()) == [test_user.email]
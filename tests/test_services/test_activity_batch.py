@@ -0,0 +1,72 @@
+import asyncio
+import json
+from app.db.models.ads import UserActivity
+from app.services.activity_batch import ActivityStreamParser, load_activity_stream
+from app.services.activity_ingest import ActivityIngestor
+
+def parse(chunks):
+    parser = ActivityStreamParser()
+    records = []
+    for chunk in chunks:
+        records.extend(parser.feed(chunk))
+    records.extend(parser.feed(b"", final=True))
+    return records
+
+def split_every(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+def test_ndjson_records_survive_arbitrary_chunking():
+    events = [{"user_id": 1, "ad_id": i, "activity_type": "view"} for i in range(5)]
+    body = "\n".join(json.dumps(event) for event in events).encode() + b"\n"
+
+    for size in [1, 7, len(body)]:
+        records = parse(split_every(body, size))
+        assert [value for _, value, _ in records] == events
+        assert [line for line, _, _ in records] == [1, 2, 3, 4, 5]
+
+def test_ndjson_reports_bad_lines_and_continues():
+    body = b'{"user_id": 1, "ad_id": 1, "activity_type": "view"}\n\n{oops\n{"user_id": 2, "ad_id": 1, "activity_type": "click"}'
+    records = parse([body])
+    assert [(line, error is None) for line, _, error in records] == [(1, True), (3, False), (4, True)]
+
+def test_json_array_records_survive_arbitrary_chunking():
+    events = [{"user_id": 1, "ad_id": i, "activity_type": "café"} for i in range(4)]
+    body = json.dumps(events, ensure_ascii=False).encode()
+
+    for size in [1, 5, len(body)]:
+        records = parse(split_every(body, size))
+        assert [value for _, value, _ in records] == events
+        assert all(error is None for _, _, error in records)
+
+def test_json_array_syntax_error_stops_parsing():
+    records = parse([b'[{"user_id": 1, "ad_id": 1, "activity_type": "view"} {"user_id": 2}]'])
+    assert records[0][2] is None
+    assert records[1][0] == 1 and "expected" in records[1][2]
+    assert parse([b"[]"]) == []
+    assert parse([b'[{"a": 1}'])[-1][2] == "unterminated JSON array"
+
+def test_load_activity_stream_writes_chunks_and_reports_errors(TestingSessionLocal, AsyncTestingSessionLocal, db, test_user, test_ad):
+    lines = [
+        json.dumps({"user_id": test_user.id, "ad_id": test_ad.id, "activity_type": "view"})
+        for _ in range(5)
+    ]
+    lines.insert(2, json.dumps({"user_id": "nobody", "ad_id": test_ad.id, "activity_type": "view"}))
+    body = "\n".join(lines).encode()
+
+    async def stream():
+        for chunk in split_every(body, 16):
+            yield chunk
+
+    async def load():
+        async with AsyncTestingSessionLocal() as session:
+            return await load_activity_stream(stream(), session, ingestor, chunk_size=2)
+
+    ingestor = ActivityIngestor(session_factory=TestingSessionLocal)
+    report = asyncio.run(load())
+
+    assert report["accepted"] == 5
+    assert report["rejected"] == 1
+    assert report["errors"][0]["line"] == 3
+    assert "user_id" in report["errors"][0]["error"]
+    assert db.query(UserActivity).count() == 5
+    assert ingestor.metrics()["batches"] == 3
@@ -0,0 +1,51 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app.db.models.ads import UserActivity
+from app.services.user_service import UserService, decode_cursor, encode_cursor
+
+def add_history(db, user_id, ad_id, timestamps):
+    db.execute(insert(UserActivity), [
+        {"user_id": user_id, "ad_id": ad_id, "activity_type": "view", "timestamp": timestamp}
+        for timestamp in timestamps
+    ])
+    db.commit()
+
+def test_pages_cover_history_once_newest_first(db, test_user, test_ad):
+    start = datetime(2024, 1, 1)
+    # Duplicate timestamps force the id tie-break across a page boundary
+    stamps = [start + timedelta(hours=hour // 2) for hour in range(25)]
+    add_history(db, test_user.id, test_ad.id, stamps)
+
+    service = UserService()
+    seen, cursor = [], None
+    while True:
+        page, cursor = service.get_activity_history(db, test_user.id, limit=4, cursor=cursor)
+        assert len(page) <= 4
+        seen.extend(page)
+        if cursor is None:
+            break
+
+    assert len(seen) == 25
+    assert len({row["id"] for row in seen}) == 25
+    keys = [(row["timestamp"], row["id"]) for row in seen]
+    assert keys == sorted(keys, reverse=True)
+
+def test_time_window_and_export_iterator(db, test_user, test_ad):
+    start = datetime(2024, 1, 1)
+    add_history(db, test_user.id, test_ad.id, [start + timedelta(days=day) for day in range(10)])
+
+    service = UserService()
+    since, until = start + timedelta(days=2), start + timedelta(days=5)
+    page, cursor = service.get_activity_history(db, test_user.id, since=since, until=until)
+    assert [row["timestamp"] for row in page] == [start + timedelta(days=day) for day in (4, 3, 2)]
+    assert cursor is None
+
+    exported = list(service.iter_activity_history(db, test_user.id, page_size=3))
+    assert [row["timestamp"] for row in exported] == [start + timedelta(days=day) for day in range(9, -1, -1)]
+
+def test_cursor_round_trip_and_rejects_garbage():
+    timestamp = datetime(2024, 1, 1, 12, 30, 0, 123456)
+    assert decode_cursor(encode_cursor(timestamp, 42)) == (timestamp, 42)
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
@@ -0,0 +1,117 @@
+import asyncio
+from datetime import datetime
+from sqlalchemy import event
+from app.db.models.ads import UserActivity
+from app.core.recommendation.cache import recommendation_cache
+from app.services.activity_ingest import ActivityIngestor, activity_ingestor
+import app.services.ads_service  # registers the cache invalidation listener
+
+def make_event(user_id, ad_id, activity_type="view"):
+    return {"user_id": user_id, "ad_id": ad_id, "activity_type": activity_type}
+
+def test_flush_group_commits_queued_events(TestingSessionLocal, db, test_user, test_ad):
+    ingestor = ActivityIngestor(session_factory=TestingSessionLocal, batch_size=3)
+    for activity_type in ["view", "click", "save", "purchase"]:
+        ingestor._queue.put(make_event(test_user.id, test_ad.id, activity_type))
+
+    assert ingestor.flush() == 3
+    assert ingestor.flush() == 1
+    assert ingestor.flush() == 0
+    assert db.query(UserActivity).count() == 4
+
+    metrics = ingestor.metrics()
+    assert metrics["written"] == 4
+    assert metrics["batches"] == 2
+    assert metrics["queue_depth"] == 0
+
+def test_submit_stamps_acceptance_time_and_drains_on_shutdown(TestingSessionLocal, db, test_user, test_ad):
+    ingestor = ActivityIngestor(session_factory=TestingSessionLocal, flush_interval=0.01)
+    before = datetime.utcnow()
+    for _ in range(10):
+        assert ingestor.submit(make_event(test_user.id, test_ad.id))
+    ingestor.shutdown()
+
+    activities = db.query(UserActivity).all()
+    assert len(activities) == 10
+    assert all(activity.timestamp >= before for activity in activities)
+    assert ingestor.metrics()["enqueued"] == 10
+
+def test_full_queue_rejects_events(TestingSessionLocal):
+    ingestor = ActivityIngestor(session_factory=TestingSessionLocal, max_queue=2, enqueue_timeout=0)
+    # Not started: nothing drains the queue
+    ingestor.ensure_started = lambda: None
+
+    assert ingestor.submit(make_event(1, 1))
+    assert ingestor.submit(make_event(1, 2))
+    assert not ingestor.submit(make_event(1, 3))
+
+    metrics = ingestor.metrics()
+    assert metrics["rejected"] == 1
+    assert metrics["max_queue_depth"] == 2
+
+def test_submit_async_waits_for_room_without_blocking(TestingSessionLocal):
+    ingestor = ActivityIngestor(session_factory=TestingSessionLocal, max_queue=1, enqueue_timeout=0.5)
+    ingestor.ensure_started = lambda: None
+
+    async def scenario():
+        assert await ingestor.submit_async(make_event(1, 1))
+        waiting = asyncio.ensure_future(ingestor.submit_async(make_event(1, 2)))
+        await asyncio.sleep(0.02)
+        # The loop kept running while the submit waited; free a slot
+        assert not waiting.done()
+        ingestor._queue.get_nowait()
+        return await waiting
+
+    assert asyncio.run(scenario())
+    ingestor.enqueue_timeout = 0.01
+    assert not asyncio.run(ingestor.submit_async(make_event(1, 3)))
+    assert ingestor.metrics()["enqueued"] == 2
+    assert ingestor.metrics()["rejected"] == 1
+
+def test_listeners_see_committed_batches(TestingSessionLocal, test_user, test_ad):
+    ingestor = ActivityIngestor(session_factory=TestingSessionLocal)
+    seen = []
+    ingestor.add_listener(lambda rows: seen.append([row["ad_id"] for row in rows]))
+    ingestor._queue.put(make_event(test_user.id, test_ad.id))
+
+    ingestor.flush()
+    assert seen == [[test_ad.id]]
+
+def test_failed_batch_is_counted():
+    def unavailable():
+        raise RuntimeError("database unavailable")
+
+    ingestor = ActivityIngestor(session_factory=unavailable)
+    ingestor._queue.put(make_event(1, 1))
+
+    assert ingestor.flush() == 0
+    assert ingestor.metrics()["failed"] == 1
+
+def test_recorded_activity_invalidates_cached_recommendations(TestingSessionLocal, test_user, test_ad):
+    recommendation_cache.put((test_user.id, 10, 1), [(test_ad.id, 0.5)])
+    activity_ingestor.notify([make_event(test_user.id, test_ad.id)])
+    assert recommendation_cache.get((test_user.id, 10, 1)) is None
+
+def test_event_breaking_a_constraint_does_not_drop_its_batch(engine, TestingSessionLocal, db, test_user, test_ad):
+    # SQLite only enforces foreign keys when asked to, as PostgreSQL always does
+    event.listen(engine, "connect", lambda connection, _: connection.execute("PRAGMA foreign_keys=ON"))
+    engine.dispose()
+    ingestor = ActivityIngestor(session_factory=TestingSessionLocal, batch_size=10)
+    for ad_id in [test_ad.id, test_ad.id, 999, test_ad.id, test_ad.id]:
+        ingestor._queue.put(make_event(test_user.id, ad_id))
+
+    assert ingestor.flush() == 4
+    assert db.query(UserActivity).filter(UserActivity.ad_id == test_ad.id).count() == 4
+    metrics = ingestor.metrics()
+    assert metrics["written"] == 4 and metrics["failed"] == 1
+
+def test_shutdown_writes_batches_queued_behind_a_rejected_one(engine, TestingSessionLocal, db, test_user, test_ad):
+    event.listen(engine, "connect", lambda connection, _: connection.execute("PRAGMA foreign_keys=ON"))
+    engine.dispose()
+    ingestor = ActivityIngestor(session_factory=TestingSessionLocal, batch_size=2)
+    for ad_id in [999, 999, test_ad.id, test_ad.id]:
+        ingestor._queue.put(make_event(test_user.id, ad_id))
+
+    ingestor.shutdown()
+    assert db.query(UserActivity).filter(UserActivity.ad_id == test_ad.id).count() == 2
+    assert ingestor.metrics()["failed"] == 2
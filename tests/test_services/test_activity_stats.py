@@ -0,0 +1,70 @@
+import math
+import numpy as np
+import pytest
+from datetime import datetime, timedelta
+from app.core.recommendation.features import FeatureExtractor
+from app.db.models.ads import Ad, UserActivity
+from app.db.models.user_activity_stats import UserActivityStats
+from app.services.activity_ingest import ActivityIngestor
+from app.services.activity_stats import ActivityStatsStore
+
+def event(user_id, ad_id, activity_type, timestamp):
+    return {"user_id": user_id, "ad_id": ad_id, "activity_type": activity_type, "timestamp": timestamp}
+
+def test_ingested_batches_are_folded_into_stats(TestingSessionLocal, db, test_user, test_ad):
+    now = datetime(2024, 5, 1, 12)
+    ingestor = ActivityIngestor(session_factory=TestingSessionLocal, batch_size=2)
+    for activity_type, days in [("view", 3), ("purchase", 2), ("click", 1), ("share", 0), ("purchase", 10)]:
+        ingestor._queue.put(event(test_user.id, test_ad.id, activity_type, now - timedelta(days=days)))
+    while ingestor.flush():
+        pass
+
+    stats = ActivityStatsStore().get(db, test_user.id, current_time=now)
+    assert (stats["view_count"], stats["click_count"], stats["purchase_count"], stats["other_count"]) == (1, 1, 2, 1)
+    assert stats["total_count"] == 5
+    assert stats["total_spent"] == pytest.approx(2 * test_ad.price)
+    assert stats["first_activity_at"] == now - timedelta(days=10)
+    assert stats["last_activity_at"] == now
+
+    weights = FeatureExtractor().activity_weights
+    expected = sum(
+        weights.get(activity_type, 0.1) * math.exp(-days / 30)
+        for activity_type, days in [("view", 3), ("purchase", 2), ("click", 1), ("share", 0), ("purchase", 10)]
+    )
+    assert stats["engagement"] == pytest.approx(expected)
+
+def test_engagement_decays_lazily_at_read_time(db, test_user, test_ad):
+    store = ActivityStatsStore()
+    now = datetime(2024, 5, 1)
+    store.apply(db, [event(test_user.id, test_ad.id, "purchase", now)])
+    db.commit()
+
+    today = store.get(db, test_user.id, current_time=now)["engagement"]
+    later = store.get(db, test_user.id, current_time=now + timedelta(days=30))["engagement"]
+    assert today == pytest.approx(1.0)
+    assert later == pytest.approx(math.exp(-1))
+
+def test_rebuild_matches_incremental_updates_and_features(db, test_user, test_ad):
+    store = ActivityStatsStore()
+    now = datetime(2024, 5, 1)
+    rows = [
+        event(test_user.id, test_ad.id, activity_type, now - timedelta(hours=hours))
+        for activity_type, hours in [("view", 50), ("purchase", 20), ("save", 1), ("view", 0)]
+    ]
+    for row in rows:
+        db.add(UserActivity(**row))
+        store.apply(db, [row])
+    db.commit()
+    incremental = store.get(db, test_user.id, current_time=now)
+
+    assert store.rebuild(db, chunk_size=3) == 4
+    assert db.query(UserActivityStats).count() == 1
+    rebuilt = store.get(db, test_user.id, current_time=now)
+    assert rebuilt.pop("engagement") == pytest.approx(incremental.pop("engagement"))
+    assert rebuilt == incremental
+
+    users, features = FeatureExtractor().load_user_features(db)
+    np.testing.assert_allclose(store.user_features(db, [test_user.id, 999]), [features[0], np.zeros(features.shape[1])])
+
+def test_missing_user_has_no_stats(db):
+    assert ActivityStatsStore().get(db, 12345) is None
@@ -0,0 +1,140 @@
+import json
+import numpy as np
+from sqlalchemy import event
+from app.core.recommendation.cache import RecommendationCache
+from app.core.recommendation.catalog import AdCatalog
+from app.core.recommendation.snapshot import ModelRegistry, ModelSnapshot
+from app.core.schemas.users import UserPreferences
+from app.db.models.ads import Ad
+from app.services.activity_stats import activity_stats
+from app.services.ads_service import AdsService
+from app.services.preferences import PreferenceCache
+
+def add_ads(db, count):
+    ads = [
+        Ad(title=f"Ad {i}", description="d", image_url="u", category="test", price=float(i))
+        for i in range(count)
+    ]
+    db.add_all(ads)
+    db.commit()
+    return [ad.id for ad in ads]
+
+def count_queries(engine):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+def test_recommendations_keep_score_order_with_one_ad_query(engine, db, test_user):
+    ad_ids = add_ads(db, 3)
+    registry = ModelRegistry()
+    registry.publish(ModelSnapshot(
+        version=1,
+        user_ids=[test_user.id],
+        user_embeddings=np.array([[1.0, 0.0]]),
+        item_ids=ad_ids,
+        item_embeddings=np.array([[0.0, 1.0], [1.0, 0.0], [0.7, 0.7]])
+    ))
+    service = AdsService(
+        registry=registry, refresher=None, catalog=AdCatalog(), cache=None,
+        preferences=None, similarity_threshold=0.0
+    )
+
+    service.catalog.get(db)
+
+    statements = count_queries(engine)
+    recommendations = service.get_recommendations(db, test_user.id, limit=3)
+
+    assert [r.ad.id for r in recommendations] == [ad_ids[1], ad_ids[2], ad_ids[0]]
+    assert recommendations[0].score > recommendations[1].score > recommendations[2].score
+    # One IN query for the ads, besides the precomputed-list and re-ranker stats lookups
+    ad_statements = [statement for statement in statements if "FROM ads" in statement]
+    assert len(ad_statements) == 1
+    assert "embedding" not in ad_statements[0]
+    assert len(statements) == 3
+
+def test_recommendations_without_model_take_ids_from_catalog(engine, db):
+    ad_ids = add_ads(db, 5)
+    service = AdsService(registry=ModelRegistry(), refresher=None, catalog=AdCatalog(), preferences=None)
+    service.catalog.get(db)
+
+    statements = count_queries(engine)
+    recommendations = service.get_recommendations(db, user_id=1, limit=2)
+
+    assert [r.ad.id for r in recommendations] == ad_ids[:2]
+    assert all(r.score == 0.0 for r in recommendations)
+    # Ids come from the catalog cache; only the hydrating query hits the database
+    assert len(statements) == 1
+
+def test_cached_ranking_is_reused_until_the_user_has_new_activity(db, test_user):
+    ad_ids = add_ads(db, 2)
+    registry = ModelRegistry()
+    registry.publish(ModelSnapshot(
+        version=1,
+        user_ids=[test_user.id],
+        user_embeddings=np.array([[1.0, 0.0]]),
+        item_ids=ad_ids,
+        item_embeddings=np.array([[0.0, 1.0], [1.0, 0.0]])
+    ))
+    cache = RecommendationCache(max_bytes=10_000, ttl=60)
+    service = AdsService(registry=registry, refresher=None, catalog=AdCatalog(), cache=cache)
+
+    first = service.get_recommendations(db, test_user.id, limit=2)
+    second = service.get_recommendations(db, test_user.id, limit=2)
+    assert [r.ad.id for r in first] == [r.ad.id for r in second]
+    assert cache.stats()["hits"] == 1
+
+    cache.invalidate_users([test_user.id])
+    service.get_recommendations(db, test_user.id, limit=2)
+    assert cache.stats()["misses"] == 2
+
+def test_activity_written_by_another_worker_bypasses_the_cached_ranking(db, test_user):
+    ad_ids = add_ads(db, 2)
+    registry = ModelRegistry()
+    registry.publish(ModelSnapshot(
+        version=1,
+        user_ids=[test_user.id],
+        user_embeddings=np.array([[1.0, 0.0]]),
+        item_ids=ad_ids,
+        item_embeddings=np.array([[0.0, 1.0], [1.0, 0.0]])
+    ))
+    cache = RecommendationCache(max_bytes=10_000, ttl=60)
+    service = AdsService(registry=registry, refresher=None, catalog=AdCatalog(), cache=cache)
+    service.get_recommendations(db, test_user.id, limit=2)
+
+    # No invalidation reaches this process; only the stored counts change
+    activity_stats.apply(db, [{"user_id": test_user.id, "ad_id": ad_ids[0], "activity_type": "click"}])
+    db.commit()
+    service.get_recommendations(db, test_user.id, limit=2)
+    assert cache.stats()["stale"] == 1
+    service.get_recommendations(db, test_user.id, limit=2)
+    assert cache.stats()["hits"] == 1
+
+def test_preferences_filter_candidates_and_threshold_cuts_weak_matches(db, test_user):
+    ads = [
+        Ad(title="a", description="d", image_url="u", category="sports", price=10.0),
+        Ad(title="b", description="d", image_url="u", category="books", price=10.0),
+        Ad(title="c", description="d", image_url="u", category="sports", price=90.0),
+        Ad(title="d", description="d", image_url="u", category="sports", price=15.0),
+    ]
+    db.add_all(ads)
+    test_user.preferences = json.dumps(UserPreferences(
+        categories=["sports"], price_range={"min": 0, "max": 50.0}
+    ).model_dump())
+    db.commit()
+    registry = ModelRegistry()
+    registry.publish(ModelSnapshot(
+        version=1,
+        user_ids=[test_user.id],
+        user_embeddings=np.array([[1.0, 0.0]]),
+        item_ids=[ad.id for ad in ads],
+        # The books ad is the best match, but the user only wants sports under 50
+        item_embeddings=np.array([[0.8, 0.6], [1.0, 0.0], [1.0, 0.0], [0.1, 1.0]])
+    ))
+    service = AdsService(
+        registry=registry, refresher=None, catalog=AdCatalog(), cache=None,
+        preferences=PreferenceCache(), similarity_threshold=0.5
+    )
+
+    recommendations = service.get_recommendations(db, test_user.id, limit=10)
+    assert [r.ad.id for r in recommendations] == [ads[0].id]
+    assert recommendations[0].score > 0.5
@@ -0,0 +1,56 @@
+import json
+from sqlalchemy import event
+from app.core.schemas.users import UserPreferences
+from app.services.preferences import CandidateFilter, PreferenceCache, preference_cache
+from app.services.user_service import UserService
+
+def test_default_preferences_do_not_filter():
+    assert CandidateFilter.from_preferences(UserPreferences()) is None
+
+    candidate_filter = CandidateFilter.from_preferences(UserPreferences(
+        categories=["sports", "books", "sports"],
+        price_range={"min": 0, "max": 25.0}
+    ))
+    assert candidate_filter.categories == ("books", "sports")
+    assert candidate_filter.min_price is None
+    assert candidate_filter.max_price == 25.0
+
+def test_preferences_are_parsed_once_until_updated(engine, db, test_user):
+    test_user.preferences = json.dumps(UserPreferences(categories=["sports"]).model_dump())
+    db.commit()
+    user_id = test_user.id
+    cache = PreferenceCache()
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    assert cache.get(db, user_id).categories == ("sports",)
+    assert cache.get(db, user_id).categories == ("sports",)
+    assert len(statements) == 1
+
+    cache.invalidate(user_id)
+    assert cache.get(db, user_id) is not None
+    assert len(statements) == 2
+
+def test_update_preferences_invalidates_the_shared_cache(db, test_user):
+    assert preference_cache.get(db, test_user.id) is None
+
+    UserService().update_preferences(db, test_user.id, UserPreferences(categories=["books"]))
+    assert preference_cache.get(db, test_user.id).categories == ("books",)
+
+def test_changes_made_by_another_worker_show_once_the_entry_expires(db, test_user):
+    now = [0.0]
+    cache = PreferenceCache(ttl=10, clock=lambda: now[0])
+    assert cache.get(db, test_user.id) is None
+
+    # Written through another process: this cache is never invalidated
+    test_user.preferences = json.dumps(UserPreferences(categories=["books"]).model_dump())
+    db.commit()
+    now[0] = 9.0
+    assert cache.get(db, test_user.id) is None
+    now[0] = 10.5
+    assert cache.get(db, test_user.id).categories == ("books",)
+
+def test_unreadable_preferences_are_ignored(db, test_user):
+    test_user.preferences = "{not json"
+    db.commit()
+    assert PreferenceCache().get(db, test_user.id) is None